@@ -0,0 +1,141 @@
+import os
+import csv
+import json
+import sys
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from modules.normalization import normalize_name
+from modules.async_runtime import submit as submit_coroutine
+
+# Screening in blocco: i soggetti arrivano come flusso JSONL o CSV (colonne nome,cognome),
+# vengono deduplicati dopo la normalizzazione del nome ed elaborati con concorrenza limitata.
+# I risultati sono restituiti man mano che i soggetti terminano, senza accumularli in memoria.
+# In modalità "async" ogni soggetto è una coroutine sull'event loop condiviso (modules/async_runtime.py):
+# un soggetto in attesa dei provider non occupa un thread, quindi la concorrenza può essere molto più alta.
+
+BATCH_MODES = ("async", "thread")
+BATCH_MODE = os.getenv("BATCH_MODE", "async")
+BATCH_MAX_CONCURRENCY = 4  # Modalità "thread": un thread per soggetto in elaborazione
+BATCH_ASYNC_MAX_CONCURRENCY = int(os.getenv("BATCH_ASYNC_MAX_CONCURRENCY", "200"))
+BATCH_FLUSH_ROWS = 500  # Righe di risultato accumulate prima di una scrittura in blocco
+
+
+def iter_subjects(lines, fmt="jsonl"):
+    """Legge i soggetti da un iterabile di righe di testo. Restituisce dizionari con almeno 'nome' e 'cognome'."""
+    if fmt == "csv":
+        for row in csv.DictReader(lines):
+            yield {key.strip().lower(): (value or "").strip() for key, value in row.items() if key}
+    else:
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                subject = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield {"_errore": f"Riga JSON non valida: {e}", "_riga": line[:200]}
+                continue
+            yield subject if isinstance(subject, dict) else {"_errore": "La riga non è un oggetto JSON", "_riga": line[:200]}
+
+
+def run_batch(subjects, screen_subject, write_rows, max_concurrency=BATCH_MAX_CONCURRENCY, flush_rows=BATCH_FLUSH_ROWS,
+              screen_subject_async=None):
+    """
+    Elabora i soggetti con al più 'max_concurrency' pipeline in parallelo.
+    'screen_subject(nome, cognome)' restituisce (riepilogo, righe); 'write_rows(righe)' le salva in blocco.
+    Se è indicata la coroutine 'screen_subject_async' (stessa firma e risultato) i soggetti sono elaborati
+    sull'event loop condiviso invece che in un pool di thread.
+    Generatore: produce un record per soggetto al termine della sua elaborazione e un riepilogo finale.
+    """
+    max_concurrency = max(1, max_concurrency)
+    stats = {"ricevuti": 0, "duplicati": 0, "non_validi": 0, "elaborati": 0, "errori": 0, "righe_salvate": 0}
+    seen_keys = set()
+    pending_rows = []
+    in_flight = {}
+
+    def collect(done):
+        for future in done:
+            subject, key = in_flight.pop(future)
+            record = {"nome": subject["nome"], "cognome": subject["cognome"], "subject_key": key}
+            try:
+                summary, rows = future.result()
+                pending_rows.extend(rows)
+                record.update(status="successo", **summary)
+                stats["elaborati"] += 1
+            except Exception as e:
+                record.update(status="errore", message=str(e))
+                stats["errori"] += 1
+            yield record
+        if len(pending_rows) >= flush_rows:
+            stats["righe_salvate"] += write_rows(pending_rows)
+            pending_rows.clear()
+
+    with ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="osint-batch") as executor:
+        for subject in subjects:
+            stats["ricevuti"] += 1
+            nome = str(subject.get("nome") or "").strip()
+            cognome = str(subject.get("cognome") or "").strip()
+            if not nome or not cognome:
+                stats["non_validi"] += 1
+                yield {"status": "errore", "message": subject.get("_errore", "Nome e cognome sono richiesti"), "input": subject}
+                continue
+
+            key = normalize_name(nome, cognome)
+            if key in seen_keys:
+                stats["duplicati"] += 1
+                continue
+            seen_keys.add(key)
+
+            # Non si accodano più di max_concurrency soggetti: il resto del flusso resta da leggere
+            if len(in_flight) >= max_concurrency:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                yield from collect(done)
+            if screen_subject_async is not None:
+                future = submit_coroutine(screen_subject_async(nome, cognome))
+            else:
+                future = executor.submit(screen_subject, nome, cognome)
+            in_flight[future] = ({"nome": nome, "cognome": cognome}, key)
+
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            yield from collect(done)
+
+    if pending_rows:
+        stats["righe_salvate"] += write_rows(pending_rows)
+    yield {"status": "riepilogo", **stats}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Screening OSINT in blocco da file JSONL o CSV")
+    parser.add_argument("input", help="File di input ('-' per stdin)")
+    parser.add_argument("--format", choices=["jsonl", "csv"], default=None, help="Formato (default: dedotto dall'estensione)")
+    parser.add_argument("--output", default="-", help="File JSONL dei risultati ('-' per stdout)")
+    parser.add_argument("--mode", choices=BATCH_MODES, default=BATCH_MODE,
+                        help="async: soggetti sull'event loop condiviso; thread: un thread per soggetto")
+    parser.add_argument("--concurrency", type=int, default=None,
+                        help=f"Soggetti in parallelo (default: {BATCH_ASYNC_MAX_CONCURRENCY} in async, {BATCH_MAX_CONCURRENCY} in thread)")
+    args = parser.parse_args()
+    if args.concurrency is not None and args.concurrency < 1:
+        parser.error("--concurrency deve essere maggiore di zero")
+
+    # Import ritardato: il receiver carica la configurazione e il modulo M1
+    from receiver import init_db, screen_subject, screen_subject_async, save_results_bulk, log_audit_event
+
+    fmt = args.format or ("csv" if args.input.lower().endswith(".csv") else "jsonl")
+    init_db()
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8", newline="")
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        concurrency = args.concurrency or (BATCH_ASYNC_MAX_CONCURRENCY if args.mode == "async" else BATCH_MAX_CONCURRENCY)
+        log_audit_event(event_type="AVVIO_BATCH", source_module="batch.py",
+                        query_details={"input": args.input, "format": fmt, "mode": args.mode, "concurrency": concurrency})
+        for record in run_batch(iter_subjects(source, fmt), screen_subject, save_results_bulk, max_concurrency=concurrency,
+                                screen_subject_async=screen_subject_async if args.mode == "async" else None):
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()
+        log_audit_event(event_type="COMPLETAMENTO_BATCH", source_module="batch.py", result_summary=json.dumps(record))
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
@@ -0,0 +1,230 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import functools
+import subprocess
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+# Benchmark di POST /process_osint_data contro server locali (bench/stub_servers.py) al posto di
+# Sanctions.network e Google. Misura latenza (p50/p95/p99), richieste al secondo, throughput di
+# scrittura su SQLite e tempi per fase a diversi livelli di concorrenza; il risultato è JSON,
+# così da poter confrontare due commit:
+#
+#   python bench/run_benchmark.py --concurrency 1,4,16 --requests 50 --output bench_output.json
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from bench.stub_servers import StubConfig, start_stub_server  # noqa: E402
+
+
+def percentile(values, pct):
+    """Percentile con il metodo nearest-rank (values già ordinati)."""
+    if not values:
+        return None
+    index = max(int(round(pct / 100.0 * len(values) + 0.5)) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+def summarize_ms(samples):
+    ordered = sorted(samples)
+    if not ordered:
+        return {"count": 0}
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2),
+        "p50_ms": round(percentile(ordered, 50) * 1000, 2),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 2),
+    }
+
+
+class StageTimer:
+    """Raccoglie le durate delle funzioni strumentate, per nome di fase."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.rows_written = 0
+        self.lock = threading.Lock()
+
+    def record(self, name, elapsed, rows=0):
+        with self.lock:
+            self.samples[name].append(elapsed)
+            self.rows_written += rows
+
+    def wrap(self, name, func, count_rows=None):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter() - start, count_rows(*args) if count_rows else 0)
+        return wrapper
+
+    def wrap_async(self, name, func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter() - start)
+        return wrapper
+
+    def reset(self):
+        with self.lock:
+            self.samples = defaultdict(list)
+            self.rows_written = 0
+
+
+def instrument(timer):
+    """Strumenta le fasi della pipeline. Va chiamata prima di importare il receiver."""
+    import storage
+    storage.log_audit_event = timer.wrap("log_audit_event", storage.log_audit_event)
+    storage.save_result = timer.wrap("save_result", storage.save_result)
+    storage._flush_batch = timer.wrap(
+        "sqlite_flush", storage._flush_batch, count_rows=lambda batch: len(batch["audit"]) + len(batch["results"])
+    )
+
+    from modules import m1_anagrafica
+    stage_names = {"sanctions_network": "search_opensanctions", "google_dorks_anagrafica": "search_google_dorks_anagrafica"}
+    for key, spec in m1_anagrafica.M1_SOURCES.items():
+        spec["func"] = timer.wrap(stage_names.get(key, key), spec["func"])
+        if spec.get("async_func"):
+            spec["async_func"] = timer.wrap_async(stage_names.get(key, key), spec["async_func"])
+
+
+def run_level(base_url, concurrency, total_requests, timer, level_index):
+    import requests
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one_request(i):
+        nonlocal errors
+        payload = {"nome": f"Nome{level_index}x{i}", "cognome": f"Cognome{i}"}  # Soggetti distinti: niente cache né dedup
+        start = time.perf_counter()
+        try:
+            ok = session.post(f"{base_url}/process_osint_data", json=payload, timeout=300).status_code == 200
+        except requests.exceptions.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                errors += 1
+
+    timer.reset()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one_request, range(total_requests)))
+    duration = time.perf_counter() - start
+
+    flush_time = sum(timer.samples.get("sqlite_flush", []))
+    return {
+        "concurrency": concurrency,
+        "requests": total_requests,
+        "errors": errors,
+        "duration_s": round(duration, 3),
+        "requests_per_s": round(total_requests / duration, 2) if duration else None,
+        "latency": summarize_ms(latencies),
+        "sqlite": {
+            "rows_written": timer.rows_written,
+            "write_time_s": round(flush_time, 4),
+            "rows_per_s": round(timer.rows_written / flush_time, 1) if flush_time else None,
+        },
+        "stages": {name: summarize_ms(samples) for name, samples in sorted(timer.samples.items())},
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark della pipeline OSINT con provider locali")
+    parser.add_argument("--concurrency", default="1,4,16", help="Livelli di concorrenza, separati da virgole")
+    parser.add_argument("--requests", type=int, default=40, help="Richieste per livello")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Latenza media dei server stub")
+    parser.add_argument("--jitter-ms", type=float, default=10)
+    parser.add_argument("--sanctions-error-rate", type=float, default=0.0)
+    parser.add_argument("--search-error-rate", type=float, default=0.0)
+    parser.add_argument("--dork-rate-per-minute", type=float, default=600000, help="Budget del dork scheduler")
+    parser.add_argument("--output", default="-", help="File JSON dei risultati ('-' per stdout)")
+    args = parser.parse_args()
+
+    sanctions_config = StubConfig(args.latency_ms, args.jitter_ms, args.sanctions_error_rate)
+    search_config = StubConfig(args.latency_ms, args.jitter_ms, args.search_error_rate)
+    _, sanctions_url = start_stub_server("sanctions", sanctions_config)
+    _, search_url = start_stub_server("search", search_config)
+
+    workdir = tempfile.mkdtemp(prefix="osint-bench-")
+    # La configurazione viene letta all'import dei moduli: va impostata prima
+    os.environ.update({
+        "SANCTIONS_API_URL": sanctions_url,
+        "DORK_SEARCH_URL": search_url,
+        "OSINT_DB_PATH": os.path.join(workdir, "bench.db"),
+        "CACHE_ENABLED": "0",
+        "DORK_RATE_PER_MINUTE": str(args.dork_rate_per_minute),
+        "DORK_BURST": "50",
+        "DORK_WORKERS": "16",
+        "DORK_BACKOFF_BASE": "1",
+        "HTTP_BACKOFF_BASE": "0.05",
+    })
+    os.environ.setdefault("LOG_LEVEL", "WARNING")  # Il logging per richiesta falserebbe le misure
+
+    timer = StageTimer()
+    instrument(timer)
+    import receiver
+    from werkzeug.serving import make_server
+
+    receiver.init_db()
+    server = make_server("127.0.0.1", 0, receiver.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="bench-flask", daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    levels = []
+    for index, concurrency in enumerate(int(c) for c in args.concurrency.split(",") if c.strip()):
+        print(f"[Bench] Concorrenza {concurrency}: {args.requests} richieste...", file=sys.stderr)
+        levels.append(run_level(base_url, concurrency, args.requests, timer, index))
+    server.shutdown()
+
+    report = {
+        "revision": _git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "latency_ms": args.latency_ms,
+            "jitter_ms": args.jitter_ms,
+            "sanctions_error_rate": args.sanctions_error_rate,
+            "search_error_rate": args.search_error_rate,
+            "dork_rate_per_minute": args.dork_rate_per_minute,
+        },
+        "stub_requests": {
+            "sanctions": {"requests": sanctions_config.requests, "errors": sanctions_config.errors},
+            "search": {"requests": search_config.requests, "errors": search_config.errors},
+        },
+        "levels": levels,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output == "-":
+        print(output)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+
+
+if __name__ == '__main__':
+    main()
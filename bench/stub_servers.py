@@ -0,0 +1,114 @@
+import json
+import time
+import random
+import threading
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# Server locali che sostituiscono Sanctions.network e la ricerca Google durante i benchmark.
+# Latenza (media e jitter) e tasso di errore sono configurabili; gli errori sono risposte 503
+# per il server sanzioni e 429 per quello di ricerca, come farebbero i servizi reali sotto carico.
+
+
+class StubConfig:
+    def __init__(self, latency_ms=50.0, jitter_ms=10.0, error_rate=0.0, results=3):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.results = results
+        self.requests = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def simulate(self):
+        """Attende la latenza simulata. Restituisce True se la richiesta deve fallire."""
+        delay = max(random.gauss(self.latency_ms, self.jitter_ms), 0) / 1000.0
+        time.sleep(delay)
+        failed = random.random() < self.error_rate
+        with self.lock:
+            self.requests += 1
+            if failed:
+                self.errors += 1
+        return failed
+
+
+def _make_handler(config, error_status, build_body):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # Keep-alive, come i servizi reali
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            params = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+            if config.simulate():
+                self.send_response(error_status)
+                self.send_header("Retry-After", "1")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            body = json.dumps(build_body(params, config)).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+def _sanctions_body(params, config):
+    name = params.get("name", "Sconosciuto")
+    return [
+        {
+            "id": f"stub-{abs(hash(name)) % 100000}-{i}",
+            "names": [name if i == 0 else f"{name} {i}"],
+            "type": "individual",
+            "source": random.choice(["ofac", "eu", "unsc"]),
+            "birth_date": "1970-01-01",
+            "nationality": "it",
+            "aliases": [],
+            "score": round(random.uniform(0.3, 1.0), 3),
+        }
+        for i in range(config.results)
+    ]
+
+
+def _search_body(params, config):
+    count = min(int(params.get("num", config.results)), config.results)
+    slug = abs(hash(params.get("q", ""))) % 100000
+    return [f"https://example.org/{slug}/{i}" for i in range(count)]
+
+
+def start_stub_server(kind, config, host="127.0.0.1", port=0):
+    """Avvia in un thread il server 'sanctions' o 'search'. Restituisce (server, url base)."""
+    if kind == "sanctions":
+        handler = _make_handler(config, 503, _sanctions_body)
+        path = "/rpc/search_sanctions"
+    else:
+        handler = _make_handler(config, 429, _search_body)
+        path = "/search"
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name=f"stub-{kind}", daemon=True).start()
+    return server, f"http://{host}:{server.server_port}{path}"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Server locali sostitutivi di Sanctions.network e della ricerca Google")
+    parser.add_argument("--sanctions-port", type=int, default=8101)
+    parser.add_argument("--search-port", type=int, default=8102)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=10)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    _, sanctions_url = start_stub_server("sanctions", StubConfig(args.latency_ms, args.jitter_ms, args.error_rate), port=args.sanctions_port)
+    _, search_url = start_stub_server("search", StubConfig(args.latency_ms, args.jitter_ms, args.error_rate), port=args.search_port)
+    print(f"SANCTIONS_API_URL={sanctions_url}")
+    print(f"DORK_SEARCH_URL={search_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
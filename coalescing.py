@@ -0,0 +1,58 @@
+import threading
+from telemetry import counter
+
+# Accorpamento delle richieste identiche concorrenti (single-flight): la prima richiesta per una chiave
+# esegue il calcolo, quelle che arrivano mentre è in corso ne attendono e condividono il risultato
+# invece di ripetere le stesse chiamate esterne.
+
+COALESCED_REQUESTS = counter("osint_coalesced_requests_total", "Richieste servite senza rieseguire la pipeline", ("kind",))
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, name="singleflight"):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        """
+        Esegue func() una sola volta per tutte le chiamate concorrenti con la stessa chiave.
+        Restituisce (risultato, condiviso): condiviso è True per chi ha atteso il calcolo di un'altra chiamata.
+        Il risultato è lo stesso oggetto per tutti i chiamanti e va trattato in sola lettura.
+        Le eccezioni di func() vengono rilanciate a tutti i chiamanti.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            COALESCED_REQUESTS.inc(kind=self.name)
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            # La chiave viene liberata prima di svegliare chi attende: le richieste successive ricalcolano
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,330 @@
+import json
+import uuid
+import socket
+import datetime
+import ipaddress
+import os
+import logging
+import threading
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor, wait
+import requests
+from storage import get_connection, transaction
+from telemetry import counter, gauge, trace
+
+# Numero massimo di pipeline OSINT eseguite in parallelo dal pool di worker
+JOB_MAX_WORKERS = int(os.getenv("JOB_MAX_WORKERS", "4"))
+CALLBACK_TIMEOUT = 10  # Secondi di attesa per la notifica al callback_url
+# Destinazioni ammesse per callback_url (protezione da SSRF), separate da virgola. Un host che inizia con "."
+# ammette anche i sottodomini (es. ".make.com"). Se CALLBACK_ALLOWED_HOSTS è vuoto sono ammessi solo gli host
+# i cui indirizzi sono tutti pubblici: niente loopback, reti private, link-local (metadati cloud) o riservate.
+CALLBACK_ALLOWED_SCHEMES = [s.strip().lower() for s in os.getenv("CALLBACK_ALLOWED_SCHEMES", "https").split(",") if s.strip()]
+CALLBACK_ALLOWED_HOSTS = [h.strip().lower() for h in os.getenv("CALLBACK_ALLOWED_HOSTS", "").split(",") if h.strip()]
+# Un job "in_esecuzione" da più di JOB_STALE_AFTER secondi è considerato abbandonato (es. worker gunicorn
+# terminato o riciclato durante l'esecuzione) e viene rimesso in coda; il controllo avviene ogni
+# JOB_STALE_CHECK_INTERVAL secondi in ogni processo con il pool avviato.
+JOB_STALE_AFTER = int(os.getenv("JOB_STALE_AFTER", "1800"))
+JOB_STALE_CHECK_INTERVAL = int(os.getenv("JOB_STALE_CHECK_INTERVAL", "60"))
+
+# Stati possibili di un job
+JOB_IN_CODA = "in_coda"
+JOB_IN_ESECUZIONE = "in_esecuzione"
+JOB_COMPLETATO = "completato"
+JOB_ERRORE = "errore"
+
+_executor = None
+_executor_lock = threading.Lock()
+_runner = None
+_queue_depth = {JOB_IN_CODA: 0, JOB_IN_ESECUZIONE: 0}
+_queue_depth_lock = threading.Lock()
+_in_flight = {}  # job_id -> Future dei job accodati in questo processo, attesi da stop_workers()
+_in_flight_lock = threading.Lock()
+_reaper = None
+_reaper_stop = threading.Event()
+
+logger = logging.getLogger(__name__)
+
+JOBS_FINISHED = counter("osint_jobs_finished_total", "Job asincroni terminati per stato", ("status",))
+gauge("osint_jobs_queued", "Job in coda in attesa di un worker", lambda: _queue_depth[JOB_IN_CODA])
+gauge("osint_jobs_running", "Job in esecuzione", lambda: _queue_depth[JOB_IN_ESECUZIONE])
+
+
+def _move_job(from_status, to_status):
+    with _queue_depth_lock:
+        if from_status:
+            _queue_depth[from_status] -= 1
+        if to_status:
+            _queue_depth[to_status] += 1
+
+
+def _now():
+    return datetime.datetime.now().isoformat()
+
+
+def recover_interrupted_jobs():
+    """
+    Rimette in coda i job rimasti "in_esecuzione" da uno spegnimento precedente. Va chiamata una sola volta
+    all'avvio, prima dei worker: con più processi (serve.py) la esegue il master. I job abbandonati da un
+    singolo worker mentre gli altri restano attivi sono ripresi da recover_stale_jobs.
+    """
+    with transaction() as conn:
+        recovered = conn.execute(
+            "UPDATE jobs SET status = ?, started_at = NULL WHERE status = ?", (JOB_IN_CODA, JOB_IN_ESECUZIONE)
+        ).rowcount
+    if recovered:
+        logger.info("Rimessi in coda %d job interrotti.", recovered)
+    return recovered
+
+
+def recover_stale_jobs(max_age=JOB_STALE_AFTER):
+    """
+    Rimette in coda e accoda al pool di questo processo i job "in_esecuzione" avviati da più di 'max_age' secondi,
+    insieme ai job in coda da più di 'max_age' secondi. La presa è condizionata a started_at: con più processi
+    ogni job viene ripreso da uno solo. Restituisce il numero di job in esecuzione ripresi.
+    """
+    cutoff = (datetime.datetime.now() - datetime.timedelta(seconds=max_age)).isoformat()
+    stale = get_connection().execute(
+        "SELECT id, payload_json, callback_url, started_at FROM jobs WHERE status = ? AND started_at < ?",
+        (JOB_IN_ESECUZIONE, cutoff)
+    ).fetchall()
+    recovered = []
+    for job_id, payload_json, callback_url, started_at in stale:
+        with transaction() as conn:
+            claimed = conn.execute(
+                "UPDATE jobs SET status = ?, started_at = NULL WHERE id = ? AND status = ? AND started_at = ?",
+                (JOB_IN_CODA, job_id, JOB_IN_ESECUZIONE, started_at)
+            ).rowcount
+        if claimed:
+            recovered.append((job_id, json.loads(payload_json), callback_url))
+    for job_id, payload, callback_url in recovered:
+        logger.warning("Job %s in esecuzione da oltre %ss senza esito: rimesso in coda.", job_id, max_age)
+        _submit(job_id, payload, callback_url)
+    # Job in coda da troppo tempo, accodati in memoria da un processo terminato: la presa in carico
+    # (_claim_job) garantisce comunque una sola esecuzione se il job è già nel pool di un processo attivo,
+    # e _submit salta quelli già nel pool di questo processo
+    waiting = get_connection().execute(
+        "SELECT id, payload_json, callback_url FROM jobs WHERE status = ? AND created_at < ? ORDER BY created_at",
+        (JOB_IN_CODA, cutoff)
+    ).fetchall()
+    for job_id, payload_json, callback_url in waiting:
+        _submit(job_id, json.loads(payload_json), callback_url)
+    return len(recovered)
+
+
+def _reaper_loop():
+    while not _reaper_stop.wait(JOB_STALE_CHECK_INTERVAL):
+        try:
+            recover_stale_jobs()
+        except Exception as e:
+            logger.error("Errore nel controllo dei job abbandonati: %s", e)
+
+
+def start_workers(runner, max_workers=JOB_MAX_WORKERS):
+    """
+    Avvia il pool di worker e vi accoda i job rimasti in coda (es. da un riavvio precedente).
+    'runner' riceve il payload del job e restituisce (response_data, status_code).
+    Più processi possono accodare gli stessi job: ognuno viene eseguito solo da chi lo prende in carico per primo.
+    """
+    global _executor, _runner, _reaper
+    with _executor_lock:
+        if _executor is not None:
+            return
+        _runner = runner
+        _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="osint-job")
+        _reaper_stop.clear()
+        _reaper = threading.Thread(target=_reaper_loop, name="osint-job-reaper", daemon=True)
+        _reaper.start()
+
+    pending = get_connection().execute(
+        "SELECT id, payload_json, callback_url FROM jobs WHERE status = ? ORDER BY created_at", (JOB_IN_CODA,)
+    ).fetchall()
+    for job_id, payload_json, callback_url in pending:
+        _submit(job_id, json.loads(payload_json), callback_url)
+    if pending:
+        logger.info("Accodati %d job in attesa.", len(pending))
+
+
+def stop_workers(timeout=None):
+    """
+    Ferma il pool di worker: i job non ancora avviati restano in coda nel database (li riprende il prossimo
+    avvio), quelli in esecuzione vengono attesi fino a 'timeout' secondi. Restituisce il numero di job
+    ancora in esecuzione allo scadere del timeout.
+    """
+    global _executor, _reaper
+    with _executor_lock:
+        executor, _executor = _executor, None
+        reaper, _reaper = _reaper, None
+    if executor is None:
+        return 0
+    _reaper_stop.set()
+    if reaper is not None:
+        reaper.join()
+    executor.shutdown(wait=False, cancel_futures=True)
+    with _in_flight_lock:
+        in_flight = list(_in_flight.values())
+    _, not_done = wait(in_flight, timeout=timeout)
+    if not_done:
+        logger.warning("%d job ancora in esecuzione allo spegnimento: saranno ripresi al prossimo avvio "
+                       "o dopo JOB_STALE_AFTER secondi da un altro processo.", len(not_done))
+    return len(not_done)
+
+
+def workers_running():
+    return _executor is not None
+
+
+def validate_callback_url(callback_url):
+    """Solleva ValueError se callback_url non è una destinazione ammessa per la notifica dei job."""
+    parsed = urlsplit(callback_url) if isinstance(callback_url, str) else None
+    if parsed is None or parsed.scheme.lower() not in CALLBACK_ALLOWED_SCHEMES or not parsed.hostname:
+        raise ValueError(f"callback_url non valido: è richiesto un URL {' o '.join(CALLBACK_ALLOWED_SCHEMES)} con un host")
+    host = parsed.hostname.lower().rstrip(".")
+    if CALLBACK_ALLOWED_HOSTS:
+        if not any(host == allowed.lstrip(".") or (allowed.startswith(".") and host.endswith(allowed))
+                   for allowed in CALLBACK_ALLOWED_HOSTS):
+            raise ValueError(f"callback_url non ammesso: l'host {host} non è in CALLBACK_ALLOWED_HOSTS")
+        return
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, None, proto=socket.IPPROTO_TCP)}
+    except socket.gaierror:
+        raise ValueError(f"callback_url non valido: impossibile risolvere l'host {host}") from None
+    if not all(ipaddress.ip_address(address.split("%")[0]).is_global for address in addresses):
+        raise ValueError(f"callback_url non ammesso: l'host {host} ha un indirizzo non pubblico")
+
+
+def submit_job(payload, callback_url=None):
+    """
+    Registra un nuovo job nel database e lo accoda al pool di worker. Restituisce l'id del job.
+    Solleva ValueError se callback_url non è ammesso (vedi validate_callback_url).
+    """
+    if _executor is None:
+        raise RuntimeError("Pool di worker non avviato: chiamare start_workers() prima di submit_job().")
+    if callback_url:
+        validate_callback_url(callback_url)
+
+    job_id = uuid.uuid4().hex
+    with transaction() as conn:
+        conn.execute('''
+            INSERT INTO jobs (id, status, payload_json, callback_url, created_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (job_id, JOB_IN_CODA, json.dumps(payload), callback_url, _now()))
+
+    _submit(job_id, payload, callback_url)
+    return job_id
+
+
+def _submit(job_id, payload, callback_url):
+    """Accoda il job al pool di questo processo, se non vi è già (es. ripreso più volte da recover_stale_jobs)."""
+    executor = _executor
+    if executor is None:
+        return  # Pool fermato nel frattempo: il job resta in coda nel database
+    with _in_flight_lock:
+        if job_id in _in_flight:
+            return
+        _move_job(None, JOB_IN_CODA)
+        try:
+            future = executor.submit(_execute_job, job_id, payload, callback_url)
+        except RuntimeError:
+            _move_job(JOB_IN_CODA, None)
+            return
+        _in_flight[job_id] = future
+    future.add_done_callback(lambda done: _forget_future(job_id, done))
+
+
+def _forget_future(job_id, future):
+    with _in_flight_lock:
+        if _in_flight.get(job_id) is future:
+            del _in_flight[job_id]
+    if future.cancelled():
+        _move_job(JOB_IN_CODA, None)
+
+
+def get_job(job_id):
+    """Restituisce lo stato del job (e il risultato, se disponibile) oppure None se non esiste."""
+    row = get_connection().execute('''
+        SELECT id, status, callback_url, callback_status, result_json, error, created_at, started_at, finished_at
+        FROM jobs WHERE id = ?
+    ''', (job_id,)).fetchone()
+
+    if row is None:
+        return None
+    return {
+        "job_id": row[0],
+        "status": row[1],
+        "callback_url": row[2],
+        "callback_status": row[3],
+        "result": json.loads(row[4]) if row[4] else None,
+        "error": row[5],
+        "created_at": row[6],
+        "started_at": row[7],
+        "finished_at": row[8]
+    }
+
+
+def _update_job(job_id, **fields):
+    columns = ", ".join(f"{name} = ?" for name in fields)
+    with transaction() as conn:
+        conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+
+def _claim_job(job_id):
+    """Passa il job da "in_coda" a "in_esecuzione". False se un altro worker (o processo) lo ha già preso."""
+    with transaction() as conn:
+        claimed = conn.execute(
+            "UPDATE jobs SET status = ?, started_at = ? WHERE id = ? AND status = ?",
+            (JOB_IN_ESECUZIONE, _now(), job_id, JOB_IN_CODA)
+        ).rowcount
+    return claimed > 0
+
+
+def _execute_job(job_id, payload, callback_url):
+    if not _claim_job(job_id):
+        _move_job(JOB_IN_CODA, None)
+        return
+    _move_job(JOB_IN_CODA, JOB_IN_ESECUZIONE)
+    try:
+        _run_job(job_id, payload, callback_url)
+    finally:
+        _move_job(JOB_IN_ESECUZIONE, None)
+
+
+def _run_job(job_id, payload, callback_url):
+    logger.info("Avvio job %s", job_id)
+    try:
+        with trace("job", job_id=job_id):
+            response_data, status_code = _runner(payload)
+        status = JOB_COMPLETATO if status_code < 400 else JOB_ERRORE
+        error = None if status == JOB_COMPLETATO else response_data.get("message")
+    except Exception as e:
+        # Il runner gestisce già i propri errori; qui si intercettano solo quelli imprevisti
+        response_data = {"status": "errore", "message": f"Errore critico durante l'esecuzione del job: {str(e)}"}
+        status = JOB_ERRORE
+        error = str(e)
+
+    _update_job(job_id, status=status, result_json=json.dumps(response_data), error=error, finished_at=_now())
+    JOBS_FINISHED.inc(status=status)
+    logger.info("Job %s terminato con stato '%s'", job_id, status)
+
+    if callback_url:
+        _send_callback(job_id, callback_url)
+
+
+def _send_callback(job_id, callback_url):
+    """
+    Notifica il risultato del job al callback_url indicato alla sottomissione (es. webhook Make.com).
+    La destinazione è verificata di nuovo all'invio (la risoluzione DNS può essere cambiata) e i redirect
+    non vengono seguiti, perché potrebbero puntare a un host non ammesso.
+    """
+    try:
+        validate_callback_url(callback_url)
+    except ValueError as e:
+        logger.warning("Notifica del job %s non inviata: %s", job_id, e)
+        _update_job(job_id, callback_status=f"rifiutato: {str(e)}")
+        return
+    try:
+        response = requests.post(callback_url, json=get_job(job_id), timeout=CALLBACK_TIMEOUT, allow_redirects=False)
+        callback_status = f"HTTP {response.status_code}"
+    except requests.exceptions.RequestException as e:
+        logger.warning("Errore durante la notifica del job %s a %s: %s", job_id, callback_url, e)
+        callback_status = f"errore: {str(e)}"
+    _update_job(job_id, callback_status=callback_status)
@@ -0,0 +1,110 @@
+import atexit
+import asyncio
+import logging
+import threading
+import contextvars
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+# Event loop condiviso dal processo. Le sorgenti asincrone (client HTTP, scheduler dei dork) girano
+# tutte su un unico loop in un thread dedicato: una chiamata in attesa di un provider non occupa un
+# thread. Il codice sincrono (receiver, pool dei job, blocchi __main__) vi sottopone le coroutine con
+# submit() o run_sync().
+
+CANCEL_POLL_INTERVAL = 0.5  # Secondi tra due controlli di cancel_event in run_sync
+SHUTDOWN_TIMEOUT = 5  # Secondi concessi alle coroutine annullate all'uscita del processo
+
+_loop = None
+_loop_thread = None
+_loop_lock = threading.Lock()
+_shutdown_hooks = []  # Coroutine function eseguite da stop_loop dopo l'annullamento dei task (es. chiusura dei client)
+
+logger = logging.getLogger(__name__)
+
+
+def get_loop():
+    """Event loop condiviso, avviato al primo utilizzo in un thread daemon."""
+    global _loop, _loop_thread
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+            _loop_thread = threading.Thread(target=_run_loop, args=(loop, ready), name="osint-event-loop", daemon=True)
+            _loop_thread.start()
+            ready.wait()
+            _loop = loop
+            atexit.register(stop_loop)
+        return _loop
+
+
+def _run_loop(loop, ready):
+    asyncio.set_event_loop(loop)
+    loop.call_soon(ready.set)
+    loop.run_forever()
+
+
+async def _run_in_context(coro, context):
+    # Il task interno copia 'context' alla creazione: trace e span del chiamante restano visibili
+    return await context.run(asyncio.ensure_future, coro)
+
+
+def submit(coro, inherit_context=True):
+    """
+    Avvia la coroutine sul loop condiviso e restituisce un concurrent.futures.Future; annullarlo annulla
+    la coroutine. Con inherit_context=False la coroutine parte da un contesto vuoto (es. worker di lunga durata
+    che non devono registrare i propri span nel trace della richiesta che li ha avviati).
+    """
+    context = contextvars.copy_context() if inherit_context else contextvars.Context()
+    return asyncio.run_coroutine_threadsafe(_run_in_context(coro, context), get_loop())
+
+
+def run_sync(coro, cancel_event=None):
+    """
+    Esegue la coroutine sul loop condiviso e ne attende il risultato dal thread chiamante.
+    Se 'cancel_event' viene impostato la coroutine è annullata e si solleva asyncio.CancelledError.
+    Non va chiamata dal thread del loop (si bloccherebbe in attesa di sé stessa).
+    """
+    if threading.current_thread() is _loop_thread:
+        coro.close()
+        raise RuntimeError("run_sync() chiamata dal thread dell'event loop: usare await")
+    future = submit(coro)
+    while True:
+        try:
+            return future.result(timeout=CANCEL_POLL_INTERVAL if cancel_event is not None else None)
+        except FutureTimeoutError:
+            if cancel_event.is_set():
+                future.cancel()
+                raise asyncio.CancelledError()
+
+
+def on_shutdown(hook):
+    """Registra una coroutine function da eseguire sul loop condiviso quando viene fermato (stop_loop)."""
+    _shutdown_hooks.append(hook)
+
+
+async def _cancel_all():
+    tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    for hook in _shutdown_hooks:
+        try:
+            await hook()
+        except Exception as e:
+            logger.warning("Errore durante lo spegnimento del loop condiviso (%s): %s", getattr(hook, "__name__", hook), e)
+
+
+def stop_loop(timeout=SHUTDOWN_TIMEOUT):
+    """
+    Annulla le coroutine ancora attive (es. worker dello scheduler dei dork), esegue le funzioni registrate
+    con on_shutdown (es. chiusura del client httpx) e ferma il loop condiviso.
+    """
+    global _loop
+    with _loop_lock:
+        loop, _loop = _loop, None
+    if loop is None or not loop.is_running():
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(_cancel_all(), loop).result(timeout=timeout)
+    except (FutureTimeoutError, asyncio.CancelledError):
+        pass
+    loop.call_soon_threadsafe(loop.stop)
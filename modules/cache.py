@@ -0,0 +1,165 @@
+import os
+import json
+import time
+import threading
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+import storage
+from telemetry import counter
+
+# Cache a due livelli per i risultati delle sorgenti: LRU in memoria davanti a una tabella SQLite
+# nello stesso database dei risultati. Le chiavi sono nomi normalizzati (vedi modules/normalization.py),
+# eventualmente con un prefisso che distingue il backend della sorgente; ogni voce ricorda anche la chiave
+# del soggetto che l'ha richiesta (subject_key), così le voci delle varianti del nome si invalidano con il soggetto.
+# Letture e scritture su SQLite usano la connessione del thread di storage.get_connection().
+
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "1") not in ("0", "false")
+CACHE_MEMORY_MAX_ENTRIES = int(os.getenv("CACHE_MEMORY_MAX_ENTRIES", "1000"))
+CACHE_PRUNE_EVERY = 100  # Ogni quante scritture per sorgente si applica il limite di dimensione su SQLite
+
+# Politica di freschezza per sorgente: TTL in secondi e numero massimo di voci persistite.
+# Le sorgenti non elencate non vengono messe in cache.
+CACHE_POLICIES = {
+    "sanctions_network": {"ttl": int(os.getenv("CACHE_TTL_SANCTIONS", str(6 * 3600))), "max_entries": 50000},
+    "google_dorks_anagrafica": {"ttl": int(os.getenv("CACHE_TTL_GOOGLE_DORKS", str(24 * 3600))), "max_entries": 20000},
+}
+
+_memory = OrderedDict()  # (source, key) -> (value, created_at, subject_key)
+_memory_lock = threading.Lock()
+_writes_since_prune = {}
+_table_path = None  # Database in cui la tabella cache_entries è già stata creata
+_bypass = contextvars.ContextVar("osint_cache_bypass", default=False)
+
+CACHE_REQUESTS = counter("osint_cache_requests_total", "Letture della cache per sorgente ed esito (memoria, sqlite, scaduto, assente, ignorato)", ("source", "result"))
+
+
+def _transaction():
+    """Transazione sulla connessione del thread (storage.get_connection), con la tabella della cache già creata."""
+    global _table_path
+    if _table_path != storage.DATABASE_NAME:
+        conn = storage.get_connection()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                source TEXT NOT NULL,
+                cache_key TEXT NOT NULL,
+                value_json TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (source, cache_key)
+            )
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_entries_lru ON cache_entries (source, last_access)")
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(cache_entries)")}
+        if "subject_key" not in columns:  # Tabelle create prima dell'invalidazione per soggetto
+            conn.execute("ALTER TABLE cache_entries ADD COLUMN subject_key TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_entries_subject ON cache_entries (subject_key)")
+        conn.commit()
+        _table_path = storage.DATABASE_NAME
+    return storage.transaction()
+
+
+@contextmanager
+def bypass_cache():
+    """
+    Nel blocco (e nel lavoro avviato da esso con il contesto copiato) le letture ignorano la cache:
+    le sorgenti vengono interrogate e le risposte fresche sostituiscono quelle memorizzate.
+    """
+    token = _bypass.set(True)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+def is_cacheable(source):
+    return CACHE_ENABLED and source in CACHE_POLICIES
+
+
+def _memory_put(source, key, value, created_at, subject_key=None):
+    with _memory_lock:
+        _memory[(source, key)] = (value, created_at, subject_key)
+        _memory.move_to_end((source, key))
+        while len(_memory) > CACHE_MEMORY_MAX_ENTRIES:
+            _memory.popitem(last=False)
+
+
+def cache_get(source, key):
+    """Restituisce (valore, età in secondi) se presente e ancora fresco, altrimenti None."""
+    if not is_cacheable(source):
+        return None
+    if _bypass.get():
+        CACHE_REQUESTS.inc(source=source, result="ignorato")
+        return None
+    ttl = CACHE_POLICIES[source]["ttl"]
+    now = time.time()
+
+    with _memory_lock:
+        entry = _memory.get((source, key))
+        if entry is not None:
+            if now - entry[1] <= ttl:
+                _memory.move_to_end((source, key))
+                CACHE_REQUESTS.inc(source=source, result="memoria")
+                return entry[0], now - entry[1]
+            del _memory[(source, key)]
+
+    with _transaction() as conn:
+        row = conn.execute(
+            "SELECT value_json, created_at, subject_key FROM cache_entries WHERE source = ? AND cache_key = ?", (source, key)
+        ).fetchone()
+        if row is None:
+            CACHE_REQUESTS.inc(source=source, result="assente")
+            return None
+        if now - row[1] > ttl:
+            conn.execute("DELETE FROM cache_entries WHERE source = ? AND cache_key = ?", (source, key))
+            CACHE_REQUESTS.inc(source=source, result="scaduto")
+            return None
+        conn.execute("UPDATE cache_entries SET last_access = ? WHERE source = ? AND cache_key = ?", (now, source, key))
+
+    value = json.loads(row[0])
+    _memory_put(source, key, value, row[1], row[2])
+    CACHE_REQUESTS.inc(source=source, result="sqlite")
+    return value, now - row[1]
+
+
+def cache_set(source, key, value, subject_key=None):
+    """Memorizza il valore; 'subject_key' è la chiave del soggetto richiesto (se diversa da 'key', es. una variante)."""
+    if not is_cacheable(source):
+        return
+    now = time.time()
+    _memory_put(source, key, value, now, subject_key)
+
+    with _transaction() as conn:
+        conn.execute('''
+            INSERT OR REPLACE INTO cache_entries (source, cache_key, value_json, created_at, last_access, subject_key)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (source, key, json.dumps(value), now, now, subject_key))
+        _writes_since_prune[source] = _writes_since_prune.get(source, 0) + 1
+        if _writes_since_prune[source] >= CACHE_PRUNE_EVERY:
+            _writes_since_prune[source] = 0
+            # Limite LRU: si eliminano le voci meno recentemente usate oltre max_entries
+            conn.execute('''
+                DELETE FROM cache_entries WHERE source = ? AND cache_key IN (
+                    SELECT cache_key FROM cache_entries WHERE source = ?
+                    ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )
+            ''', (source, source, CACHE_POLICIES[source]["max_entries"]))
+
+
+def invalidate_subject(key, source=None):
+    """
+    Elimina le voci di un soggetto (tutte le sorgenti o solo 'source'): quelle con chiave 'key' e quelle
+    richieste per il soggetto, come le varianti del nome. Restituisce il numero di voci rimosse.
+    """
+    with _memory_lock:
+        for memory_key in [k for k, entry in _memory.items()
+                           if (k[1] == key or entry[2] == key) and (source is None or k[0] == source)]:
+            del _memory[memory_key]
+
+    with _transaction() as conn:
+        if source is None:
+            cursor = conn.execute("DELETE FROM cache_entries WHERE cache_key = ? OR subject_key = ?", (key, key))
+        else:
+            cursor = conn.execute("DELETE FROM cache_entries WHERE (cache_key = ? OR subject_key = ?) AND source = ?",
+                                  (key, key, source))
+    return cursor.rowcount
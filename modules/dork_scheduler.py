@@ -0,0 +1,279 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+import requests
+from googlesearch import search
+from modules.http_client import get_session, get_async_client, httpx
+from modules.async_runtime import get_loop, submit as submit_coroutine
+from telemetry import counter, gauge, span
+
+# Scheduler globale delle ricerche Google. Tutti i soggetti in elaborazione condividono un unico
+# budget di query (token bucket): i dork vengono serviti a turno tra i primi DORK_ACTIVE_OWNERS soggetti
+# in ordine di arrivo invece di attendere pause fisse per ogni chiamata, i dork identici in coda vengono
+# eseguiti una sola volta e un 429 sospende l'intero scheduler con backoff esponenziale.
+# Limitare i soggetti serviti a turno conta sotto carico: alternandoli tutti, con molti soggetti in coda
+# ognuno riceverebbe l'ultimo dork oltre il proprio timeout, mentre così i primi completano i loro.
+# I worker sono coroutine sull'event loop condiviso (modules/async_runtime.py) e le pause usano
+# asyncio.sleep: le ricerche in attesa del budget non occupano thread. submit() restituisce un
+# concurrent.futures.Future, utilizzabile sia dal codice sincrono sia con await (asyncio.wrap_future).
+
+DEFAULT_DORK_RATE_PER_MINUTE = 15.0
+DORK_RATE_PER_MINUTE = float(os.getenv("DORK_RATE_PER_MINUTE", str(DEFAULT_DORK_RATE_PER_MINUTE)))
+DORK_BURST = max(int(os.getenv("DORK_BURST", "3")), 1)
+DORK_WORKERS = int(os.getenv("DORK_WORKERS", "2"))  # Ricerche eseguite contemporaneamente
+DORK_ACTIVE_OWNERS = max(int(os.getenv("DORK_ACTIVE_OWNERS", "2")), 1)  # Soggetti serviti a turno; gli altri attendono
+DORK_BACKOFF_BASE = float(os.getenv("DORK_BACKOFF_BASE", "30"))  # Secondi di pausa dopo il primo 429
+DORK_BACKOFF_MAX = float(os.getenv("DORK_BACKOFF_MAX", "600"))
+DORK_MAX_RETRIES = 2  # Nuovi tentativi di un dork che ha ricevuto 429
+# Se impostato, le ricerche sono inviate a questo endpoint (GET ?q=&num=&hl=, risposta: lista JSON di URL)
+# invece che a Google; usato dal benchmark con il server di ricerca locale (bench/stub_servers.py).
+DORK_SEARCH_URL = os.getenv("DORK_SEARCH_URL")
+
+logger = logging.getLogger(__name__)
+
+if DORK_RATE_PER_MINUTE <= 0:
+    logger.warning("DORK_RATE_PER_MINUTE=%s non valido (deve essere maggiore di zero): uso %s",
+                   DORK_RATE_PER_MINUTE, DEFAULT_DORK_RATE_PER_MINUTE)
+    DORK_RATE_PER_MINUTE = DEFAULT_DORK_RATE_PER_MINUTE
+
+DORK_RATE_LIMITED = counter("osint_dork_rate_limited_total", "Risposte 429 ricevute dal motore di ricerca")
+
+
+class TokenBucket:
+    """Limitatore a secchiello: 'rate' token al secondo, al massimo 'capacity' accumulabili."""
+
+    def __init__(self, rate, capacity):
+        if rate <= 0 or capacity < 1:
+            raise ValueError(f"TokenBucket: rate deve essere > 0 e capacity >= 1 (ricevuti {rate}, {capacity})")
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """Attende che sia disponibile un token (e che non sia in corso una pausa da 429)."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    self._refill(now)
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds):
+        """Sospende l'emissione di token e azzera quelli accumulati (usato dopo un 429)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0
+            self._updated = self._paused_until
+
+
+class _DorkJob:
+    # Lo stesso oggetto (e lo stesso Future restituito ai chiamanti) resta valido anche dopo un 429:
+    # il dork viene rimesso in coda, non sostituito, così release() lo trova sempre.
+    def __init__(self, key):
+        self.key = key
+        self.future = Future()
+        self.waiters = 1
+        self.attempts = 0
+
+
+class DorkScheduler:
+    def __init__(self, rate_per_minute=DORK_RATE_PER_MINUTE, burst=DORK_BURST, workers=DORK_WORKERS,
+                 active_owners=DORK_ACTIVE_OWNERS):
+        self.bucket = TokenBucket(rate_per_minute / 60.0, burst)
+        self.active_owners = max(active_owners, 1)
+        self._queues = OrderedDict()  # owner -> deque di _DorkJob, in ordine di arrivo del proprietario
+        self._active = deque()  # Proprietari serviti a turno (al più active_owners), il prossimo in testa
+        self._jobs = {}  # (dork, num_results, lang) -> _DorkJob in coda o in esecuzione
+        self._lock = threading.Lock()
+        self._wakeup = asyncio.Event()  # Impostato (nel loop) quando arriva un nuovo dork
+        self._loop = get_loop()
+        self._consecutive_429 = 0
+        # Contesto vuoto: gli span delle ricerche non finiscono nel trace della richiesta che ha creato lo scheduler
+        self._workers = [submit_coroutine(self._worker(), inherit_context=False) for _ in range(workers)]
+
+    def submit(self, dork, owner, num_results=5, lang="it"):
+        """
+        Accoda un dork per conto di 'owner' (es. il soggetto) e restituisce un Future con la lista di URL.
+        Se lo stesso dork è già in coda o in esecuzione, si riceve il Future esistente.
+        """
+        key = (dork, num_results, lang)
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and not job.future.done():
+                job.waiters += 1
+                return job.future
+            job = _DorkJob(key)
+            self._jobs[key] = job
+            self._queues.setdefault(owner, deque()).append(job)
+        self._notify()
+        return job.future
+
+    def _notify(self):
+        self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def release(self, future):
+        """Il chiamante non attende più il risultato: se nessun altro lo attende, il dork in coda viene scartato."""
+        with self._lock:
+            for job in self._jobs.values():
+                if job.future is future:
+                    job.waiters -= 1
+                    if job.waiters <= 0:
+                        job.future.cancel()  # Ha effetto solo se il dork non è ancora partito
+                    return
+
+    @property
+    def pending(self):
+        """Dork in attesa di esecuzione (esclusi quelli annullati)."""
+        with self._lock:
+            return sum(1 for queue in self._queues.values() for job in queue if not job.future.cancelled() and job.waiters > 0)
+
+    @staticmethod
+    def _start(job):
+        """True se il dork va eseguito; quelli che nessuno attende più vengono scartati."""
+        if job.future.running():  # Nuovo tentativo dopo un 429
+            if job.waiters > 0:
+                return True
+            job.future.set_exception(RuntimeError("Dork annullato"))
+            return False
+        return job.future.set_running_or_notify_cancel()
+
+    def _pop_next(self):
+        # Round robin tra al più active_owners proprietari: chi arriva dopo entra quando uno di loro esaurisce la coda
+        with self._lock:
+            while self._queues:
+                for owner in self._queues:
+                    if len(self._active) >= self.active_owners:
+                        break
+                    if owner not in self._active:
+                        self._active.append(owner)
+                owner = self._active.popleft()
+                queue = self._queues[owner]
+                while queue:
+                    job = queue.popleft()
+                    if self._start(job):
+                        if queue:
+                            self._active.append(owner)
+                        else:
+                            del self._queues[owner]
+                        return job, owner
+                    if self._jobs.get(job.key) is job:  # Annullato prima di partire
+                        del self._jobs[job.key]
+                del self._queues[owner]
+        return None
+
+    async def _next_job(self):
+        while True:
+            self._wakeup.clear()
+            # I dork accodati dopo questo controllo reimpostano _wakeup: nessuna notifica va persa
+            next_job = self._pop_next()
+            if next_job is not None:
+                return next_job
+            await self._wakeup.wait()
+
+    async def _worker(self):
+        while True:
+            job, owner = await self._next_job()
+            await self.bucket.acquire()
+            if job.waiters <= 0:
+                # Rilasciato da tutti durante l'attesa del token (es. nella pausa dopo un 429)
+                self._finish(job, error=RuntimeError("Dork annullato"))
+                continue
+            dork, num_results, lang = job.key
+            try:
+                with span("dork.search"):
+                    urls = await _run_search(dork, num_results, lang)
+            except Exception as e:
+                response = _rate_limited_response(e)
+                if response is not None and job.attempts < DORK_MAX_RETRIES:
+                    self._handle_rate_limited(job, owner, response)
+                    continue
+                self._finish(job, error=e)
+            else:
+                self._consecutive_429 = 0
+                self._finish(job, urls=urls)
+
+    def _handle_rate_limited(self, job, owner, response):
+        self._consecutive_429 += 1
+        retry_after = response.headers.get("Retry-After")
+        backoff = min(DORK_BACKOFF_MAX, DORK_BACKOFF_BASE * (2 ** (self._consecutive_429 - 1)))
+        if retry_after and retry_after.isdigit():
+            backoff = max(backoff, float(retry_after))
+        DORK_RATE_LIMITED.inc()
+        logger.warning("HTTP 429 da Google: pausa di %.0fs per tutte le ricerche", backoff)
+        self.bucket.pause(backoff)
+        # Il dork torna in testa alla coda del suo proprietario, con lo stesso Future (già "running")
+        job.attempts += 1
+        with self._lock:
+            self._queues.setdefault(owner, deque()).appendleft(job)
+            self._queues.move_to_end(owner, last=False)
+            if owner in self._active:
+                self._active.remove(owner)
+            self._active.appendleft(owner)
+        self._wakeup.set()
+
+    def _finish(self, job, urls=None, error=None):
+        with self._lock:
+            if self._jobs.get(job.key) is job:
+                del self._jobs[job.key]
+        if error is not None:
+            job.future.set_exception(error)
+        else:
+            job.future.set_result(urls)
+
+
+async def _run_search(dork, num_results, lang):
+    if DORK_SEARCH_URL:
+        if httpx is None:
+            return await asyncio.to_thread(_run_search_blocking, dork, num_results, lang)
+        response = await get_async_client().get(DORK_SEARCH_URL, params={"q": dork, "num": num_results, "hl": lang}, timeout=10)
+        response.raise_for_status()
+        return response.json()[:num_results]
+    # googlesearch è bloccante: gira in un thread, al più DORK_WORKERS alla volta
+    return await asyncio.to_thread(_run_search_blocking, dork, num_results, lang)
+
+
+def _run_search_blocking(dork, num_results, lang):
+    if DORK_SEARCH_URL:
+        response = get_session().get(DORK_SEARCH_URL, params={"q": dork, "num": num_results, "hl": lang}, timeout=10)
+        response.raise_for_status()
+        return response.json()[:num_results]
+    return list(search(dork, num_results=num_results, lang=lang, sleep_interval=0))
+
+
+def _rate_limited_response(error):
+    """Risposta HTTP 429 all'origine dell'errore (requests o httpx), altrimenti None."""
+    rate_limit_errors = (requests.exceptions.HTTPError,) + ((httpx.HTTPStatusError,) if httpx else ())
+    response = getattr(error, "response", None) if isinstance(error, rate_limit_errors) else None
+    return response if response is not None and response.status_code == 429 else None
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+gauge("osint_dork_queue_depth", "Dork in attesa nello scheduler condiviso", lambda: _scheduler.pending if _scheduler else 0)
+
+
+def get_scheduler():
+    """Scheduler condiviso dal processo, creato al primo utilizzo."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = DorkScheduler()
+        return _scheduler
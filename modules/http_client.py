@@ -0,0 +1,375 @@
+import os
+import json
+import asyncio
+import time
+import random
+import logging
+import threading
+import email.utils
+from collections import OrderedDict
+import requests
+from requests.adapters import HTTPAdapter
+from modules.async_runtime import on_shutdown
+from telemetry import counter, span
+
+try:
+    import httpx  # Opzionale: client asincrono nativo; senza, le richieste async girano in un thread del loop
+except ImportError:
+    httpx = None
+
+# Client HTTP condiviso dalle sorgenti: sessione con connessioni keep-alive riutilizzate,
+# retry con backoff esponenziale e jitter, circuit breaker per servizio.
+# Le GET richieste con conditional=True riutilizzano ETag/Last-Modified della risposta precedente:
+# se il provider risponde 304 il corpo già ricevuto viene riutilizzato.
+# async_request_with_retry è l'equivalente per l'event loop condiviso (modules/async_runtime.py), con
+# un httpx.AsyncClient al posto della sessione: circuit breaker e validatori sono gli stessi.
+
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+HTTP_ASYNC_MAX_CONNECTIONS = int(os.getenv("HTTP_ASYNC_MAX_CONNECTIONS", "200"))  # Connessioni aperte dal client async
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "0.5"))  # Secondi, raddoppiati a ogni tentativo
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "10"))
+HTTP_RETRY_AFTER_MAX = float(os.getenv("HTTP_RETRY_AFTER_MAX", "60"))  # Limite all'attesa richiesta da Retry-After
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("HTTP_BREAKER_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("HTTP_BREAKER_RESET", "30"))
+CONDITIONAL_CACHE_MAX = int(os.getenv("HTTP_CONDITIONAL_CACHE_MAX", "2000"))  # Risposte con validatori conservate
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_session = None
+_session_lock = threading.Lock()
+_async_client = None  # Usato solo dal thread dell'event loop condiviso: non serve un lock
+_breakers = {}
+_breakers_lock = threading.Lock()
+_validators = OrderedDict()  # (url, parametri) -> (etag, last_modified, contenuto, encoding)
+_validators_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+if httpx is None:
+    # Ripiego funzionante ma limitato: ogni richiesta asincrona occupa un thread dell'executor predefinito del loop
+    logger.warning("httpx non installato: le richieste asincrone (modalità async, sorgenti di M1) usano il client "
+                   "sincrono nei thread del loop condiviso, al più %d in parallelo. Installare 'httpx'.",
+                   min(32, (os.cpu_count() or 1) + 4))
+
+HTTP_RETRIES = counter("osint_http_retries_total", "Nuovi tentativi delle chiamate esterne per servizio e motivo", ("service", "reason"))
+HTTP_CONDITIONAL = counter("osint_http_conditional_total", "Richieste condizionali per servizio ed esito (non_modificato, modificato)", ("service", "result"))
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Sollevata senza effettuare la chiamata quando il circuit breaker del servizio è aperto."""
+
+
+class RequestCancelled(requests.exceptions.RequestException):
+    """Sollevata da request_with_retry quando il cancel_event viene impostato prima o durante un'attesa."""
+
+
+# Eccezioni di rete o HTTP sollevate da request_with_retry e async_request_with_retry
+HTTP_ERRORS = (requests.exceptions.RequestException,) + ((httpx.HTTPError,) if httpx else ())
+
+
+class CircuitBreaker:
+    """
+    Dopo 'failure_threshold' fallimenti consecutivi il circuito si apre e le chiamate falliscono subito.
+    Trascorso 'reset_timeout' viene lasciata passare una sola chiamata di prova (half-open):
+    se va a buon fine il circuito si richiude, altrimenti si riapre.
+    """
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half_open"
+            return "open"
+
+    def before_call(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._probe_in_flight:
+                raise CircuitOpenError(f"Circuit breaker '{self.name}' aperto: servizio temporaneamente non disponibile")
+            self._probe_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probe_in_flight or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+
+def get_session():
+    """Restituisce la sessione HTTP condivisa (creata al primo utilizzo)."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            # Il retry è gestito da request_with_retry, non dall'adapter
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=0)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def get_async_client():
+    """Client httpx asincrono condiviso (da chiamare dall'event loop condiviso)."""
+    global _async_client
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(follow_redirects=True, limits=httpx.Limits(
+            max_connections=HTTP_ASYNC_MAX_CONNECTIONS, max_keepalive_connections=HTTP_POOL_SIZE
+        ))
+    return _async_client
+
+
+async def close_async_client():
+    """Chiude il client httpx condiviso; eseguita sul loop condiviso quando viene fermato (vedi on_shutdown)."""
+    global _async_client
+    client, _async_client = _async_client, None
+    if client is not None:
+        await client.aclose()
+
+
+if httpx is not None:
+    on_shutdown(close_async_client)
+
+
+def get_circuit_breaker(name):
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+
+def _retry_after_seconds(response):
+    """Interpreta l'header Retry-After (secondi oppure data HTTP). None se assente o non valido."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+        return max(retry_at.timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff_delay(attempt, backoff_base, backoff_max):
+    # "Full jitter": attesa casuale tra 0 e il backoff esponenziale dell'attempt
+    return random.uniform(0, min(backoff_max, backoff_base * (2 ** attempt)))
+
+
+def _exceeds_deadline(deadline, delay):
+    # Un nuovo tentativo che partirebbe oltre la scadenza verrebbe comunque scartato dal chiamante
+    return deadline is not None and time.monotonic() + delay >= deadline
+
+
+def _wait(delay, cancel_event):
+    if cancel_event is None:
+        time.sleep(delay)
+    elif cancel_event.wait(delay):
+        raise RequestCancelled("Richiesta annullata durante l'attesa del nuovo tentativo")
+
+
+def _validator_key(url, params):
+    return url, json.dumps(params or {}, sort_keys=True, default=str)
+
+
+def _add_conditional_headers(key, kwargs):
+    with _validators_lock:
+        cached = _validators.get(key)
+    if cached is None:
+        return None
+    headers = dict(kwargs.get("headers") or {})
+    if cached[0]:
+        headers["If-None-Match"] = cached[0]
+    if cached[1]:
+        headers["If-Modified-Since"] = cached[1]
+    kwargs["headers"] = headers
+    return cached
+
+
+def _handle_conditional(key, cached, response, service):
+    """
+    Con un 304 restituisce il corpo conservato come risposta 200; con un 200 ne conserva i validatori.
+    Vale per le risposte di requests e di httpx (entrambe espongono content tramite _content).
+    """
+    if response.status_code == 304 and cached is not None:
+        HTTP_CONDITIONAL.inc(service=service or "", result="non_modificato")
+        response.status_code = 200
+        response._content = cached[2]
+        response.encoding = cached[3]
+        response.not_modified = True
+        return response
+    etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+    if response.status_code == 200 and (etag or last_modified):
+        if cached is not None:
+            HTTP_CONDITIONAL.inc(service=service or "", result="modificato")
+        with _validators_lock:
+            _validators[key] = (etag, last_modified, response.content, response.encoding)
+            _validators.move_to_end(key)
+            while len(_validators) > CONDITIONAL_CACHE_MAX:
+                _validators.popitem(last=False)
+    response.not_modified = False
+    return response
+
+
+def request_with_retry(method, url, service=None, max_retries=HTTP_MAX_RETRIES,
+                       backoff_base=HTTP_BACKOFF_BASE, backoff_max=HTTP_BACKOFF_MAX, conditional=False,
+                       cancel_event=None, deadline=None, **kwargs):
+    """
+    Esegue una richiesta tramite la sessione condivisa, ritentando su errori di connessione e 429/5xx.
+    Se 'service' è indicato la chiamata passa dal circuit breaker omonimo.
+    Con conditional=True (solo GET) la richiesta è condizionale rispetto all'ultima risposta con ETag o
+    Last-Modified: un 304 viene restituito come la risposta 200 precedente, con response.not_modified=True.
+    'deadline' (istante di time.monotonic()) esclude i tentativi che partirebbero dopo la scadenza;
+    le attese tra i tentativi terminano con RequestCancelled appena viene impostato 'cancel_event'.
+    Restituisce l'ultima risposta ottenuta (il chiamante decide se usare raise_for_status).
+    """
+    conditional = conditional and method.upper() == "GET"
+    if conditional:
+        validator_key = _validator_key(url, kwargs.get("params"))
+        cached = _add_conditional_headers(validator_key, kwargs)
+    session = get_session()
+    breaker = get_circuit_breaker(service) if service else None
+    attempt = 0
+    while True:
+        if cancel_event is not None and cancel_event.is_set():
+            raise RequestCancelled("Richiesta annullata")
+        if breaker:
+            breaker.before_call()
+        try:
+            with span(f"http.{service or 'request'}", attempt=attempt):
+                response = session.request(method, url, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if breaker:
+                breaker.record_failure()
+            delay = _backoff_delay(attempt, backoff_base, backoff_max)
+            if attempt >= max_retries or _exceeds_deadline(deadline, delay):
+                raise
+            HTTP_RETRIES.inc(service=service or "", reason="connessione")
+            logger.warning("Errore di connessione verso %s (%s), nuovo tentativo tra %.2fs", url, e, delay)
+        except BaseException:
+            # Qualsiasi altro errore (es. InvalidURL, ChunkedEncodingError) deve liberare la chiamata di prova
+            # del circuito half-open: altrimenti il circuito resterebbe aperto per sempre
+            if breaker:
+                breaker.record_failure()
+            raise
+        else:
+            if response.status_code not in RETRY_STATUS_CODES:
+                if breaker:
+                    breaker.record_success()
+                if conditional:
+                    return _handle_conditional(validator_key, cached, response, service)
+                return response
+            if breaker:
+                # Un 429 indica che il servizio è raggiungibile: non deve aprire il circuito
+                if response.status_code == 429:
+                    breaker.record_success()
+                else:
+                    breaker.record_failure()
+            if attempt >= max_retries:
+                return response
+            retry_after = _retry_after_seconds(response)
+            if retry_after is not None:
+                delay = min(retry_after, HTTP_RETRY_AFTER_MAX)
+            else:
+                delay = _backoff_delay(attempt, backoff_base, backoff_max)
+            if _exceeds_deadline(deadline, delay):
+                return response
+            HTTP_RETRIES.inc(service=service or "", reason=str(response.status_code))
+            logger.warning("Risposta %s da %s, nuovo tentativo tra %.2fs", response.status_code, url, delay)
+            response.close()
+        attempt += 1
+        _wait(delay, cancel_event)
+
+
+async def async_request_with_retry(method, url, service=None, max_retries=HTTP_MAX_RETRIES,
+                                   backoff_base=HTTP_BACKOFF_BASE, backoff_max=HTTP_BACKOFF_MAX, conditional=False,
+                                   deadline=None, **kwargs):
+    """
+    Versione asincrona di request_with_retry (stessi parametri, stessi retry, circuit breaker e richieste
+    condizionali), con attese tramite asyncio.sleep. Senza httpx la richiesta sincrona gira in un thread,
+    le cui attese si interrompono quando il task viene annullato.
+    """
+    if httpx is None:
+        cancel_event = threading.Event()
+        try:
+            return await asyncio.to_thread(request_with_retry, method, url, service=service, max_retries=max_retries,
+                                           backoff_base=backoff_base, backoff_max=backoff_max, conditional=conditional,
+                                           cancel_event=cancel_event, deadline=deadline, **kwargs)
+        except asyncio.CancelledError:
+            cancel_event.set()
+            raise
+    conditional = conditional and method.upper() == "GET"
+    if conditional:
+        validator_key = _validator_key(url, kwargs.get("params"))
+        cached = _add_conditional_headers(validator_key, kwargs)
+    client = get_async_client()
+    breaker = get_circuit_breaker(service) if service else None
+    attempt = 0
+    while True:
+        if breaker:
+            breaker.before_call()
+        try:
+            with span(f"http.{service or 'request'}", attempt=attempt):
+                response = await client.request(method, url, **kwargs)
+        except httpx.TransportError as e:
+            if breaker:
+                breaker.record_failure()
+            delay = _backoff_delay(attempt, backoff_base, backoff_max)
+            if attempt >= max_retries or _exceeds_deadline(deadline, delay):
+                raise
+            HTTP_RETRIES.inc(service=service or "", reason="connessione")
+            logger.warning("Errore di connessione verso %s (%s), nuovo tentativo tra %.2fs", url, e, delay)
+        except BaseException:
+            # Compreso asyncio.CancelledError (es. timeout dell'orchestratore durante la chiamata di prova)
+            if breaker:
+                breaker.record_failure()
+            raise
+        else:
+            if response.status_code not in RETRY_STATUS_CODES:
+                if breaker:
+                    breaker.record_success()
+                if conditional:
+                    return _handle_conditional(validator_key, cached, response, service)
+                return response
+            if breaker:
+                if response.status_code == 429:
+                    breaker.record_success()
+                else:
+                    breaker.record_failure()
+            if attempt >= max_retries:
+                return response
+            retry_after = _retry_after_seconds(response)
+            if retry_after is not None:
+                delay = min(retry_after, HTTP_RETRY_AFTER_MAX)
+            else:
+                delay = _backoff_delay(attempt, backoff_base, backoff_max)
+            if _exceeds_deadline(deadline, delay):
+                return response
+            HTTP_RETRIES.inc(service=service or "", reason=str(response.status_code))
+            logger.warning("Risposta %s da %s, nuovo tentativo tra %.2fs", response.status_code, url, delay)
+            await response.aclose()
+        attempt += 1
+        await asyncio.sleep(delay)
@@ -1,13 +1,83 @@
-import requests
 import json
 import datetime
+import os
+import time  # Per la misura dei tempi
+import asyncio
+import logging
+import threading
+from modules.http_client import async_request_with_retry, HTTP_ERRORS
+from modules.async_runtime import run_sync
+from modules.normalization import normalize_name
+from modules.cache import cache_get, cache_set, is_cacheable
+from modules.dork_scheduler import get_scheduler
+from modules.sanctions_index import match_name, index_available, MATCH_THRESHOLD
+from modules.name_variants import generate_variants, plan_queries
+from telemetry import span
 
 # Endpoint API aggiornato per la ricerca fuzzy di Sanctions.network
-OPEN_SANCTIONS_API_URL = "https://api.sanctions.network/rpc/search_sanctions"
+OPEN_SANCTIONS_API_URL = os.getenv("SANCTIONS_API_URL", "https://api.sanctions.network/rpc/search_sanctions")
 
-def search_opensanctions(nome, cognome):
+# "remote" interroga api.sanctions.network, "local" l'indice offline (python -m modules.sanctions_index ingest ...)
+SANCTIONS_BACKEND = os.getenv("SANCTIONS_BACKEND", "remote")
+
+# Timeout (secondi) per singola sorgente nell'orchestratore concorrente
+SANCTIONS_TIMEOUT = float(os.getenv("M1_SANCTIONS_TIMEOUT", "20"))
+# Alla scadenza i dork non ancora serviti dallo scheduler sono scartati e la sorgente restituisce gli URL già
+# raccolti; l'orchestratore attende DORK_RESULT_GRACE secondi in più prima di annullarla
+GOOGLE_DORKS_TIMEOUT = float(os.getenv("M1_GOOGLE_DORKS_TIMEOUT", "90"))
+DORK_RESULT_GRACE = 5
+
+# Interrogazioni massime per soggetto tra tutte le sorgenti e varianti del nome (ogni dork conta come una):
+# il nome originale è sempre cercato, le varianti in ordine di peso finché il budget lo consente
+VARIANT_QUERY_BUDGET = int(os.getenv("M1_VARIANT_QUERY_BUDGET", "10"))
+
+# Dork anagrafici: {query} è la frase esatta "nome cognome"
+ANAGRAFICA_DORKS = [
+    '{query} "nato il"',
+    '{query} "data di nascita"',
+    '{query} "luogo di nascita"',
+    '{query} "born on"',
+    '{query} "date of birth"',
+    '{query} "place of birth"',
+]
+
+logger = logging.getLogger(__name__)
+
+def build_sanction_info(result, query, score=None):
+    """
+    Converte un record in formato Sanctions.network nella struttura sanction_info (simile a OpenSanctions).
+    Se 'score' è indicato (indice locale) viene usato come score reale e determina il campo 'match'.
+    """
+    # Mappa i campi di Sanctions.network alla struttura originale simile a OpenSanctions
+    # Nota: la disponibilità dei campi e i nomi esatti potrebbero richiedere test sull'API effettiva
+    # e potenzialmente l'uso del parametro 'select' per coerenza.
+    sanction_info = {
+        "id": result.get("id", f"sn-{result.get('names', ['unknown'])[0] if result.get('names') else 'unknown'}"),  # Usa il loro ID o generane uno
+        "caption": result.get("names", [query])[0] if result.get("names") else query,  # Usa il primo nome da 'names' come didascalia
+        "schema": result.get("type", "Unknown").capitalize(),  # 'type' potrebbe essere 'individual', 'entity'
+        "datasets": [result.get("source")] if result.get("source") else [],  # 'source' è tipicamente una stringa come 'ofac', 'unsc', 'eu'
+        "referents": [],  # Sanctions.network non sembra avere un equivalente diretto per 'referents'
+        "score": result.get("score", 0),  # Assumendo che un campo score possa esistere, predefinito a 0
+        "match": True  # Per ora, assumi che qualsiasi risultato restituito sia una corrispondenza
+    }
+
+    # Estrai proprietà più dettagliate se disponibili
+    if sanction_info["schema"] == "Individual":  # Controlla in base al 'type' da Sanctions.network
+        sanction_info["birth_date"] = [result.get("birth_date")] if result.get("birth_date") else []
+        sanction_info["nationality"] = [result.get("nationality")] if result.get("nationality") else []
+        sanction_info["summary"] = result.get("summary", None)  # Se disponibile
+        sanction_info["position"] = [result.get("position")] if result.get("position") else []  # Se disponibile
+        sanction_info["alias"] = result.get("aliases", [])  # Assumendo il campo 'aliases' per altri nomi
+
+    if score is not None:
+        sanction_info["score"] = score
+        sanction_info["match"] = score >= MATCH_THRESHOLD
+    return sanction_info
+
+async def search_opensanctions_async(nome, cognome):
     """
     Cerca un soggetto su Sanctions.network, adattando la risposta al formato originale.
+    Coroutine da eseguire sull'event loop condiviso (modules/async_runtime.py).
     """
     query = f"{nome} {cognome}".strip()
     if not query:
@@ -23,8 +93,13 @@ def search_opensanctions(nome, cognome):
     results_list = []
     raw_response_data = None
     try:
-        print(f"[Sanctions.network] Inizio ricerca per: {query}")
-        response = requests.get(OPEN_SANCTIONS_API_URL, params=params, timeout=15)
+        logger.info("[Sanctions.network] Inizio ricerca per: %s", query)
+        # Client condiviso con retry/backoff e circuit breaker (vedi modules/http_client.py)
+        # Richiesta condizionale: se la lista non è cambiata (304) si riutilizza la risposta precedente.
+        # Nessun nuovo tentativo oltre SANCTIONS_TIMEOUT: la sorgente verrebbe comunque annullata
+        response = await async_request_with_retry("GET", OPEN_SANCTIONS_API_URL, service="sanctions_network", params=params,
+                                                  timeout=15, conditional=True,
+                                                  deadline=time.monotonic() + SANCTIONS_TIMEOUT)
         response.raise_for_status()  # Solleva un'eccezione per errori HTTP (4xx o 5xx)
 
         raw_response_data = response.json()
@@ -32,30 +107,9 @@ def search_opensanctions(nome, cognome):
         # Sanctions.network restituisce un elenco di dizionari direttamente se ha successo
         if raw_response_data and isinstance(raw_response_data, list):
             for result in raw_response_data:
-                # Mappa i campi di Sanctions.network alla struttura originale simile a OpenSanctions
-                # Nota: la disponibilità dei campi e i nomi esatti potrebbero richiedere test sull'API effettiva
-                # e potenzialmente l'uso del parametro 'select' per coerenza.
-                sanction_info = {
-                    "id": result.get("id", f"sn-{result.get('names', ['unknown'])[0] if result.get('names') else 'unknown'}"),  # Usa il loro ID o generane uno
-                    "caption": result.get("names", [query])[0] if result.get("names") else query,  # Usa il primo nome da 'names' come didascalia
-                    "schema": result.get("type", "Unknown").capitalize(),  # 'type' potrebbe essere 'individual', 'entity'
-                    "datasets": [result.get("source")] if result.get("source") else [],  # 'source' è tipicamente una stringa come 'ofac', 'unsc', 'eu'
-                    "referents": [],  # Sanctions.network non sembra avere un equivalente diretto per 'referents'
-                    "score": result.get("score", 0),  # Assumendo che un campo score possa esistere, predefinito a 0
-                    "match": True  # Per ora, assumi che qualsiasi risultato restituito sia una corrispondenza
-                }
-
-                # Estrai proprietà più dettagliate se disponibili
-                if sanction_info["schema"] == "Individual":  # Controlla in base al 'type' da Sanctions.network
-                    sanction_info["birth_date"] = [result.get("birth_date")] if result.get("birth_date") else []
-                    sanction_info["nationality"] = [result.get("nationality")] if result.get("nationality") else []
-                    sanction_info["summary"] = result.get("summary", None)  # Se disponibile
-                    sanction_info["position"] = [result.get("position")] if result.get("position") else []  # Se disponibile
-                    sanction_info["alias"] = result.get("aliases", [])  # Assumendo il campo 'aliases' per altri nomi
-
-                results_list.append(sanction_info)
-
-            print(f"[Sanctions.network] Trovati {len(results_list)} risultati per: {query}")
+                results_list.append(build_sanction_info(result, query))
+
+            logger.info("[Sanctions.network] Trovati %d risultati per: %s", len(results_list), query)
             return {
                 "status": "successo",
                 "query": query,
@@ -64,24 +118,369 @@ def search_opensanctions(nome, cognome):
                 "raw_response": raw_response_data  # Utile per il debug o analisi più approfondite
             }
         else:
-            print(f"[Sanctions.network] Nessun risultato o formato risposta inatteso per: {query}")
+            logger.info("[Sanctions.network] Nessun risultato o formato risposta inatteso per: %s", query)
             return {"status": "vuoto", "query": query, "message": "Nessun risultato trovato o formato risposta inatteso.", "results": []}
-    except requests.exceptions.RequestException as e:
-        print(f"[Sanctions.network] Errore API per {query}: {e}")
+    except HTTP_ERRORS as e:
+        logger.warning("[Sanctions.network] Errore API per %s: %s", query, e)
         return {"status": "errore", "query": query, "message": str(e), "results": []}
     except Exception as e:
-        print(f"[Sanctions.network] Errore generico durante la ricerca per {query}: {e}")
+        logger.error("[Sanctions.network] Errore generico durante la ricerca per %s: %s", query, e)
         return {"status": "errore", "query": query, "message": f"Errore generico: {str(e)}", "results": []}
 
+def search_opensanctions(nome, cognome, cancel_event=None):
+    """Versione sincrona di search_opensanctions_async (eseguita sull'event loop condiviso)."""
+    query = f"{nome} {cognome}".strip()
+    return _run_source_sync(search_opensanctions_async(nome, cognome), query, cancel_event)
+
+def _run_source_sync(coro, query, cancel_event):
+    if cancel_event is not None and cancel_event.is_set():
+        coro.close()
+        return {"status": "errore", "query": query, "message": "Ricerca annullata.", "results": []}
+    try:
+        return run_sync(coro, cancel_event=cancel_event)
+    except asyncio.CancelledError:
+        return {"status": "errore", "query": query, "message": "Ricerca annullata.", "results": []}
+
+def search_sanctions_local(nome, cognome, cancel_event=None, limit=5):
+    """
+    Cerca un soggetto nell'indice locale delle sanzioni (modules/sanctions_index.py).
+    Restituisce la stessa struttura di search_opensanctions, con lo score di similarità reale.
+    """
+    query = f"{nome} {cognome}".strip()
+    if not query:
+        return {"status": "errore", "message": "Nome e cognome non possono essere vuoti.", "results": []}
+    if not index_available():
+        return {"status": "errore", "query": query, "message": "Indice locale delle sanzioni non disponibile.", "results": [], "backend": "local"}
+
+    try:
+        logger.info("[SanctionsIndex] Inizio ricerca locale per: %s", query)
+        with span("sanctions.match_local"):
+            matches = match_name(query, limit=limit)
+    except Exception as e:
+        logger.error("[SanctionsIndex] Errore durante la ricerca locale per %s: %s", query, e)
+        return {"status": "errore", "query": query, "message": f"Errore generico: {str(e)}", "results": [], "backend": "local"}
+
+    if not matches:
+        logger.info("[SanctionsIndex] Nessun risultato per: %s", query)
+        return {"status": "vuoto", "query": query, "message": "Nessun risultato trovato nell'indice locale.", "results": [], "backend": "local"}
+
+    results_list = []
+    for record, score, matched_name in matches:
+        sanction_info = build_sanction_info(record, query, score=score)
+        sanction_info["matched_name"] = matched_name  # Nome o alias che ha prodotto la corrispondenza
+        results_list.append(sanction_info)
+    logger.info("[SanctionsIndex] Trovati %d risultati per: %s", len(results_list), query)
+    return {"status": "successo", "query": query, "count": len(results_list), "results": results_list, "backend": "local"}
+
+async def _dork_urls(future, deadline):
+    """URL di un dork accodato allo scheduler; solleva asyncio.TimeoutError se non arrivano entro 'deadline'."""
+    if future.done():  # Evita che un risultato già disponibile sia scambiato per un timeout allo scadere
+        return future.result()
+    # shield: annullare l'attesa non deve annullare il dork, che altri soggetti potrebbero attendere
+    waiter = asyncio.shield(asyncio.wrap_future(future))
+    if deadline is None:
+        return await waiter
+    return await asyncio.wait_for(waiter, max(deadline - time.monotonic(), 0))
+
+async def search_google_dorks_anagrafica_async(nome, cognome, num_results=5, lang='it', timeout=GOOGLE_DORKS_TIMEOUT):
+    """
+    Esegue ricerche Google mirate per informazioni anagrafiche (coroutine per l'event loop condiviso).
+    Trascorsi 'timeout' secondi i dork non ancora eseguiti vengono scartati e si restituiscono gli URL già
+    trovati (i dork scartati compaiono con un errore); lo stesso se la coroutine viene annullata prima.
+    """
+    query_base = f'"{nome} {cognome}"'  # Cerca la frase esatta
+    dorks = [template.format(query=query_base) for template in ANAGRAFICA_DORKS]
+
+    # I dork sono eseguiti dallo scheduler globale (modules/dork_scheduler.py), che rispetta il budget
+    # di query condiviso tra tutti i soggetti: qui si accodano tutti e si raccolgono i risultati in ordine.
+    scheduler = get_scheduler()
+    logger.info("[GoogleDorks] Inizio ricerca anagrafica per: %s %s", nome, cognome)
+    futures = [(dork, scheduler.submit(dork, owner=f"{nome} {cognome}", num_results=num_results, lang=lang)) for dork in dorks]
+
+    deadline = time.monotonic() + timeout if timeout else None
+    all_dork_results = []
+    for index, (dork, future) in enumerate(futures):
+        try:
+            urls = await _dork_urls(future, deadline)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            # Gli URL già raccolti restano validi: si scartano solo i dork non ancora eseguiti
+            reason = "Timeout" if isinstance(e, asyncio.TimeoutError) else "Ricerca annullata"
+            logger.warning("[GoogleDorks] %s per %s %s: %d dork su %d non eseguiti", reason, nome, cognome,
+                           len(futures) - index, len(futures))
+            for pending_dork, pending in futures[index:]:
+                scheduler.release(pending)
+                all_dork_results.append({"dork_query": pending_dork, "error": f"{reason}: dork non eseguito"})
+            break
+        except Exception as e:
+            logger.warning("[GoogleDorks] Errore durante l'esecuzione del dork '%s': %s", dork, e)
+            all_dork_results.append({
+                "dork_query": dork,
+                "error": str(e)
+            })
+            continue
+        for url in urls:
+            all_dork_results.append({
+                "dork_query": dork,
+                "url_found": url
+            })
+
+    if all_dork_results:
+        logger.info("[GoogleDorks] Trovati %d potenziali URL per: %s %s", len(all_dork_results), nome, cognome)
+        return {
+            "status": "successo",
+            "query": f"{nome} {cognome}",
+            "count": len(all_dork_results),
+            "results": all_dork_results
+        }
+    else:
+        logger.info("[GoogleDorks] Nessun URL trovato per: %s %s", nome, cognome)
+        return {"status": "vuoto", "query": f"{nome} {cognome}", "message": "Nessun URL trovato tramite Google Dorks.", "results": []}
+
+def search_google_dorks_anagrafica(nome, cognome, num_results=5, lang='it', cancel_event=None):
+    """
+    Versione sincrona di search_google_dorks_anagrafica_async. Se 'cancel_event' viene impostato
+    i dork non ancora eseguiti vengono scartati.
+    """
+    return _run_source_sync(search_google_dorks_anagrafica_async(nome, cognome, num_results=num_results, lang=lang),
+                            f"{nome} {cognome}", cancel_event)
+
+# Sorgenti registrate del modulo M1: chiave nel risultato -> funzione, timeout dedicato e costo
+# (interrogazioni per variante del nome, conteggiate nel budget del soggetto).
+# "async_func" è una coroutine (nome, cognome) eseguita sull'event loop condiviso; le sorgenti che ne
+# sono prive (es. l'indice locale, che lavora su SQLite) usano "func", che riceve (nome, cognome,
+# cancel_event=...) e gira in un thread. Entrambe restituiscono il dizionario status/results.
+# "cache_namespace", se presente, prefissa la chiave di cache (es. il backend della sorgente).
+M1_SOURCES = {
+    "sanctions_network": {
+        "func": search_sanctions_local if SANCTIONS_BACKEND == "local" else search_opensanctions,
+        "async_func": None if SANCTIONS_BACKEND == "local" else search_opensanctions_async,
+        "cache_namespace": SANCTIONS_BACKEND,  # Le risposte dei due backend non si mescolano in cache
+        "timeout": SANCTIONS_TIMEOUT,
+        "cost": 1
+    },
+    "google_dorks_anagrafica": {"func": search_google_dorks_anagrafica, "async_func": search_google_dorks_anagrafica_async,
+                                "timeout": GOOGLE_DORKS_TIMEOUT + DORK_RESULT_GRACE, "cost": len(ANAGRAFICA_DORKS)},
+}
+
+def _cache_key(spec, variant):
+    namespace = spec.get("cache_namespace")
+    return f"{namespace}:{variant['chiave']}" if namespace else variant["chiave"]
+
+async def _timed_call(key, spec, nome, cognome):
+    """Esegue la sorgente entro il suo timeout. Restituisce (risultato, secondi); solleva asyncio.TimeoutError."""
+    start = time.monotonic()
+    cancel_event = threading.Event()
+    with span(f"source.{key}"):
+        if spec.get("async_func"):
+            call = spec["async_func"](nome, cognome)
+        else:
+            call = asyncio.to_thread(spec["func"], nome, cognome, cancel_event=cancel_event)
+        try:
+            result = await asyncio.wait_for(call, timeout=spec["timeout"])
+        except asyncio.TimeoutError:
+            cancel_event.set()  # Le sorgenti sincrone si fermano al prossimo controllo
+            raise
+    return result, time.monotonic() - start
+
+def _attribute(item, variant):
+    """Copia del risultato con l'attribuzione alla variante del nome che l'ha prodotto."""
+    return dict(item, variante=f"{variant['nome']} {variant['cognome']}".strip(), variante_tipo=variant["tipo"])
+
+def _merge_key(item):
+    if item.get("id"):
+        return "id", item["id"]
+    return "contenuto", json.dumps(item, sort_keys=True, default=str)
+
+def merge_variant_results(variant_results):
+    """
+    Unisce i risultati di una sorgente ottenuti per più varianti del nome (in ordine di peso).
+    Ogni elemento riporta la variante che l'ha trovato (variante, variante_tipo); gli elementi con lo stesso id
+    trovati da più varianti compaiono una volta, con le altre varianti in varianti_corrispondenti e lo score
+    più alto. Lo status è "successo" se almeno una variante ha trovato qualcosa, altrimenti "errore" se una
+    variante è fallita, altrimenti "vuoto". raw_response è quella della variante principale.
+    """
+    primary_variant, primary = variant_results[0]
+    merged_items = {}
+    for variant, result in variant_results:
+        for item in result.get("results", []):
+            key = _merge_key(item)
+            existing = merged_items.get(key)
+            if existing is None:
+                merged_items[key] = _attribute(item, variant)
+                continue
+            existing.setdefault("varianti_corrispondenti", []).append(f"{variant['nome']} {variant['cognome']}".strip())
+            if item.get("score", 0) > existing.get("score", 0):
+                existing.update({field: value for field, value in item.items() if field not in ("variante", "variante_tipo")})
+
+    statuses = [result.get("status") for _, result in variant_results]
+    merged = {key: value for key, value in primary.items() if key not in ("results", "count", "message")}
+    merged["results"] = list(merged_items.values())
+    merged["count"] = len(merged["results"])
+    if "successo" in statuses:
+        merged["status"] = "successo"
+    elif "errore" in statuses:
+        merged["status"] = "errore"
+        merged["message"] = next(result.get("message") for _, result in variant_results if result.get("status") == "errore")
+    else:
+        merged["status"] = "vuoto"
+        merged["message"] = primary.get("message")
+    merged["query"] = primary.get("query", f"{primary_variant['nome']} {primary_variant['cognome']}")
+    hits = [result.get("cache_hit") for _, result in variant_results]
+    merged["cache_hit"] = all(hits)
+    ages = [result.get("cache_age_s") for _, result in variant_results if result.get("cache_age_s") is not None]
+    merged["cache_age_s"] = max(ages) if merged["cache_hit"] and ages else None
+    merged["varianti_interrogate"] = [
+        {"nome": variant["nome"], "cognome": variant["cognome"], "tipo": variant["tipo"],
+         "status": result.get("status"), "count": result.get("count", 0)}
+        for variant, result in variant_results
+    ]
+    return merged
+
+async def run_sources_async(nome, cognome, sources=None, plan=None):
+    """
+    Esegue in parallelo sull'event loop condiviso tutte le sorgenti registrate, ognuna con il proprio timeout.
+    Le sorgenti che sforano il timeout vengono annullate e riportate con status "errore":
+    i risultati delle altre sono comunque restituiti. In "tempi_sorgenti" il tempo reale di ciascuna.
+    Le risposte in cache (modules/cache.py) sono restituite con cache_hit=True e la loro età in cache_age_s.
+    'plan' ({chiave_sorgente: [varianti]}, vedi modules/name_variants.py) indica le varianti del nome da
+    interrogare per ogni sorgente; i risultati delle varianti vengono uniti con merge_variant_results.
+    """
+    sources = sources if sources is not None else M1_SOURCES
+    if plan is None:
+        original = {"nome": nome, "cognome": cognome, "tipo": "originale", "chiave": normalize_name(nome, cognome)}
+        plan = {key: [original] for key in sources}
+    tasks = [(key, index, variant) for key in sources for index, variant in enumerate(plan.get(key, []))]
+    task_results = {}
+    task_timings = {}
+
+    # Le interrogazioni con una risposta fresca in cache non vengono eseguite (la cache su SQLite si legge in un thread)
+    cached_values = await asyncio.to_thread(lambda: [cache_get(key, _cache_key(sources[key], variant)) for key, _, variant in tasks])
+    pending = []
+    for (key, index, variant), cached in zip(tasks, cached_values):
+        if cached is not None:
+            value, age = cached
+            task_results[(key, index)] = dict(value, cache_hit=True, cache_age_s=round(age, 1))
+            task_timings[(key, index)] = {"wall_time_s": 0.0, "timed_out": False}
+        else:
+            pending.append((key, index, variant))
+
+    start = time.monotonic()
+    outcomes = await asyncio.gather(
+        *(_timed_call(key, sources[key], variant["nome"], variant["cognome"]) for key, _, variant in pending),
+        return_exceptions=True
+    )
+
+    to_cache = []
+    for (key, index, variant), outcome in zip(pending, outcomes):
+        if isinstance(outcome, asyncio.TimeoutError):
+            logger.warning("Timeout della sorgente '%s' dopo %ss", key, sources[key]['timeout'])
+            task_results[(key, index)] = {"status": "errore", "message": f"Timeout dopo {sources[key]['timeout']}s", "results": [],
+                                          "cache_hit": False, "cache_age_s": None}
+            task_timings[(key, index)] = {"wall_time_s": round(time.monotonic() - start, 3), "timed_out": True}
+        elif isinstance(outcome, BaseException):
+            if isinstance(outcome, asyncio.CancelledError):
+                raise outcome
+            logger.error("Errore imprevisto nella sorgente '%s': %s", key, outcome)
+            task_results[(key, index)] = {"status": "errore", "message": f"Errore generico: {str(outcome)}", "results": [],
+                                          "cache_hit": False, "cache_age_s": None}
+            task_timings[(key, index)] = {"wall_time_s": round(time.monotonic() - start, 3), "timed_out": False}
+        else:
+            result, elapsed = outcome
+            task_timings[(key, index)] = {"wall_time_s": round(elapsed, 3), "timed_out": False}
+            # Gli errori non vengono memorizzati: la prossima richiesta riproverà la sorgente
+            if is_cacheable(key) and result.get("status") in ("successo", "vuoto"):
+                to_cache.append((key, _cache_key(sources[key], variant), result))
+            task_results[(key, index)] = dict(result, cache_hit=False, cache_age_s=None)
+    if to_cache:
+        subject_key = normalize_name(nome, cognome)
+        await asyncio.to_thread(lambda: [cache_set(key, cache_key, result, subject_key=subject_key)
+                                         for key, cache_key, result in to_cache])
+
+    results = {}
+    timings = {}
+    for key in sources:
+        variants = plan.get(key, [])
+        if not variants:
+            continue
+        variant_results = [(variant, task_results[(key, index)]) for index, variant in enumerate(variants)]
+        results[key] = variant_results[0][1] if len(variants) == 1 else merge_variant_results(variant_results)
+        if len(variants) == 1:
+            results[key]["results"] = [_attribute(item, variants[0]) for item in results[key].get("results", [])]
+        source_timings = [task_timings[(key, index)] for index in range(len(variants))]
+        timings[key] = {
+            "wall_time_s": max(timing["wall_time_s"] for timing in source_timings),
+            "timed_out": any(timing["timed_out"] for timing in source_timings),
+            "interrogazioni": len(variants),
+        }
+    results["tempi_sorgenti"] = timings
+    return results
+
+def run_sources_concurrently(nome, cognome, sources=None, plan=None):
+    """Versione sincrona di run_sources_async."""
+    return run_sync(run_sources_async(nome, cognome, sources=sources, plan=plan))
+
+# Funzione combinata per il modulo M1
+async def get_identita_anagrafica_async(nome, cognome, varianti=None):
+    """
+    Funzione principale del modulo M1 per raccogliere dati anagrafici.
+    Interroga in parallelo tutte le sorgenti registrate in M1_SOURCES (Sanctions.network e Google Dorks)
+    con il nome originale e le sue varianti (modules/name_variants.py, più quelle indicate in 'varianti'),
+    entro il budget di interrogazioni per soggetto M1_VARIANT_QUERY_BUDGET.
+    """
+    logger.info("Avvio modulo per: %s %s", nome, cognome)
+    variants = generate_variants(nome, cognome, varianti)
+    plan = plan_queries(variants, {key: spec.get("cost", 1) for key, spec in M1_SOURCES.items()}, VARIANT_QUERY_BUDGET)
+    results = await run_sources_async(nome, cognome, plan=plan)
+    results["varianti_interrogate"] = [
+        {"nome": variant["nome"], "cognome": variant["cognome"], "tipo": variant["tipo"],
+         "sorgenti": [key for key, assigned in plan.items() if variant in assigned]}
+        for variant in variants if any(variant in assigned for assigned in plan.values())
+    ]
+    logger.info("Tempi per sorgente: %s", results['tempi_sorgenti'])
+    return results
+
+def get_identita_anagrafica(nome, cognome, varianti=None):
+    """Versione sincrona di get_identita_anagrafica_async (entry_point del registro)."""
+    return run_sync(get_identita_anagrafica_async(nome, cognome, varianti=varianti))
+
+def map_results(m1_results):
+    """
+    Converte l'output di get_identita_anagrafica nelle righe da salvare (result_mapper del registro):
+    lista di tuple (data_category, source_api, reliability_score, content_data).
+    L'affidabilità è assegnata dopo, con la deduplicazione, dalle regole di modules/scoring.py.
+    """
+    rows = []
+    # Risultati di Sanctions.network
+    if m1_results["sanctions_network"]["status"] == "successo" and m1_results["sanctions_network"]["results"]:
+        source_api = "SanctionsIndexLocale" if m1_results["sanctions_network"].get("backend") == "local" else "Sanctions.network"
+        for res_item in m1_results["sanctions_network"]["results"]:
+            rows.append(("anagrafica_sanzioni", source_api, None, res_item))
+
+    # Risultati dei Google Dorks
+    if m1_results["google_dorks_anagrafica"]["status"] == "successo" and m1_results["google_dorks_anagrafica"]["results"]:
+        for res_item in m1_results["google_dorks_anagrafica"]["results"]:
+            if "url_found" in res_item:  # Salva solo se c'è un URL, non errori
+                rows.append(("anagrafica_google_dork_url", "GoogleDorks", None, res_item))  # Contiene dork_query e url_found
+    return rows
+
 if __name__ == '__main__':
-    print("Test del modulo Sanctions.network...")
+    from telemetry import setup_logging
+    setup_logging()
+    print("Test del modulo M1 Anagrafica Combinato...")
+    
     # Test con un individuo sanzionato noto (es. da liste OFAC o ONU)
-    test_results = search_opensanctions("Viktor", "Yanukovych")
-    # test_results = search_opensanctions("Mario", "Rossi")  # Per un caso senza risultati
-
-    if test_results["status"] == "successo":
-        print(f"Risultati per '{test_results['query']}':")
-        for res in test_results["results"]:
+    # test_subject_nome = "Viktor"
+    # test_subject_cognome = "Yanukovych"
+    test_subject_nome = "Mario"  # Test con nome comune
+    test_subject_cognome = "Rossi"
+    
+    # Chiamata alla funzione combinata
+    anagrafica_data = get_identita_anagrafica(test_subject_nome, test_subject_cognome)
+    
+    print("\n--- Risultati Sanctions.network ---")
+    if anagrafica_data["sanctions_network"]["status"] == "successo":
+        print(f"Trovati {anagrafica_data['sanctions_network']['count']} risultati per '{anagrafica_data['sanctions_network']['query']}'")
+        for res in anagrafica_data["sanctions_network"]["results"]:
             print(f" ID: {res.get('id')}, Caption: {res.get('caption')}, Source: {res.get('datasets')}, Score: {res.get('score')}")
             if "birth_date" in res and res["birth_date"]:
                 print(f" Date di Nascita: {', '.join(res['birth_date'])}")
@@ -90,7 +489,16 @@ if __name__ == '__main__':
             if "alias" in res and res["alias"]:
                 print(f" Alias: {res['alias']}")
             print("-" * 20)
-    elif test_results["status"] == "errore":
-        print(f"Errore: {test_results['message']}")
     else:
-        print(f"Nessun risultato per '{test_results['query']}' o altro status: {test_results['status']}")
\ No newline at end of file
+        print(f"Sanctions.network status: {anagrafica_data['sanctions_network']['status']} - {anagrafica_data['sanctions_network'].get('message')}")
+    
+    print("\n--- Risultati Google Dorks Anagrafica ---")
+    if anagrafica_data["google_dorks_anagrafica"]["status"] == "successo":
+        print(f"Trovati {anagrafica_data['google_dorks_anagrafica']['count']} URL per '{anagrafica_data['google_dorks_anagrafica']['query']}'")
+        for res in anagrafica_data["google_dorks_anagrafica"]["results"]:
+            if "url_found" in res:
+                print(f" Dork: '{res['dork_query']}' -> URL: {res['url_found']}")
+            elif "error" in res:
+                print(f" Dork: '{res['dork_query']}' -> Errore: {res['error']}")
+    else:
+        print(f"Google Dorks status: {anagrafica_data['google_dorks_anagrafica']['status']} - {anagrafica_data['google_dorks_anagrafica'].get('message')}")
@@ -0,0 +1,189 @@
+import os
+import re
+from modules.normalization import fold_accents, normalize_name
+
+# Generatore di varianti di un nome per le ricerche delle sorgenti: traslitterazione (cirillico, umlaut,
+# grafie slave), rimozione dei diacritici, inversione nome/cognome, iniziale del nome e grafie alternative
+# comuni dei cognomi italiani e slavi. Le varianti sono ordinate per peso (quanto è probabile che indichino
+# la stessa persona) e deduplicate per chiave normalizzata: varianti che si riducono alla stessa chiave
+# (es. 'Šimić' e 'Simic') producono una sola interrogazione.
+
+VARIANT_MAX = int(os.getenv("NAME_VARIANTS_MAX", "8"))  # Varianti massime per soggetto, originale incluso
+
+# Peso di ciascun tipo di variante: determina l'ordine e quindi quali varianti rientrano nel budget
+VARIANT_WEIGHTS = {
+    "originale": 1.0,
+    "fornita": 0.95,  # Indicata dal chiamante nel campo 'varianti'
+    "traslitterazione": 0.8,
+    "diacritici": 0.75,
+    "grafia": 0.6,
+    "inversione": 0.5,
+    "iniziale": 0.3,
+}
+
+# Cirillico -> latino (traslitterazione anglosassone semplificata, usata dalle liste sanzioni)
+_CYRILLIC = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "e", "ж": "zh", "з": "z", "и": "i",
+    "й": "y", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o", "п": "p", "р": "r", "с": "s", "т": "t",
+    "у": "u", "ф": "f", "х": "kh", "ц": "ts", "ч": "ch", "ш": "sh", "щ": "shch", "ъ": "", "ы": "y", "ь": "",
+    "э": "e", "ю": "yu", "я": "ya", "є": "ye", "і": "i", "ї": "yi", "ґ": "g", "ђ": "dj", "ј": "j", "љ": "lj",
+    "њ": "nj", "ћ": "c", "џ": "dz",
+}
+
+# Lettere con diacritici trascritte foneticamente (alternativa alla semplice rimozione dell'accento)
+_PHONETIC = {
+    "ä": "ae", "ö": "oe", "ü": "ue", "ß": "ss",
+    "š": "sh", "č": "ch", "ć": "ch", "ž": "zh", "ł": "l", "ř": "rz", "ś": "s", "ź": "z", "ż": "z", "đ": "dj",
+}
+
+# Desinenze slave con più grafie diffuse (il primo elemento di ogni gruppo è la forma di riferimento)
+_SLAVIC_ENDINGS = [
+    ("ovich", "ovic", "ovitch", "ovych"),
+    ("evich", "evic", "evitch", "evych"),
+    ("ich", "ic", "itch"),
+    ("sky", "ski", "skiy", "skyi"),
+    ("ov", "off"),
+    ("ev", "eff"),
+]
+
+# Particelle dei cognomi italiani: "De Luca", "Deluca", "D'Angelo", "Dangelo", "D Angelo"
+_PARTICLE_RE = re.compile(r"^(d|de|di|del|della|dell|dello|lo|la|li)(?:'\s*|\s+)(\w.*)$", re.IGNORECASE)
+_APOSTROPHE_RE = re.compile(r"^(\w+)'(\w.*)$")
+
+
+def transliterate(text):
+    """Traslittera i caratteri cirillici in latino, mantenendo le maiuscole iniziali."""
+    out = []
+    for ch in text:
+        latin = _CYRILLIC.get(ch.lower())
+        if latin is None:
+            out.append(ch)
+        else:
+            out.append(latin.capitalize() if ch.isupper() else latin)
+    return "".join(out)
+
+
+def _phonetic(text):
+    out = []
+    for ch in text:
+        mapped = _PHONETIC.get(ch.lower())
+        if mapped is None:
+            out.append(ch)
+        else:
+            out.append(mapped.capitalize() if ch.isupper() else mapped)
+    return "".join(out)
+
+
+def _spelling_variants(surname):
+    """Grafie alternative di un cognome: particelle italiane e desinenze slave."""
+    variants = []
+    particle = _PARTICLE_RE.match(surname)
+    if particle:
+        prefix, rest = particle.groups()
+        variants.append(f"{prefix}{rest.lower()}".capitalize())  # Deluca, Dangelo
+        variants.append(f"{prefix} {rest}")  # De Luca, D Angelo
+    else:
+        apostrophe = _APOSTROPHE_RE.match(surname)
+        if apostrophe:
+            variants.append(f"{apostrophe.group(1)}{apostrophe.group(2).lower()}")
+
+    lowered = surname.lower()
+    for group in _SLAVIC_ENDINGS:
+        ending = next((e for e in group if lowered.endswith(e)), None)
+        if ending is None:
+            continue
+        stem = surname[:len(surname) - len(ending)]
+        variants.extend(stem + alternative for alternative in group if alternative != ending)
+        break
+    return variants
+
+
+def _parse_supplied(variant):
+    """
+    Variante fornita dal chiamante: {"nome": ..., "cognome": ...} oppure stringa "Nome Cognome".
+    Restituisce None per gli altri tipi (es. null o numeri nel JSON), che vengono ignorati.
+    """
+    if isinstance(variant, dict):
+        nome, cognome = variant.get("nome"), variant.get("cognome")
+        return (nome.strip() if isinstance(nome, str) else "", cognome.strip() if isinstance(cognome, str) else "")
+    if not isinstance(variant, str):
+        return None
+    parts = variant.split()
+    if len(parts) < 2:
+        return "", " ".join(parts)
+    return " ".join(parts[:-1]), parts[-1]
+
+
+def generate_variants(nome, cognome, varianti=None, max_variants=VARIANT_MAX):
+    """
+    Varianti ordinate per peso decrescente, deduplicate per chiave normalizzata: lista di dizionari
+    {"nome", "cognome", "tipo", "peso", "chiave"}. La prima è sempre il nome originale.
+    'varianti' sono varianti aggiuntive fornite dal chiamante (dizionari o stringhe).
+    """
+    nome = (nome or "").strip()
+    cognome = (cognome or "").strip()
+    candidates = [(nome, cognome, "originale")]
+    for variant in varianti or []:
+        supplied = _parse_supplied(variant)
+        if supplied is not None:
+            candidates.append((*supplied, "fornita"))
+
+    latin_nome, latin_cognome = transliterate(nome), transliterate(cognome)
+    if (latin_nome, latin_cognome) != (nome, cognome):
+        candidates.append((latin_nome, latin_cognome, "traslitterazione"))
+    phonetic_nome, phonetic_cognome = _phonetic(latin_nome), _phonetic(latin_cognome)
+    if (phonetic_nome, phonetic_cognome) != (latin_nome, latin_cognome):
+        candidates.append((phonetic_nome, phonetic_cognome, "traslitterazione"))
+    folded_nome, folded_cognome = fold_accents(latin_nome), fold_accents(latin_cognome)
+    candidates.append((folded_nome, folded_cognome, "diacritici"))
+
+    for surname in _spelling_variants(folded_cognome):
+        candidates.append((folded_nome, surname, "grafia"))
+    candidates.append((cognome, nome, "inversione"))
+    if folded_nome:
+        candidates.append((f"{folded_nome[0].upper()}.", folded_cognome, "iniziale"))
+
+    seen = set()
+    variants = []
+    for index, (variant_nome, variant_cognome, kind) in enumerate(candidates):
+        key = normalize_name(variant_nome, variant_cognome)
+        if not key or key in seen or not variant_cognome:
+            continue
+        seen.add(key)
+        variants.append({
+            "nome": variant_nome,
+            "cognome": variant_cognome,
+            "tipo": kind,
+            "peso": VARIANT_WEIGHTS[kind],
+            "chiave": key,
+            "_ordine": index,
+        })
+    # L'ordinamento è stabile: a parità di peso resta l'ordine di generazione
+    variants.sort(key=lambda v: (-v["peso"], v["_ordine"]))
+    for variant in variants:
+        del variant["_ordine"]
+    return variants[:max_variants]
+
+
+def plan_queries(variants, source_costs, budget):
+    """
+    Distribuisce le varianti tra le sorgenti entro il budget di interrogazioni del soggetto.
+    'source_costs' è {chiave_sorgente: interrogazioni per variante}; l'originale è sempre assegnato a tutte
+    le sorgenti, le altre varianti in ordine di peso finché il costo rientra nel budget residuo.
+    Restituisce {chiave_sorgente: [varianti]}.
+    """
+    plan = {source: [] for source in source_costs}
+    remaining = budget
+    for index, variant in enumerate(variants):
+        for source, cost in source_costs.items():
+            if index == 0 or cost <= remaining:
+                plan[source].append(variant)
+                remaining -= cost
+    return plan
+
+
+if __name__ == '__main__':
+    import sys
+    import json
+    for variant in generate_variants(*sys.argv[1:3]):
+        print(json.dumps(variant, ensure_ascii=False))
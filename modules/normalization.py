@@ -0,0 +1,20 @@
+import re
+import unicodedata
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def fold_accents(text):
+    """Rimuove i segni diacritici (es. 'Nicolò Šimić' -> 'Nicolo Simic')."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def normalize_name(*parts):
+    """
+    Chiave canonica di un nome: accenti rimossi, maiuscole/minuscole e spazi uniformati.
+    Accetta una o più parti (es. normalize_name(nome, cognome)); le parti vuote vengono ignorate.
+    """
+    text = " ".join(str(part) for part in parts if part)
+    text = fold_accents(text).casefold()
+    return _WHITESPACE_RE.sub(" ", text).strip()
@@ -0,0 +1,96 @@
+import os
+import asyncio
+import importlib
+import threading
+
+# Registro dei moduli OSINT. Ogni voce dichiara come invocare il modulo e come trattarne i risultati
+# senza importarlo: il codice del modulo viene caricato solo al primo utilizzo.
+#
+#   entry_point     "pacchetto.modulo:funzione", chiamata come funzione(nome, cognome, varianti=None)
+#   async_entry_point  facoltativo: coroutine con la stessa firma, eseguita sull'event loop condiviso
+#                   (modules/async_runtime.py) da pipeline.run_modules_async; senza, il modulo gira in un thread
+#   result_mapper   "pacchetto.modulo:funzione" che converte l'output nelle righe da salvare:
+#                   lista di tuple (data_category, source_api, reliability_score, content_data); le righe
+#                   sono poi deduplicate e valutate da modules/scoring.py (reliability_score None = decide lo scoring)
+#   audit_name      source_module usato negli eventi di audit del modulo
+#   sources         per ogni chiave-sorgente dell'output: etichetta leggibile e source_module di audit
+#   timeout         secondi massimi per l'intero modulo
+#   max_concurrency soggetti elaborati al massimo in parallelo da questo modulo nel processo
+#   async_max_concurrency  come max_concurrency, per le esecuzioni tramite async_entry_point
+#
+# OSINT_MODULES (elenco separato da virgole) limita i moduli abilitati; di default tutti quelli con enabled=True.
+
+MODULES = {
+    "m1_identita_anagrafica": {
+        "entry_point": "modules.m1_anagrafica:get_identita_anagrafica",
+        "async_entry_point": "modules.m1_anagrafica:get_identita_anagrafica_async",
+        "result_mapper": "modules.m1_anagrafica:map_results",
+        "audit_name": "M1_Identita_Anagrafica",
+        "sources": {
+            "sanctions_network": {"label": "Sanctions.network", "audit_name": "M1_Sanctions_Network"},
+            "google_dorks_anagrafica": {"label": "Google Dorks", "audit_name": "M1_Google_Dorks"},
+        },
+        "enabled": True,
+        "timeout": 150,
+        "max_concurrency": 8,
+        "async_max_concurrency": 500,
+    },
+}
+
+_loaded = {}
+_semaphores = {}
+_async_semaphores = {}
+_load_lock = threading.Lock()
+
+
+def enabled_modules():
+    """Nomi dei moduli abilitati, nell'ordine di dichiarazione."""
+    selected = os.getenv("OSINT_MODULES")
+    if selected:
+        wanted = {name.strip() for name in selected.split(",") if name.strip()}
+        return [name for name in MODULES if name in wanted]
+    return [name for name, spec in MODULES.items() if spec.get("enabled", True)]
+
+
+def get_spec(name):
+    return MODULES[name]
+
+
+def _resolve(path):
+    module_path, _, attribute = path.partition(":")
+    return getattr(importlib.import_module(module_path), attribute)
+
+
+def load(name):
+    """Importa il modulo al primo utilizzo. Restituisce (entry_point, result_mapper)."""
+    with _load_lock:
+        if name not in _loaded:
+            spec = MODULES[name]
+            _loaded[name] = (_resolve(spec["entry_point"]), _resolve(spec["result_mapper"]))
+            _semaphores[name] = threading.BoundedSemaphore(spec.get("max_concurrency", 4))
+        return _loaded[name]
+
+
+def load_async(name):
+    """Coroutine async_entry_point del modulo (importata al primo utilizzo), None se il modulo non la dichiara."""
+    load(name)
+    with _load_lock:
+        key = (name, "async")
+        if key not in _loaded:
+            path = MODULES[name].get("async_entry_point")
+            _loaded[key] = _resolve(path) if path else None
+            # Semaforo asyncio: va usato solo dall'event loop condiviso
+            _async_semaphores[name] = asyncio.BoundedSemaphore(MODULES[name].get("async_max_concurrency", 100))
+        return _loaded[key]
+
+
+def concurrency_slot(name):
+    """Semaforo che limita le esecuzioni parallele del modulo (disponibile dopo load())."""
+    load(name)
+    return _semaphores[name]
+
+
+def async_concurrency_slot(name):
+    """Semaforo asyncio che limita le esecuzioni parallele tramite async_entry_point (da usare con async with)."""
+    load_async(name)
+    return _async_semaphores[name]
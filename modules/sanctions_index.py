@@ -0,0 +1,313 @@
+import os
+import csv
+import json
+import sqlite3
+import logging
+import argparse
+import difflib
+import threading
+from pathlib import Path
+from modules.normalization import normalize_name
+
+# Indice locale delle liste sanzioni, alimentato da export bulk (CSV/JSON) e interrogabile offline.
+# I record sono salvati nel formato di Sanctions.network (names, type, source, aliases, ...) così che
+# la conversione in sanction_info resti quella di search_opensanctions.
+#
+# Blocking: ogni nome (principale o alias) è indicizzato per token interi e per prefisso/suffisso
+# di 4 caratteri dei token; i candidati vengono poi valutati con una similarità in [0, 1].
+# Le ricerche usano una connessione in sola lettura per thread, aperta alla prima ricerca e poi riutilizzata.
+
+SANCTIONS_INDEX_PATH = os.getenv("SANCTIONS_INDEX_PATH", "sanctions_index.db")
+MATCH_THRESHOLD = float(os.getenv("SANCTIONS_MATCH_THRESHOLD", "0.75"))  # Score minimo per considerare match=True
+MIN_SCORE = float(os.getenv("SANCTIONS_MIN_SCORE", "0.5"))  # Score minimo per restituire un candidato
+MAX_CANDIDATES = 5000  # Limite ai nomi valutati per query (i blocchi più rari vengono letti per primi)
+INGEST_CHUNK_SIZE = 5000
+BLOCK_AFFIX_LEN = 4
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+def _connect(path=None):
+    conn = sqlite3.connect(path or SANCTIONS_INDEX_PATH, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+def _reader(path=None):
+    """Connessione in sola lettura del thread corrente all'indice, aperta al primo utilizzo e poi riutilizzata."""
+    path = path or SANCTIONS_INDEX_PATH
+    readers = getattr(_local, "readers", None)
+    if readers is None:
+        readers = _local.readers = {}
+    conn = readers.get(path)
+    if conn is None:
+        conn = readers[path] = sqlite3.connect(f"{Path(path).resolve().as_uri()}?mode=ro", uri=True, timeout=30)
+    return conn
+
+
+def close_readers():
+    """Chiude le connessioni in sola lettura del thread corrente."""
+    for conn in getattr(_local, "readers", {}).values():
+        conn.close()
+    _local.readers = {}
+
+
+def init_index(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS entities (
+            id TEXT PRIMARY KEY,
+            record_json TEXT NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS names (
+            name_id INTEGER PRIMARY KEY,
+            entity_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            name_norm TEXT NOT NULL,
+            is_alias INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS name_blocks (
+            block_key TEXT NOT NULL,
+            name_id INTEGER NOT NULL,
+            PRIMARY KEY (block_key, name_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_names_entity ON names (entity_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_name_blocks_name ON name_blocks (name_id)")
+    conn.commit()
+
+
+def blocking_keys(name_norm):
+    """Chiavi di blocking di un nome normalizzato: token interi più prefisso e suffisso dei token lunghi."""
+    keys = set()
+    for token in name_norm.replace("-", " ").split():
+        keys.add(f"t:{token}")
+        if len(token) > BLOCK_AFFIX_LEN:
+            keys.add(f"p:{token[:BLOCK_AFFIX_LEN]}")
+            keys.add(f"s:{token[-BLOCK_AFFIX_LEN:]}")
+    return keys
+
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(query_norm, candidate_norm):
+    """
+    Similarità tra due nomi normalizzati, indipendente dall'ordine dei token (nome/cognome invertiti).
+    Media tra coefficiente di Dice sui trigrammi e rapporto di SequenceMatcher.
+    """
+    a = " ".join(sorted(query_norm.split()))
+    b = " ".join(sorted(candidate_norm.split()))
+    if not a or not b:
+        return 0.0
+    grams_a, grams_b = _trigrams(a), _trigrams(b)
+    dice = 2 * len(grams_a & grams_b) / (len(grams_a) + len(grams_b))
+    ratio = difflib.SequenceMatcher(None, a, b).ratio()
+    return round((dice + ratio) / 2, 4)
+
+
+def _split_list(value):
+    """I campi multi-valore possono arrivare come lista JSON o come stringa separata da ';'."""
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return [str(v).strip() for v in value if v and str(v).strip()]
+    return [part.strip() for part in str(value).split(";") if part.strip()]
+
+
+def _first(value):
+    values = _split_list(value)
+    return values[0] if values else None
+
+
+def normalize_record(raw):
+    """
+    Converte un record dell'export (CSV di OpenSanctions, JSON di Sanctions.network o simili)
+    nel formato di Sanctions.network. Restituisce None se il record non ha id o nomi.
+    """
+    names = _split_list(raw.get("names")) or _split_list(raw.get("name")) or _split_list(raw.get("caption"))
+    record_id = raw.get("id")
+    if not names or not record_id:
+        return None
+    return {
+        "id": str(record_id),
+        "names": names,
+        "aliases": _split_list(raw.get("aliases") or raw.get("alias")),
+        "type": (raw.get("type") or raw.get("schema") or "unknown").lower().replace("person", "individual"),
+        "source": _first(raw.get("source") or raw.get("dataset") or raw.get("datasets")),
+        "birth_date": _first(raw.get("birth_date")),
+        "nationality": _first(raw.get("nationality") or raw.get("countries")),
+        "summary": raw.get("summary") or raw.get("sanctions") or None,
+        "position": _first(raw.get("position")),
+    }
+
+
+def iter_export_records(path):
+    """Legge un export bulk: .csv, .json (lista di oggetti) o .jsonl/.ndjson (un oggetto per riga)."""
+    lower = path.lower()
+    with open(path, encoding="utf-8", newline="") as f:
+        if lower.endswith(".csv"):
+            yield from csv.DictReader(f)
+        elif lower.endswith((".jsonl", ".ndjson")):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            data = json.load(f)
+            yield from (data if isinstance(data, list) else data.get("results", []))
+
+
+def _write_chunk(conn, records):
+    # Lo stesso id ripetuto nel blocco: vale l'ultimo record, come tra blocchi diversi
+    records = list({r["id"]: r for r in records}.values())
+    ids = [r["id"] for r in records]
+    placeholders = ",".join("?" * len(ids))
+    # Re-ingest dello stesso id: si sostituiscono nomi e blocchi precedenti
+    conn.execute(f'''
+        DELETE FROM name_blocks WHERE name_id IN (SELECT name_id FROM names WHERE entity_id IN ({placeholders}))
+    ''', ids)
+    conn.execute(f"DELETE FROM names WHERE entity_id IN ({placeholders})", ids)
+    conn.executemany(
+        "INSERT OR REPLACE INTO entities (id, record_json) VALUES (?, ?)",
+        [(r["id"], json.dumps(r)) for r in records]
+    )
+
+    next_id = (conn.execute("SELECT COALESCE(MAX(name_id), 0) FROM names").fetchone()[0]) + 1
+    name_rows = []
+    block_rows = []
+    for record in records:
+        seen = set()
+        for is_alias, name in [(0, n) for n in record["names"]] + [(1, a) for a in record["aliases"]]:
+            name_norm = normalize_name(name)
+            if not name_norm or name_norm in seen:
+                continue
+            seen.add(name_norm)
+            name_rows.append((next_id, record["id"], name, name_norm, is_alias))
+            block_rows.extend((key, next_id) for key in blocking_keys(name_norm))
+            next_id += 1
+    conn.executemany("INSERT INTO names (name_id, entity_id, name, name_norm, is_alias) VALUES (?, ?, ?, ?, ?)", name_rows)
+    conn.executemany("INSERT OR IGNORE INTO name_blocks (block_key, name_id) VALUES (?, ?)", block_rows)
+    return len(name_rows)
+
+
+def ingest(paths, index_path=None, reset=False):
+    """Carica uno o più export nell'indice locale. Restituisce (record importati, nomi indicizzati, record scartati)."""
+    conn = _connect(index_path)
+    try:
+        if reset:
+            conn.executescript("DROP TABLE IF EXISTS name_blocks; DROP TABLE IF EXISTS names; DROP TABLE IF EXISTS entities;")
+        init_index(conn)
+        conn.execute("PRAGMA synchronous=OFF")  # Import bulk: in caso di crash basta ripetere l'ingest
+
+        indexed_names = skipped = 0
+        imported_ids = set()  # Lo stesso id ripetuto nell'export sostituisce il record precedente: si conta una volta
+        chunk = []
+        for path in paths:
+            logger.info("Import di %s", path)
+            for raw in iter_export_records(path):
+                record = normalize_record(raw)
+                if record is None:
+                    skipped += 1
+                    continue
+                chunk.append(record)
+                imported_ids.add(record["id"])
+                if len(chunk) >= INGEST_CHUNK_SIZE:
+                    indexed_names += _write_chunk(conn, chunk)
+                    conn.commit()
+                    chunk = []
+        if chunk:
+            indexed_names += _write_chunk(conn, chunk)
+        conn.commit()
+        imported = len(imported_ids)
+        conn.execute("ANALYZE")
+        logger.info("Importati %d record (%d nomi), scartati %d.", imported, indexed_names, skipped)
+        return imported, indexed_names, skipped
+    finally:
+        conn.close()
+
+
+def index_available(index_path=None):
+    path = index_path or SANCTIONS_INDEX_PATH
+    if not os.path.exists(path):
+        return False
+    conn = _reader(path)
+    return conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'entities'").fetchone() is not None
+
+
+def match_name(query, limit=5, index_path=None):
+    """
+    Cerca 'query' nell'indice locale. Restituisce fino a 'limit' tuple (record, score, nome_corrispondente),
+    una per entità (la migliore tra nome principale e alias), ordinate per score decrescente.
+    """
+    query_norm = normalize_name(query)
+    keys = blocking_keys(query_norm)
+    if not keys:
+        return []
+
+    conn = _reader(index_path)
+    placeholders = ",".join("?" * len(keys))
+    # Blocchi più selettivi per primi, così il limite MAX_CANDIDATES taglia quelli più generici
+    block_sizes = conn.execute(f'''
+        SELECT block_key, COUNT(*) FROM name_blocks WHERE block_key IN ({placeholders}) GROUP BY block_key ORDER BY 2
+    ''', list(keys)).fetchall()
+
+    candidate_ids = set()
+    for block_key, _ in block_sizes:
+        rows = conn.execute(
+            "SELECT name_id FROM name_blocks WHERE block_key = ? LIMIT ?", (block_key, MAX_CANDIDATES - len(candidate_ids))
+        ).fetchall()
+        candidate_ids.update(row[0] for row in rows)
+        if len(candidate_ids) >= MAX_CANDIDATES:
+            break
+    if not candidate_ids:
+        return []
+
+    best = {}  # entity_id -> (score, nome)
+    id_list = list(candidate_ids)
+    for i in range(0, len(id_list), 900):  # Limite dei parametri SQLite
+        batch = id_list[i:i + 900]
+        rows = conn.execute(
+            f"SELECT entity_id, name, name_norm FROM names WHERE name_id IN ({','.join('?' * len(batch))})", batch
+        ).fetchall()
+        for entity_id, name, name_norm in rows:
+            score = similarity(query_norm, name_norm)
+            if score >= MIN_SCORE and score > best.get(entity_id, (0, None))[0]:
+                best[entity_id] = (score, name)
+
+    top = sorted(best.items(), key=lambda item: item[1][0], reverse=True)[:limit]
+    matches = []
+    for entity_id, (score, name) in top:
+        row = conn.execute("SELECT record_json FROM entities WHERE id = ?", (entity_id,)).fetchone()
+        if row:
+            matches.append((json.loads(row[0]), score, name))
+    return matches
+
+
+if __name__ == '__main__':
+    from telemetry import setup_logging
+
+    parser = argparse.ArgumentParser(description="Indice locale delle liste sanzioni")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    ingest_parser = subparsers.add_parser("ingest", help="Importa export bulk CSV/JSON/JSONL nell'indice")
+    ingest_parser.add_argument("files", nargs="+")
+    ingest_parser.add_argument("--index", default=None, help="Percorso del database indice (default: SANCTIONS_INDEX_PATH)")
+    ingest_parser.add_argument("--reset", action="store_true", help="Ricostruisce l'indice da zero")
+    search_parser = subparsers.add_parser("search", help="Cerca un nome nell'indice")
+    search_parser.add_argument("name")
+    search_parser.add_argument("--index", default=None)
+    search_parser.add_argument("--limit", type=int, default=5)
+    args = parser.parse_args()
+    setup_logging()
+
+    if args.command == "ingest":
+        ingest(args.files, index_path=args.index, reset=args.reset)
+    else:
+        for record, score, matched in match_name(args.name, limit=args.limit, index_path=args.index):
+            print(f" {score:.3f}  {record['id']}  {matched}  ({record.get('source')})")
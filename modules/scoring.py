@@ -0,0 +1,203 @@
+import os
+import json
+import logging
+import threading
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from telemetry import counter
+
+# Post-elaborazione delle righe prodotte dai result_mapper dei moduli, prima del salvataggio:
+#  - gli URL sono canonicalizzati (host minuscolo senza "www.", porta predefinita, frammento e parametri
+#    di tracciamento rimossi, parametri ordinati) e gli stessi URL trovati da più dork o sorgenti diventano
+#    una sola riga, con tutti i dork in dork_queries e le sorgenti in fonti;
+#  - gli elementi con lo stesso id (es. voci sanzioni) sono uniti tenendo lo score più alto;
+#  - l'affidabilità (A, B, C) è calcolata con regole configurabili: soglie sullo score di corrispondenza
+#    e tabella di reputazione dei domini. SCORING_RULES_PATH indica un file JSON che sovrascrive le
+#    voci di DEFAULT_RULES.
+
+SCORING_RULES_PATH = os.getenv("SCORING_RULES_PATH")
+
+DEFAULT_RULES = {
+    # Corrispondenze con score > soglia, in ordine decrescente; le voci con match=False hanno sanctions_default
+    "match_thresholds": [[0.8, "A"], [0.5, "B"]],
+    "sanctions_default": "C",
+    # Suffisso di dominio -> affidabilità (vince il suffisso più lungo); gli altri domini hanno url_default
+    "domain_reputation": {
+        "gov.it": "A",
+        "gov": "A",
+        "europa.eu": "A",
+        "camera.it": "A",
+        "senato.it": "A",
+        "gazzettaufficiale.it": "A",
+        "registroimprese.it": "A",
+        "treasury.gov": "A",
+        "un.org": "A",
+        "wikipedia.org": "B",
+        "ansa.it": "B",
+        "corriere.it": "B",
+        "repubblica.it": "B",
+        "ilsole24ore.com": "B",
+        "reuters.com": "B",
+        "linkedin.com": "B",
+    },
+    "url_default": "C",
+    # Parametri di query che non identificano la pagina: rimossi dalla forma canonica (prefissi con "*")
+    "tracking_params": ["utm_*", "gclid", "fbclid", "msclkid", "mc_cid", "mc_eid", "ref_src", "srsltid"],
+}
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+logger = logging.getLogger(__name__)
+
+ROWS_DEDUPLICATED = counter("osint_rows_deduplicated_total", "Righe di risultato unite a un duplicato prima del salvataggio", ("data_category",))
+
+_rules = None
+_rules_lock = threading.Lock()
+
+
+def get_rules():
+    """Regole di scoring: DEFAULT_RULES con le voci di SCORING_RULES_PATH (lette una volta)."""
+    global _rules
+    with _rules_lock:
+        if _rules is None:
+            rules = dict(DEFAULT_RULES)
+            if SCORING_RULES_PATH:
+                with open(SCORING_RULES_PATH, encoding="utf-8") as f:
+                    rules.update(json.load(f))
+                logger.info("Regole di scoring caricate da %s", SCORING_RULES_PATH)
+            _rules = rules
+        return _rules
+
+
+def _is_tracking_param(name, patterns):
+    name = name.lower()
+    return any(name.startswith(pattern[:-1]) if pattern.endswith("*") else name == pattern for pattern in patterns)
+
+
+def canonicalize_url(url, rules=None):
+    """
+    Forma canonica di un URL per il confronto tra risultati, es.
+    'HTTPS://www.Example.com:443/a/?utm_source=x&b=2&a=1#top' -> 'https://example.com/a?a=1&b=2'.
+    """
+    rules = rules or get_rules()
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return url.strip()
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").rstrip(".")
+    if host.startswith("www."):
+        host = host[4:]
+    netloc = host if port is None or DEFAULT_PORTS.get(scheme) == port else f"{host}:{port}"
+    path = parts.path.rstrip("/")
+    query = sorted((name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+                   if not _is_tracking_param(name, rules["tracking_params"]))
+    return urlunsplit((scheme, netloc, path, urlencode(query), ""))
+
+
+def domain_reliability(url, rules=None):
+    """Affidabilità del dominio dell'URL dalla tabella domain_reputation (suffisso più lungo), altrimenti url_default."""
+    rules = rules or get_rules()
+    host = urlsplit(url).hostname or ""
+    labels = host.split(".")
+    for start in range(len(labels)):
+        score = rules["domain_reputation"].get(".".join(labels[start:]))
+        if score:
+            return score
+    return rules["url_default"]
+
+
+def match_reliability(item, rules=None):
+    """Affidabilità di una corrispondenza (es. voce sanzioni) dalle soglie match_thresholds sullo score."""
+    rules = rules or get_rules()
+    if not item.get("match"):
+        return rules["sanctions_default"]
+    score = item.get("score") or 0
+    for threshold, reliability in rules["match_thresholds"]:
+        if score > threshold:
+            return reliability
+    return rules["sanctions_default"]
+
+
+def score_row(data_category, source_api, reliability_score, content, rules=None):
+    """Affidabilità di una riga: regole sugli URL o sulle corrispondenze, altrimenti quella del result_mapper (o C)."""
+    rules = rules or get_rules()
+    if isinstance(content, dict):
+        if content.get("url_found"):
+            return domain_reliability(content["url_found"], rules)
+        if "match" in content:
+            return match_reliability(content, rules)
+    return reliability_score or "C"
+
+
+def _dedup_key(data_category, content):
+    if isinstance(content, dict):
+        if content.get("url_found"):
+            # Lo schema non distingue la pagina: http:// e https:// dello stesso indirizzo sono un solo risultato
+            return "url", content["url_canonical"].split("://", 1)[-1]
+        if content.get("id"):
+            return data_category, "id", content["id"]
+        # Le fonti sono aggiunte prima del confronto: lo stesso contenuto da sorgenti diverse è un solo risultato
+        content = {field: value for field, value in content.items() if field != "fonti"}
+    return data_category, "contenuto", json.dumps(content, sort_keys=True, default=str)
+
+
+def _append_unique(values, new_values):
+    for value in new_values:
+        if value and value not in values:
+            values.append(value)
+
+
+def _merge(existing, row):
+    """Unisce 'row' nella riga già vista: attribuzioni di dork, sorgenti e varianti; contenuto con lo score più alto."""
+    _, source_api, _, content = row
+    merged = existing[3]
+    if not isinstance(merged, dict) or not isinstance(content, dict):
+        return
+    variants = [content.get("variante"), *content.get("varianti_corrispondenti", [])]
+    if (content.get("score") or 0) > (merged.get("score") or 0):
+        # Vince l'elemento con lo score più alto, con la sua variante: quella precedente diventa corrispondente
+        variants = [merged.get("variante"), *merged.get("varianti_corrispondenti", []), *variants[1:]]
+        kept = {field: merged[field] for field in ("fonti", "dork_queries") if field in merged}
+        merged.clear()
+        merged.update(content, **kept)
+        merged["varianti_corrispondenti"] = []
+    _append_unique(merged["fonti"], [source_api])
+    _append_unique(merged.setdefault("dork_queries", []), content.get("dork_queries") or [content.get("dork_query")])
+    merged["varianti_corrispondenti"] = list(merged.get("varianti_corrispondenti", []))
+    _append_unique(merged["varianti_corrispondenti"], variants)
+    if merged.get("variante") in merged["varianti_corrispondenti"]:
+        merged["varianti_corrispondenti"].remove(merged["variante"])
+    for field in ("dork_queries", "varianti_corrispondenti"):
+        if not merged[field]:
+            del merged[field]
+
+
+def process_rows(rows, rules=None):
+    """
+    Deduplica e assegna l'affidabilità alle righe (data_category, source_api, reliability_score, content_data)
+    di un modulo. Restituisce le righe da salvare, nell'ordine della prima occorrenza.
+    """
+    rules = rules or get_rules()
+    merged_rows = {}
+    for data_category, source_api, reliability_score, content in rows:
+        if isinstance(content, dict):
+            content = dict(content, fonti=[source_api])
+            if content.get("url_found"):
+                content["url_canonical"] = canonicalize_url(content["url_found"], rules)
+                if content.get("dork_query"):
+                    content["dork_queries"] = [content["dork_query"]]
+        key = _dedup_key(data_category, content)
+        existing = merged_rows.get(key)
+        if existing is None:
+            merged_rows[key] = [data_category, source_api, reliability_score, content]
+        else:
+            _merge(existing, (data_category, source_api, reliability_score, content))
+            ROWS_DEDUPLICATED.inc(data_category=data_category)
+
+    processed = []
+    for data_category, source_api, reliability_score, content in merged_rows.values():
+        processed.append((data_category, source_api, score_row(data_category, source_api, reliability_score, content, rules), content))
+    if len(processed) < len(rows):
+        logger.debug("Scoring: %d righe unite in %d", len(rows), len(processed))
+    return processed
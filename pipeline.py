@@ -0,0 +1,130 @@
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from modules import registry
+from modules.scoring import process_rows
+from telemetry import counter, propagate, span
+
+logger = logging.getLogger(__name__)
+
+SOURCE_RESULTS = counter("osint_source_results_total", "Esiti per sorgente (successo, vuoto, errore)", ("module", "source", "status"))
+MODULE_RESULTS = counter("osint_module_runs_total", "Esecuzioni dei moduli per esito", ("module", "status"))
+
+# Esecuzione generica dei moduli OSINT registrati in modules/registry.py: tutti i moduli abilitati
+# girano in parallelo, ognuno con il proprio timeout e limite di concorrenza, e i loro output
+# vengono convertiti nelle righe da salvare tramite il result_mapper dichiarato dal modulo, poi
+# deduplicate e valutate da modules/scoring.py.
+# run_modules_async è l'equivalente per l'event loop condiviso (modules/async_runtime.py): i moduli che
+# dichiarano async_entry_point non occupano thread mentre attendono i provider.
+
+
+def _run_module(name, nome, cognome, varianti):
+    entry_point, result_mapper = registry.load(name)
+    with registry.concurrency_slot(name), span(f"module.{name}"):
+        start = time.monotonic()
+        results = entry_point(nome, cognome, varianti=varianti)
+        elapsed = time.monotonic() - start
+    with span(f"scoring.{name}"):
+        rows = process_rows(result_mapper(results))
+    return results, rows, elapsed
+
+
+def run_modules(module_names, nome, cognome, varianti=None):
+    """
+    Esegue i moduli indicati in parallelo. Restituisce {nome_modulo: esito} dove esito contiene
+    status ("successo" o "errore"), results (output del modulo), rows (righe da salvare), wall_time_s
+    ed eventualmente message.
+    """
+    outputs = {}
+    if not module_names:
+        return outputs
+
+    executor = ThreadPoolExecutor(max_workers=len(module_names), thread_name_prefix="osint-module")
+    start = time.monotonic()
+    futures = {name: executor.submit(propagate(_run_module), name, nome, cognome, varianti) for name in module_names}
+    for name, future in futures.items():
+        timeout = registry.get_spec(name).get("timeout")
+        remaining = None if timeout is None else max(timeout - (time.monotonic() - start), 0)
+        try:
+            results, rows, elapsed = future.result(timeout=remaining)
+            outputs[name] = {"status": "successo", "results": results, "rows": rows, "wall_time_s": round(elapsed, 3)}
+        except FutureTimeoutError:
+            logger.warning("Timeout del modulo '%s' dopo %ss", name, timeout)
+            outputs[name] = {"status": "errore", "message": f"Timeout dopo {timeout}s", "results": {}, "rows": [],
+                             "wall_time_s": round(time.monotonic() - start, 3)}
+        except Exception as e:
+            logger.error("Errore nel modulo '%s': %s", name, e)
+            outputs[name] = {"status": "errore", "message": str(e), "results": {}, "rows": [],
+                             "wall_time_s": round(time.monotonic() - start, 3)}
+    executor.shutdown(wait=False, cancel_futures=True)
+    _record_outputs(outputs)
+    return outputs
+
+
+async def _run_module_async(name, nome, cognome, varianti):
+    entry_point = registry.load_async(name)
+    if entry_point is None:
+        # Modulo solo sincrono: gira in un thread, con il suo limite di concorrenza
+        return await asyncio.to_thread(_run_module, name, nome, cognome, varianti)
+    _, result_mapper = registry.load(name)
+    async with registry.async_concurrency_slot(name):
+        with span(f"module.{name}"):
+            start = time.monotonic()
+            results = await entry_point(nome, cognome, varianti=varianti)
+            elapsed = time.monotonic() - start
+    with span(f"scoring.{name}"):
+        rows = process_rows(result_mapper(results))
+    return results, rows, elapsed
+
+
+async def run_modules_async(module_names, nome, cognome, varianti=None):
+    """Come run_modules, ma come coroutine da eseguire sull'event loop condiviso."""
+    outputs = {}
+    if not module_names:
+        return outputs
+
+    start = time.monotonic()
+    timeouts = {name: registry.get_spec(name).get("timeout") for name in module_names}
+    outcomes = await asyncio.gather(
+        *(asyncio.wait_for(_run_module_async(name, nome, cognome, varianti), timeout=timeouts[name]) for name in module_names),
+        return_exceptions=True
+    )
+    for name, outcome in zip(module_names, outcomes):
+        if isinstance(outcome, asyncio.TimeoutError):
+            logger.warning("Timeout del modulo '%s' dopo %ss", name, timeouts[name])
+            outputs[name] = {"status": "errore", "message": f"Timeout dopo {timeouts[name]}s", "results": {}, "rows": [],
+                             "wall_time_s": round(time.monotonic() - start, 3)}
+        elif isinstance(outcome, asyncio.CancelledError):
+            raise outcome
+        elif isinstance(outcome, Exception):
+            logger.error("Errore nel modulo '%s': %s", name, outcome)
+            outputs[name] = {"status": "errore", "message": str(outcome), "results": {}, "rows": [],
+                             "wall_time_s": round(time.monotonic() - start, 3)}
+        else:
+            results, rows, elapsed = outcome
+            outputs[name] = {"status": "successo", "results": results, "rows": rows, "wall_time_s": round(elapsed, 3)}
+    _record_outputs(outputs)
+    return outputs
+
+
+def _record_outputs(outputs):
+    for name, output in outputs.items():
+        MODULE_RESULTS.inc(module=name, status=output["status"])
+        for key, value in iter_source_results(output["results"]):
+            SOURCE_RESULTS.inc(module=name, source=key, status=value.get("status", "sconosciuto"))
+
+
+def iter_source_results(results):
+    """Coppie (chiave_sorgente, esito) dell'output di un modulo: le voci che riportano uno 'status'."""
+    for key, value in results.items():
+        if isinstance(value, dict) and "status" in value:
+            yield key, value
+
+
+def summarize_sources(name, results):
+    """Riepilogo testuale per l'audit, es. "Sanctions.network: 3 | Google Dorks: 12"."""
+    sources = registry.get_spec(name).get("sources", {})
+    return " | ".join(
+        f"{sources.get(key, {}).get('label', key)}: {value.get('count', 0)}" for key, value in iter_source_results(results)
+    )
@@ -1,88 +1,152 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, url_for, Response, stream_with_context, send_file
 import datetime
+import io
 import os
+import time
+import logging
+import functools
+import threading
 from dotenv import load_dotenv
-import sqlite3
 import json
-# Importa la funzione orchestratrice del modulo anagrafica
-from modules.m1_anagrafica import get_identita_anagrafica  # <--- MODIFICATO IMPORT
 
+# Caricato prima dei moduli, che leggono la configurazione dalle variabili d'ambiente all'import
 load_dotenv()
+
+from telemetry import setup_logging, histogram, render_metrics, trace
+setup_logging()
+
+# I moduli OSINT sono importati solo al primo utilizzo tramite il registro
+from modules.registry import enabled_modules, get_spec
+from pipeline import run_modules, run_modules_async, iter_source_results, summarize_sources
+from modules.normalization import normalize_name
+from modules.cache import invalidate_subject
+from storage import (init_db, log_audit_event, save_result, save_results_bulk, write_batch,
+                     iter_results, iter_audit_events, store_payload, load_payload, content_hash,
+                     get_idempotent_response, save_idempotent_response, schema_is_current, flush_audit_queue,
+                     parse_time_bound)
+from coalescing import SingleFlight
+from job_queue import start_workers, stop_workers, workers_running, recover_interrupted_jobs, submit_job, get_job
+import watchlist
+import reports
+from batch import iter_subjects, run_batch, BATCH_MAX_CONCURRENCY, BATCH_ASYNC_MAX_CONCURRENCY, BATCH_MODE, BATCH_MODES
+
 app = Flask(__name__)
+logger = logging.getLogger(__name__)
 
-DATABASE_NAME = 'osint_agi.db'
-
-def init_db():
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS audit_log (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-            event_type TEXT NOT NULL,
-            source_module TEXT,
-            target_subject_name TEXT,
-            query_details TEXT,
-            result_summary TEXT,
-            notes TEXT
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS results (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            target_subject_name TEXT,
-            data_category TEXT,
-            source_api TEXT,
-            reliability_score TEXT,
-            retrieved_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            content_json TEXT,
-            report_id INTEGER NULL
+REQUEST_DURATION = histogram("osint_request_duration_seconds", "Durata delle richieste HTTP per endpoint e codice di stato", ("endpoint", "status"))
+
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')  # Se impostato, richiesto nell'header X-Admin-Token per gli endpoint /admin
+QUERY_PAGE_SIZE = 100  # Righe per pagina delle API di consultazione (massimo QUERY_PAGE_SIZE_MAX con ?limit=)
+QUERY_PAGE_SIZE_MAX = 1000
+# Risposte grezze dei provider nella risposta: "inline" (incluse come raw_response) o "ref" (solo raw_response_ref,
+# l'hash del payload salvato, leggibile da GET /payloads/<hash>). Sovrascrivibile per richiesta con ?raw= o "raw".
+RESPONSE_RAW_MODE = os.getenv('RESPONSE_RAW_MODE', 'inline')
+RAW_MODES = ('inline', 'ref')
+IDEMPOTENCY_TTL = int(os.getenv('IDEMPOTENCY_TTL', str(24 * 3600)))  # Secondi di validità di una risposta per Idempotency-Key
+# Campi del payload che non cambiano il risultato della pipeline: esclusi dalla chiave di accorpamento
+COALESCE_IGNORED_FIELDS = ('nome', 'cognome', 'async', 'callback_url', 'raw')
+
+# Server di sviluppo (python receiver.py); in produzione si usa serve.py
+SERVER_HOST = os.getenv('SERVER_HOST', '0.0.0.0')  # 0.0.0.0 per ngrok
+SERVER_PORT = int(os.getenv('SERVER_PORT', '5000'))
+SERVER_DEBUG = os.getenv('SERVER_DEBUG', '0') in ('1', 'true')  # Debugger Werkzeug: mai in produzione
+SHUTDOWN_TIMEOUT = float(os.getenv('SHUTDOWN_TIMEOUT', '60'))  # Secondi concessi ai job in corso allo spegnimento
+
+_pipeline_flight = SingleFlight("pipeline")
+_idempotency_flight = SingleFlight("idempotency_key")
+_draining = threading.Event()  # Impostato alla ricezione di SIGTERM (begin_draining): il processo non accetta nuovi job
+_shutdown_lock = threading.Lock()
+_shutdown_done = False
+
+def screen_subject(nome, cognome, varianti=None):
+    """
+    Esegue i moduli abilitati su un soggetto senza salvare nulla (usata dallo screening in blocco e dalla watchlist).
+    Restituisce (riepilogo, righe da salvare con save_results_bulk).
+    """
+    subject_identifier = f"{nome} {cognome}".strip()
+    with trace("screen_subject", subject=subject_identifier):
+        outputs = run_modules(enabled_modules(), nome, cognome, varianti=varianti)
+    return _summarize_screening(subject_identifier, outputs)
+
+async def screen_subject_async(nome, cognome, varianti=None):
+    """Come screen_subject, come coroutine sull'event loop condiviso (screening in blocco in modalità async)."""
+    subject_identifier = f"{nome} {cognome}".strip()
+    with trace("screen_subject", subject=subject_identifier):
+        outputs = await run_modules_async(enabled_modules(), nome, cognome, varianti=varianti)
+    return _summarize_screening(subject_identifier, outputs)
+
+def _summarize_screening(subject_identifier, outputs):
+    rows = []
+    summary = {}
+    for module_name, output in outputs.items():
+        rows.extend((subject_identifier, *row) for row in output["rows"])
+        summary[module_name] = {"status": output["status"]}
+        for source_key, source_result in iter_source_results(output["results"]):
+            summary[module_name][source_key] = {"status": source_result.get("status"), "count": source_result.get("count", 0)}
+    summary["saved_rows"] = len(rows)
+    return summary, rows
+
+def _resolve_raw_mode(data, raw_mode=None):
+    raw_mode = raw_mode or (data.get('raw') if isinstance(data, dict) else None) or RESPONSE_RAW_MODE
+    return raw_mode if raw_mode in RAW_MODES else 'inline'
+
+def _store_raw_payloads(module_results, raw_mode):
+    """
+    Salva le risposte grezze delle sorgenti (raw_response) come payload indirizzati per hash e vi aggiunge
+    raw_response_ref. In modalità "ref" la risposta grezza viene tolta dal risultato restituito.
+    """
+    stored = dict(module_results)
+    for source_key, source_result in iter_source_results(module_results):
+        if source_result.get("raw_response") is None:
+            continue
+        source_result = dict(source_result, raw_response_ref=store_payload(source_result["raw_response"]))
+        if raw_mode == 'ref':
+            del source_result["raw_response"]
+        stored[source_key] = source_result
+    return stored
+
+def _coalescing_key(data, raw_mode):
+    """Chiave di accorpamento: nome normalizzato più le opzioni della richiesta. None se l'input non è valido."""
+    if not isinstance(data, dict) or not data.get('nome') or not data.get('cognome'):
+        return None
+    options = {field: value for field, value in data.items() if field not in COALESCE_IGNORED_FIELDS}
+    return normalize_name(data['nome'], data['cognome']), raw_mode, json.dumps(options, sort_keys=True, default=str)
+
+def run_osint_pipeline(data, raw_mode=None):
+    """
+    Esegue la pipeline OSINT completa sui dati ricevuti.
+    Restituisce (response_data, status_code); usata sia in modalità sincrona sia dai worker dei job.
+    Tutte le scritture (audit, risultati e payload) della richiesta sono salvate in un'unica transazione.
+    Le richieste concorrenti per lo stesso soggetto e con le stesse opzioni condividono un'unica esecuzione:
+    il response_data restituito può essere condiviso tra più chiamanti e non va modificato.
+    """
+    raw_mode = _resolve_raw_mode(data, raw_mode)
+    key = _coalescing_key(data, raw_mode)
+    if key is None:
+        return _run_traced_pipeline(data, raw_mode)
+
+    (response_data, status_code), shared = _pipeline_flight.do(key, lambda: _run_traced_pipeline(data, raw_mode))
+    if shared:
+        log_audit_event(
+            event_type="RICHIESTA_ACCORPATA",
+            source_module="receiver.py",
+            target_subject_name=f"{data['nome']} {data['cognome']}".strip(),
+            query_details=data,
+            result_summary="Risultato condiviso con un'elaborazione già in corso per lo stesso soggetto"
         )
-    ''')
-    conn.commit()
-    conn.close()
-    print(f"Database '{DATABASE_NAME}' inizializzato.")
-
-def log_audit_event(event_type, source_module=None, target_subject_name=None, query_details=None, result_summary=None, notes=None):
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    try:
-        cursor.execute('''
-            INSERT INTO audit_log (event_type, source_module, target_subject_name, query_details, result_summary, notes)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (event_type, source_module, target_subject_name, json.dumps(query_details) if query_details else None, result_summary, notes))
-        conn.commit()
-    except Exception as e:
-        print(f"Errore durante il logging dell'audit event: {e}")
-    finally:
-        conn.close()
+    return response_data, status_code
 
-def save_result(target_subject_name, data_category, source_api, reliability_score, content_data):
-    """Salva un risultato strutturato nel database."""
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    try:
-        cursor.execute('''
-            INSERT INTO results (target_subject_name, data_category, source_api, reliability_score, content_json)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (target_subject_name, data_category, source_api, reliability_score, json.dumps(content_data)))
-        conn.commit()
-        print(f"[DB] Salvato risultato da '{source_api}' per '{target_subject_name}' categoria '{data_category}'.")
-    except Exception as e:
-        print(f"Errore durante il salvataggio del risultato: {e}")
-    finally:
-        conn.close()
+def _run_traced_pipeline(data, raw_mode):
+    subject = f"{data.get('nome', '')} {data.get('cognome', '')}".strip() if isinstance(data, dict) else None
+    with trace("osint_pipeline", subject=subject), write_batch():
+        return _run_osint_pipeline(data, raw_mode)
 
-@app.route('/process_osint_data', methods=['POST'])
-def process_osint_data():
+def _run_osint_pipeline(data, raw_mode='inline'):
     all_results = {}  # Dizionario per aggregare i risultati da tutti i moduli
     try:
-        data = request.json
-        print(f"[{datetime.datetime.now()}] Dati ricevuti da Make.com: {data}")
-        
         nome = data.get('nome')
         cognome = data.get('cognome')
-        # varianti = data.get('varianti')  # Per uso futuro
+        varianti = data.get('varianti')  # Varianti del nome aggiuntive: stringhe "Nome Cognome" o {"nome", "cognome"}
         subject_identifier = f"{nome} {cognome}".strip() if nome and cognome else "Soggetto Sconosciuto"
         
         log_audit_event(
@@ -96,9 +160,13 @@ def process_osint_data():
         if not nome or not cognome:
             err_msg = "Nome e cognome sono richiesti"
             log_audit_event(event_type="ERRORE_INPUT", target_subject_name=subject_identifier, result_summary=err_msg)
-            return jsonify({"status": "errore", "message": err_msg, "raw_data_received": data}), 400
+            return {"status": "errore", "message": err_msg, "raw_data_received": data}, 400
+        if varianti is not None and not isinstance(varianti, list):
+            err_msg = "Il campo 'varianti' deve essere una lista"
+            log_audit_event(event_type="ERRORE_INPUT", target_subject_name=subject_identifier, result_summary=err_msg)
+            return {"status": "errore", "message": err_msg, "raw_data_received": data}, 400
         
-        print(f"Elaborazione per: {subject_identifier}")
+        logger.info("Elaborazione per: %s", subject_identifier)
         log_audit_event(
             event_type="INIZIO_ELABORAZIONE_SOGGETTO",
             source_module="receiver.py",
@@ -106,91 +174,71 @@ def process_osint_data():
             notes="Avvio pipeline di analisi OSINT"
         )
         
-        # --- MODULO M1: IDENTITÀ E ANAGRAFICA ---
-        if nome and cognome:
+        # --- MODULI OSINT (registrati in modules/registry.py, eseguiti in parallelo) ---
+        module_names = enabled_modules()
+        for module_name in module_names:
             log_audit_event(
                 event_type="AVVIO_MODULO",
-                source_module="M1_Identita_Anagrafica",
-                target_subject_name=subject_identifier,
-                query_details={"nome": nome, "cognome": cognome}  # Aggiungere varianti se usate
-            )
-            
-            # Chiama la funzione orchestratrice del modulo M1
-            m1_results = get_identita_anagrafica(nome, cognome)  # Passare varianti se implementato
-            all_results["m1_identita_anagrafica"] = m1_results
-            
-            log_audit_event(
-                event_type="COMPLETAMENTO_MODULO",
-                source_module="M1_Identita_Anagrafica",
+                source_module=get_spec(module_name)["audit_name"],
                 target_subject_name=subject_identifier,
-                result_summary=f"Completato. Sanctions.network: {m1_results['sanctions_network'].get('count', 0)} | Google Dorks: {m1_results['google_dorks_anagrafica'].get('count', 0)}"
+                query_details={"nome": nome, "cognome": cognome, "varianti": varianti}
             )
 
-            # Salva i risultati di Sanctions.network nel DB
-            if m1_results["sanctions_network"]["status"] == "successo" and m1_results["sanctions_network"]["results"]:
-                for res_item in m1_results["sanctions_network"]["results"]:
-                    # Determina il punteggio di affidabilità basato su diversi fattori
-                    reliability_score = "A"  # Default alta affidabilità
-                    
-                    # Logica per determinare l'affidabilità basata sui dati Sanctions.network
-                    if res_item.get("match"):
-                        if res_item.get("score", 0) > 0.8:
-                            reliability_score = "A"  # Match forte con score alto
-                        elif res_item.get("score", 0) > 0.5:
-                            reliability_score = "B"  # Match buono
-                        else:
-                            reliability_score = "C"  # Match debole
-                    else:
-                        reliability_score = "C"  # Nessun match forte
-                    
-                    save_result(
-                        target_subject_name=subject_identifier,
-                        data_category="anagrafica_sanzioni",
-                        source_api="Sanctions.network",  # <--- AGGIORNATO
-                        reliability_score=reliability_score,
-                        content_data=res_item
-                    )
+        module_outputs = run_modules(module_names, nome, cognome, varianti=varianti)
 
-            # Salva i risultati dei Google Dorks nel DB
-            # Questi sono URL, quindi l'affidabilità è C finché non vengono analizzati manualmente
-            if m1_results["google_dorks_anagrafica"]["status"] == "successo" and m1_results["google_dorks_anagrafica"]["results"]:
-                for res_item in m1_results["google_dorks_anagrafica"]["results"]:
-                    if "url_found" in res_item:  # Salva solo se c'è un URL, non errori
-                        save_result(
-                            target_subject_name=subject_identifier,
-                            data_category="anagrafica_google_dork_url",
-                            source_api="GoogleDorks",
-                            reliability_score="C",  # URL grezzo, richiede verifica
-                            content_data=res_item  # Contiene dork_query e url_found
-                        )
-            
-            # Log aggiuntivi per risultati vuoti o errori - Sanctions.network
-            if m1_results["sanctions_network"]["status"] == "vuoto":
-                log_audit_event(
-                    event_type="RISULTATO_VUOTO",
-                    source_module="M1_Sanctions_Network",
-                    target_subject_name=subject_identifier,
-                    result_summary="Nessun risultato trovato su Sanctions.network"
-                )
-            elif m1_results["sanctions_network"]["status"] == "errore":
+        for module_name, output in module_outputs.items():
+            spec = get_spec(module_name)
+            module_results = _store_raw_payloads(output["results"], raw_mode)
+            all_results[module_name] = module_results if output["status"] == "successo" else {
+                "status": "errore", "message": output.get("message")
+            }
+
+            if output["status"] == "errore":
                 log_audit_event(
                     event_type="ERRORE_MODULO",
-                    source_module="M1_Sanctions_Network",
+                    source_module=spec["audit_name"],
                     target_subject_name=subject_identifier,
-                    result_summary=f"Errore API: {m1_results['sanctions_network'].get('message', 'Errore sconosciuto')}"
+                    result_summary=f"Errore del modulo: {output.get('message', 'Errore sconosciuto')}"
                 )
-            
-            # Log aggiuntivi per risultati vuoti o errori - Google Dorks
-            if m1_results["google_dorks_anagrafica"]["status"] == "vuoto":
-                log_audit_event(
-                    event_type="RISULTATO_VUOTO",
-                    source_module="M1_Google_Dorks",
+                continue
+
+            log_audit_event(
+                event_type="COMPLETAMENTO_MODULO",
+                source_module=spec["audit_name"],
+                target_subject_name=subject_identifier,
+                result_summary=f"Completato. {summarize_sources(module_name, module_results)}",
+                notes=f"Tempo modulo: {output['wall_time_s']}s | Tempi per sorgente: {json.dumps(module_results.get('tempi_sorgenti', {}))}"
+            )
+
+            # Salva i risultati del modulo nel DB (righe del result_mapper, deduplicate e valutate da modules/scoring.py)
+            for data_category, source_api, reliability_score, content_data in output["rows"]:
+                save_result(
                     target_subject_name=subject_identifier,
-                    result_summary="Nessun URL trovato tramite Google Dorks"
+                    data_category=data_category,
+                    source_api=source_api,
+                    reliability_score=reliability_score,
+                    content_data=content_data
                 )
-                
-        # --- FINE MODULO M1 ---
-        # Qui verranno aggiunte le chiamate ad altri moduli
+
+            # Log aggiuntivi per risultati vuoti o errori delle singole sorgenti
+            for source_key, source_result in iter_source_results(module_results):
+                source_info = spec.get("sources", {}).get(source_key, {})
+                label = source_info.get("label", source_key)
+                if source_result["status"] == "vuoto":
+                    log_audit_event(
+                        event_type="RISULTATO_VUOTO",
+                        source_module=source_info.get("audit_name", spec["audit_name"]),
+                        target_subject_name=subject_identifier,
+                        result_summary=f"Nessun risultato trovato su {label}"
+                    )
+                elif source_result["status"] == "errore":
+                    log_audit_event(
+                        event_type="ERRORE_MODULO",
+                        source_module=source_info.get("audit_name", spec["audit_name"]),
+                        target_subject_name=subject_identifier,
+                        result_summary=f"Errore {label}: {source_result.get('message', 'Errore sconosciuto')}"
+                    )
+        # --- FINE MODULI OSINT ---
         
         response_data = {
             "status": "successo",
@@ -206,12 +254,12 @@ def process_osint_data():
             result_summary="Elaborazione principale completata, risposta OK."
         )
         
-        return jsonify(response_data), 200
+        return response_data, 200
         
     except Exception as e:
         # Cattura l'eccezione qui per loggare l'errore e restituire una risposta JSON
         error_message = f"Errore critico durante l'elaborazione: {str(e)}"
-        print(error_message)
+        logger.exception(error_message)
         
         # Assicurati che subject_identifier sia definito anche in caso di errore precoce
         subject_identifier_on_error = f"{data.get('nome', 'N/D')} {data.get('cognome', 'N/D')}".strip() if 'data' in locals() and isinstance(data, dict) else "Soggetto Sconosciuto"
@@ -223,14 +271,456 @@ def process_osint_data():
             result_summary=error_message
         )
         
-        return jsonify({
+        return {
             "status": "errore", 
             "message": error_message, 
             "raw_data_received": data if 'data' in locals() else None
-        }), 500
+        }, 500
+
+def start_watchlist_scheduler():
+    """Avvia lo scheduler delle ri-verifiche della watchlist (idempotente)."""
+    watchlist.start_scheduler(screen_subject)
+
+def start_background_services():
+    """Avvia il pool dei job e lo scheduler della watchlist del processo (dopo init_db e recover_interrupted_jobs)."""
+    start_job_workers()
+    start_watchlist_scheduler()
+
+def begin_draining():
+    """
+    Inizio dello spegnimento, da chiamare appena arriva SIGTERM (mentre il server serve ancora le richieste
+    in corso): /ready risponde 503, così il bilanciatore smette di inviare traffico, e i nuovi job sono rifiutati.
+    """
+    if not _draining.is_set():
+        _draining.set()
+        logger.info("Ricevuto segnale di spegnimento: /ready risponde 503 e non si accettano nuovi job.")
+
+def shutdown(timeout=SHUTDOWN_TIMEOUT):
+    """
+    Spegnimento ordinato del processo (dopo che il server ha smesso di servire richieste): i job in esecuzione
+    vengono attesi fino a 'timeout' secondi (quelli ancora in coda restano nel database), poi si fermano
+    la watchlist e i report in corso e si scrivono gli eventi di audit in sospeso.
+    """
+    global _shutdown_done
+    with _shutdown_lock:
+        if _shutdown_done:
+            return
+        _shutdown_done = True
+    begin_draining()
+    logger.info("Spegnimento: attesa dei job in corso (massimo %ss)...", timeout)
+    deadline = time.monotonic() + timeout
+    unfinished = stop_workers(timeout)
+    watchlist.stop_scheduler(max(deadline - time.monotonic(), 0))
+    reports.stop_reports()
+    flush_audit_queue()
+    logger.info("Spegnimento completato (%d job interrotti).", unfinished)
+
+def start_job_workers():
+    """
+    Avvia il pool di worker per i job asincroni (idempotente). Il risultato del job è salvato nella tabella jobs:
+    le risposte grezze vi compaiono solo come riferimento, per non duplicare i payload già salvati.
+    """
+    start_workers(functools.partial(run_osint_pipeline, raw_mode='ref'))
+
+def _stream_pipeline_response(response_data):
+    """
+    Risposta NDJSON della pipeline: una riga per ogni sorgente ({"record": "sorgente", "module", "source", ...}),
+    una per ogni modulo in errore ({"record": "modulo", ...}) e una riga finale di riepilogo ({"record": "riepilogo", ...}).
+    Non è uno streaming progressivo: le righe sono prodotte a pipeline conclusa (la stessa risposta servita a
+    Idempotency-Key e alle richieste accorpate), a blocchi, senza costruire in memoria un unico corpo JSON.
+    Il client riceve la prima riga solo quando tutte le sorgenti hanno terminato.
+    """
+    aggregated = response_data.get("aggregated_results", {})
+    summary = {key: value for key, value in response_data.items() if key != "aggregated_results"}
+
+    def generate():
+        for module_name, module_results in aggregated.items():
+            sources = list(iter_source_results(module_results))
+            if not sources:
+                yield json.dumps({"record": "modulo", "module": module_name, **module_results}, ensure_ascii=False) + "\n"
+            for source_key, source_result in sources:
+                yield json.dumps({"record": "sorgente", "module": module_name, "source": source_key, **source_result}, ensure_ascii=False) + "\n"
+        yield json.dumps({"record": "riepilogo", **summary}, ensure_ascii=False) + "\n"
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+@app.before_request
+def _start_request_timer():
+    request.environ['osint.start'] = time.perf_counter()
+
+@app.after_request
+def _observe_request(response):
+    # Per le risposte in streaming (NDJSON) misura il tempo fino all'invio delle intestazioni
+    start = request.environ.get('osint.start')
+    if start is not None:
+        endpoint = request.url_rule.rule if request.url_rule else "sconosciuto"
+        REQUEST_DURATION.observe(time.perf_counter() - start, endpoint=endpoint, status=response.status_code)
+    return response
+
+@app.route('/health', methods=['GET'])
+def health():
+    """Liveness: il processo risponde."""
+    return jsonify({"status": "ok"}), 200
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness: database raggiungibile con lo schema aggiornato, pool dei job attivo e processo non in spegnimento."""
+    checks = {"draining": _draining.is_set(), "job_workers": workers_running()}
+    try:
+        checks["database"] = schema_is_current()
+    except Exception as e:
+        logger.warning("Readiness: database non raggiungibile: %s", e)
+        checks["database"] = False
+    is_ready = checks["database"] and checks["job_workers"] and not checks["draining"]
+    return jsonify({"status": "ok" if is_ready else "non_pronto", **checks}), 200 if is_ready else 503
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Metriche in formato di esposizione Prometheus (latenze, esiti per sorgente, cache, code)."""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/process_osint_data', methods=['POST'])
+def process_osint_data():
+    data = request.json
+    logger.info("Dati ricevuti da Make.com: %s", data)
+
+    # Con l'header Idempotency-Key un webhook ritentato riceve la risposta già calcolata (anche l'id del job)
+    idempotency_key = request.headers.get('Idempotency-Key')
+    replayed = False
+    if idempotency_key:
+        request_hash = content_hash({"body": data, "args": request.args.to_dict()})
+        (response_data, status_code, replayed), _ = _idempotency_flight.do(
+            (idempotency_key, request_hash), lambda: _handle_idempotent(idempotency_key, request_hash, data)
+        )
+    else:
+        response_data, status_code = _handle_osint_request(data)
+
+    # ?format=ndjson: una riga per sorgente invece di un unico corpo JSON (inviata a elaborazione conclusa)
+    if request.args.get('format') == 'ndjson' and status_code == 200:
+        response = _stream_pipeline_response(response_data)
+    else:
+        response = jsonify(response_data)
+    if replayed:
+        response.headers['Idempotent-Replayed'] = 'true'
+    return response, status_code
+
+def _handle_idempotent(idempotency_key, request_hash, data):
+    """Restituisce (response_data, status_code, già_calcolata) per una richiesta con Idempotency-Key."""
+    stored = get_idempotent_response(idempotency_key, IDEMPOTENCY_TTL)
+    if stored is not None:
+        stored_hash, status_code, response_data = stored
+        if stored_hash != request_hash:
+            return {"status": "errore", "message": "Idempotency-Key già usata per una richiesta diversa"}, 422, False
+        log_audit_event(
+            event_type="RISPOSTA_IDEMPOTENTE",
+            source_module="receiver.py",
+            target_subject_name=f"{data.get('nome', '')} {data.get('cognome', '')}".strip() if isinstance(data, dict) else None,
+            query_details={"idempotency_key": idempotency_key},
+            result_summary=f"Restituita la risposta già calcolata (HTTP {status_code})"
+        )
+        return response_data, status_code, True
+
+    response_data, status_code = _handle_osint_request(data)
+    # Gli errori del server non vengono memorizzati: il prossimo tentativo riesegue la richiesta
+    if status_code < 500:
+        save_idempotent_response(idempotency_key, request_hash, status_code, response_data, IDEMPOTENCY_TTL)
+    return response_data, status_code, False
+
+def _handle_osint_request(data):
+    # Modalità job: la richiesta viene accodata e la risposta restituisce subito l'id del job
+    async_requested = request.args.get('async') in ('1', 'true') or (isinstance(data, dict) and data.get('async') is True)
+    if not async_requested:
+        # ?raw=ref restituisce i riferimenti ai payload grezzi
+        return run_osint_pipeline(data, raw_mode=request.args.get('raw'))
+
+    if not isinstance(data, dict) or not data.get('nome') or not data.get('cognome'):
+        err_msg = "Nome e cognome sono richiesti"
+        log_audit_event(event_type="ERRORE_INPUT", target_subject_name="Soggetto Sconosciuto", result_summary=err_msg)
+        return {"status": "errore", "message": err_msg, "raw_data_received": data}, 400
+    if _draining.is_set():
+        return {"status": "errore", "message": "Server in spegnimento: riprovare più tardi"}, 503
+
+    start_job_workers()
+    try:
+        job_id = submit_job(data, callback_url=data.get('callback_url'))
+    except ValueError as e:
+        log_audit_event(event_type="ERRORE_INPUT", target_subject_name=f"{data['nome']} {data['cognome']}".strip(),
+                        result_summary=str(e))
+        return {"status": "errore", "message": str(e)}, 400
+    log_audit_event(
+        event_type="JOB_ACCODATO",
+        source_module="receiver.py",
+        target_subject_name=f"{data['nome']} {data['cognome']}".strip(),
+        query_details=data,
+        result_summary=f"Job {job_id} accodato"
+    )
+    return {
+        "status": "in_coda",
+        "job_id": job_id,
+        "status_url": url_for('get_job_status', job_id=job_id, _external=True)
+    }, 202
+
+@app.route('/process_osint_batch', methods=['POST'])
+def process_osint_batch():
+    """
+    Screening in blocco: il corpo è un flusso JSONL (un oggetto {"nome", "cognome"} per riga) oppure CSV
+    con intestazione (Content-Type text/csv o ?format=csv). La risposta è NDJSON, una riga per soggetto
+    man mano che termina, seguita da una riga di riepilogo.
+    ?mode=async (default BATCH_MODE) elabora i soggetti sull'event loop condiviso, ?mode=thread con un pool di thread.
+    """
+    fmt = request.args.get('format') or ('csv' if (request.mimetype or '').endswith('csv') else 'jsonl')
+    mode = request.args.get('mode', BATCH_MODE)
+    if mode not in BATCH_MODES:
+        return jsonify({"status": "errore", "message": f"Parametro 'mode' non valido (valori ammessi: {', '.join(BATCH_MODES)})"}), 400
+    default_concurrency, concurrency_cap = ((BATCH_ASYNC_MAX_CONCURRENCY, BATCH_ASYNC_MAX_CONCURRENCY) if mode == 'async'
+                                            else (BATCH_MAX_CONCURRENCY, BATCH_MAX_CONCURRENCY * 4))
+    try:
+        max_concurrency = min(int(request.args.get('concurrency', default_concurrency)), concurrency_cap)
+        if max_concurrency < 1:
+            raise ValueError(max_concurrency)
+    except ValueError:
+        return jsonify({"status": "errore", "message": "Parametro 'concurrency' non valido (intero maggiore di zero)"}), 400
+
+    log_audit_event(
+        event_type="AVVIO_BATCH",
+        source_module="receiver.py",
+        query_details={"format": fmt, "mode": mode, "concurrency": max_concurrency},
+        result_summary="Screening in blocco avviato"
+    )
+
+    def generate():
+        # Il corpo viene letto riga per riga mentre la risposta è già in streaming
+        lines = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+        summary = None
+        for record in run_batch(iter_subjects(lines, fmt), screen_subject, save_results_bulk, max_concurrency=max_concurrency,
+                                screen_subject_async=screen_subject_async if mode == 'async' else None):
+            summary = record
+            yield json.dumps(record, ensure_ascii=False) + "\n"
+        log_audit_event(
+            event_type="COMPLETAMENTO_BATCH",
+            source_module="receiver.py",
+            result_summary=json.dumps(summary)
+        )
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def _page_params():
+    """Legge ?limit= e ?cursor= (id dell'ultima riga della pagina precedente). Solleva ValueError se non validi."""
+    limit = min(max(int(request.args.get('limit', QUERY_PAGE_SIZE)), 1), QUERY_PAGE_SIZE_MAX)
+    cursor = request.args.get('cursor')
+    return limit, (int(cursor) if cursor else None)
+
+def _time_params():
+    """Legge ?since= e ?until= (ISO 8601, convertiti in UTC). Solleva ValueError se non validi."""
+    return parse_time_bound(request.args.get('since')), parse_time_bound(request.args.get('until'))
+
+def _stream_page(rows, limit):
+    """
+    Serializza una pagina in streaming: {"items": [...], "next_cursor": ...}.
+    'rows' deve produrre fino a limit + 1 righe: la riga in più indica che esiste una pagina successiva.
+    """
+    def generate():
+        yield '{"items": ['
+        last_id = None
+        has_more = False
+        for count, row in enumerate(rows):
+            if count == limit:
+                has_more = True
+                break
+            yield (", " if count else "") + json.dumps(row, ensure_ascii=False)
+            last_id = row["id"]
+        yield f'], "next_cursor": {json.dumps(str(last_id) if has_more else None)}}}'
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+@app.route('/subjects/<path:subject>/results', methods=['GET'])
+def get_subject_results(subject):
+    """
+    Risultati salvati per un soggetto, dal più recente. Filtri: ?category=, ?reliability=A,B,
+    ?since= / ?until= (ISO 8601). Paginazione con ?limit= e ?cursor=.
+    Con ?content=ref ogni riga riporta solo payload_hash invece del contenuto (GET /payloads/<hash>).
+    """
+    try:
+        limit, cursor = _page_params()
+    except ValueError:
+        return jsonify({"status": "errore", "message": "Parametri 'limit' o 'cursor' non validi"}), 400
+    try:
+        since, until = _time_params()
+    except ValueError as e:
+        return jsonify({"status": "errore", "message": str(e)}), 400
+    reliability = [score.strip().upper() for score in request.args.get('reliability', '').split(',') if score.strip()]
+    rows = iter_results(
+        subject,
+        data_category=request.args.get('category'),
+        reliability_scores=reliability or None,
+        since=since,
+        until=until,
+        before_id=cursor,
+        limit=limit + 1,
+        with_content=request.args.get('content') != 'ref'
+    )
+    return _stream_page(rows, limit)
+
+@app.route('/payloads/<payload_hash>', methods=['GET'])
+def get_payload(payload_hash):
+    """Contenuto di un payload salvato (risultato o risposta grezza di un provider), dato il suo hash."""
+    content = load_payload(payload_hash)
+    if content is None:
+        return jsonify({"status": "errore", "message": f"Payload {payload_hash} non trovato"}), 404
+    response = jsonify(content)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'  # Indirizzato per contenuto: non cambia
+    return response, 200
+
+@app.route('/watchlist', methods=['POST'])
+def add_to_watchlist():
+    """Registra un soggetto nella watchlist: {"nome", "cognome", "varianti"?, "interval_hours"?}."""
+    data = request.json
+    if not isinstance(data, dict) or not data.get('nome') or not data.get('cognome'):
+        return jsonify({"status": "errore", "message": "Nome e cognome sono richiesti"}), 400
+    varianti = data.get('varianti')
+    if varianti is not None and not isinstance(varianti, list):
+        return jsonify({"status": "errore", "message": "Il campo 'varianti' deve essere una lista"}), 400
+    try:
+        interval_s = float(data['interval_hours']) * 3600 if data.get('interval_hours') else None
+    except (TypeError, ValueError):
+        return jsonify({"status": "errore", "message": "Campo 'interval_hours' non valido"}), 400
+    entry = watchlist.register(data['nome'], data['cognome'], varianti=varianti, interval_s=interval_s)
+    return jsonify({"status": "successo", "entry": entry}), 201
+
+@app.route('/watchlist', methods=['GET'])
+def list_watchlist():
+    """Soggetti in watchlist in ordine di registrazione; ?all=1 include quelli sospesi. Paginazione con ?limit= e ?cursor=."""
+    try:
+        limit, cursor = _page_params()
+    except ValueError:
+        return jsonify({"status": "errore", "message": "Parametri 'limit' o 'cursor' non validi"}), 400
+    entries = watchlist.iter_entries(include_inactive=request.args.get('all') in ('1', 'true'), after_id=cursor, limit=limit + 1)
+    return _stream_page(entries, limit)
+
+@app.route('/watchlist/<int:watch_id>', methods=['DELETE'])
+def remove_from_watchlist(watch_id):
+    if not watchlist.deactivate(watch_id):
+        return jsonify({"status": "errore", "message": f"Soggetto {watch_id} non presente in watchlist"}), 404
+    return jsonify({"status": "successo", "watch_id": watch_id}), 200
+
+@app.route('/watchlist/<int:watch_id>/changes', methods=['GET'])
+def get_watchlist_changes(watch_id):
+    """Variazioni rilevate per un soggetto (nuovo, modificato, rimosso), dalla più recente; ?content=ref come per i risultati."""
+    if watchlist.get_entry(watch_id) is None:
+        return jsonify({"status": "errore", "message": f"Soggetto {watch_id} non presente in watchlist"}), 404
+    try:
+        limit, cursor = _page_params()
+    except ValueError:
+        return jsonify({"status": "errore", "message": "Parametri 'limit' o 'cursor' non validi"}), 400
+    changes = watchlist.iter_changes(watch_id, before_id=cursor, limit=limit + 1, with_content=request.args.get('content') != 'ref')
+    return _stream_page(changes, limit)
+
+@app.route('/reports', methods=['POST'])
+def create_report():
+    """
+    Genera in background un report: {"subjects": [...], "format": "json"|"csv"|"html"|"pdf",
+    "reliability"?: ["A", ...], "since"?, "until"?}. Lo stato è su GET /reports/<id>.
+    """
+    data = request.json
+    if not isinstance(data, dict) or not isinstance(data.get('subjects'), list):
+        return jsonify({"status": "errore", "message": "Il campo 'subjects' deve essere una lista"}), 400
+    if _draining.is_set():
+        return jsonify({"status": "errore", "message": "Server in spegnimento: riprovare più tardi"}), 503
+    reliability = [str(score).strip().upper() for score in data.get('reliability') or [] if str(score).strip()]
+    try:
+        report_id = reports.create_report(data['subjects'], data.get('format', 'json'), reliability_scores=reliability or None,
+                                          since=data.get('since'), until=data.get('until'))
+    except ValueError as e:
+        return jsonify({"status": "errore", "message": str(e)}), 400
+    reports.submit_report(report_id)
+    return jsonify({
+        "status": reports.REPORT_IN_CODA,
+        "report_id": report_id,
+        "status_url": url_for('get_report_status', report_id=report_id, _external=True)
+    }), 202
+
+@app.route('/reports/<int:report_id>', methods=['GET'])
+def get_report_status(report_id):
+    """Stato e avanzamento (righe scritte su righe totali) del report; a report completato, download_url."""
+    report = reports.get_report(report_id)
+    if report is None:
+        return jsonify({"status": "errore", "message": f"Report {report_id} non trovato"}), 404
+    if report["status"] == reports.REPORT_COMPLETATO:
+        report["download_url"] = url_for('download_report', report_id=report_id, _external=True)
+    return jsonify(report), 200
+
+@app.route('/reports/<int:report_id>/download', methods=['GET'])
+def download_report(report_id):
+    report = reports.get_report(report_id)
+    if report is None:
+        return jsonify({"status": "errore", "message": f"Report {report_id} non trovato"}), 404
+    if report["status"] != reports.REPORT_COMPLETATO or not os.path.exists(report["output_path"]):
+        return jsonify({"status": "errore", "message": f"Report {report_id} non disponibile (stato: {report['status']})"}), 409
+    return send_file(os.path.abspath(report["output_path"]), mimetype=reports.CONTENT_TYPES[report["format"]],
+                     as_attachment=True, download_name=os.path.basename(report["output_path"]))
+
+@app.route('/audit', methods=['GET'])
+def get_audit_log():
+    """Eventi di audit, dal più recente. Filtri: ?subject=, ?event_type=, ?source_module=, ?since=, ?until=."""
+    try:
+        limit, cursor = _page_params()
+    except ValueError:
+        return jsonify({"status": "errore", "message": "Parametri 'limit' o 'cursor' non validi"}), 400
+    try:
+        since, until = _time_params()
+    except ValueError as e:
+        return jsonify({"status": "errore", "message": str(e)}), 400
+    rows = iter_audit_events(
+        target_subject_name=request.args.get('subject'),
+        event_type=request.args.get('event_type'),
+        source_module=request.args.get('source_module'),
+        since=since,
+        until=until,
+        before_id=cursor,
+        limit=limit + 1
+    )
+    return _stream_page(rows, limit)
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"status": "errore", "message": f"Job {job_id} non trovato"}), 404
+    return jsonify(job), 200
+
+@app.route('/admin/cache/<path:subject>', methods=['DELETE'])
+def invalidate_cache(subject):
+    """Invalida le voci in cache di un soggetto (nome completo); ?source= limita a una sola sorgente."""
+    if ADMIN_TOKEN and request.headers.get('X-Admin-Token') != ADMIN_TOKEN:
+        return jsonify({"status": "errore", "message": "Non autorizzato"}), 403
+
+    cache_key = normalize_name(subject)
+    source = request.args.get('source')
+    removed = invalidate_subject(cache_key, source=source)
+    log_audit_event(
+        event_type="CACHE_INVALIDATA",
+        source_module="receiver.py",
+        target_subject_name=subject,
+        query_details={"cache_key": cache_key, "source": source},
+        result_summary=f"Rimosse {removed} voci dalla cache"
+    )
+    return jsonify({"status": "successo", "cache_key": cache_key, "removed": removed}), 200
 
 if __name__ == '__main__':
+    # Server di sviluppo a processo singolo; per più worker: python serve.py
+    import signal
+    import sys
     init_db()
-    print("Avvio del server Flask sulla porta 5000...")
-    # host='0.0.0.0' per ngrok, debug=True per sviluppo
-    app.run(host='0.0.0.0', port=5000, debug=True, use_reloader=False)  # use_reloader=False se ngrok ha problemi con il riavvio
+    recover_interrupted_jobs()  # I job in coda prima del riavvio vengono ripresi dal pool
+    reports.recover_interrupted_reports()
+    start_background_services()
+
+    def _handle_sigterm(*_):
+        begin_draining()
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, _handle_sigterm)
+    logger.info("Avvio del server Flask sulla porta %d...", SERVER_PORT)
+    try:
+        app.run(host=SERVER_HOST, port=SERVER_PORT, debug=SERVER_DEBUG, use_reloader=False)  # use_reloader=False se ngrok ha problemi con il riavvio
+    finally:
+        shutdown()
@@ -0,0 +1,308 @@
+import os
+import csv
+import sys
+import json
+import html
+import logging
+import argparse
+import itertools
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+# Caricato prima di storage, che legge OSINT_DB_PATH all'import (anche da riga di comando)
+load_dotenv()
+
+from storage import (get_connection, transaction, log_audit_event, link_results_to_report, iter_report_results,
+                     parse_time_bound)
+from telemetry import counter, trace
+
+try:
+    import weasyprint  # Opzionale: conversione del report HTML in PDF
+except ImportError:
+    weasyprint = None
+
+# Report (dossier) per soggetto o per gruppi di soggetti in JSON, CSV, HTML o PDF.
+# All'avvio della generazione i risultati selezionati vengono collegati al report nella tabella
+# report_results, senza modificare results (report sovrapposti restano indipendenti). La generazione
+# avviene in background e legge le righe a pagine (keyset), scrivendo il file man mano: la
+# memoria usata non dipende dal numero di righe (tranne che per il PDF, che viene impaginato a
+# partire dall'HTML). L'avanzamento è salvato nella tabella reports.
+
+REPORTS_DIR = os.getenv("REPORTS_DIR", "reports")
+REPORT_MAX_WORKERS = int(os.getenv("REPORT_MAX_WORKERS", "2"))
+REPORT_PROGRESS_ROWS = 1000  # Righe scritte tra due aggiornamenti dell'avanzamento
+FORMATS = ("json", "csv", "html", "pdf")
+CONTENT_TYPES = {"json": "application/json", "csv": "text/csv", "html": "text/html", "pdf": "application/pdf"}
+CSV_COLUMNS = ("id", "target_subject_name", "data_category", "source_api", "reliability_score", "retrieved_at", "payload_hash", "content")
+
+# Stati possibili di un report
+REPORT_IN_CODA = "in_coda"
+REPORT_IN_ESECUZIONE = "in_esecuzione"
+REPORT_COMPLETATO = "completato"
+REPORT_ERRORE = "errore"
+
+logger = logging.getLogger(__name__)
+
+REPORTS_FINISHED = counter("osint_reports_finished_total", "Report terminati per formato e stato", ("format", "status"))
+
+_executor = None
+_executor_lock = threading.Lock()
+_stop_event = threading.Event()
+_queued = {}  # Future -> id dei report inviati al pool di questo processo
+
+
+class ReportInterrotto(Exception):
+    pass
+
+
+def _now():
+    return datetime.datetime.now().isoformat()
+
+
+def create_report(subjects, fmt="json", reliability_scores=None, since=None, until=None):
+    """
+    Registra un report sui risultati dei soggetti indicati (filtrabili per affidabilità e periodo).
+    Solleva ValueError se i parametri non sono validi. Restituisce l'id del report.
+    """
+    subjects = [str(subject).strip() for subject in subjects or [] if str(subject).strip()]
+    if not subjects:
+        raise ValueError("Indicare almeno un soggetto")
+    if fmt not in FORMATS:
+        raise ValueError(f"Formato non valido: scegliere tra {', '.join(FORMATS)}")
+    if fmt == "pdf" and weasyprint is None:
+        raise ValueError("Formato PDF non disponibile: installare il pacchetto 'weasyprint'")
+    filters = {"subjects": subjects, "reliability": reliability_scores or None,
+               "since": parse_time_bound(since), "until": parse_time_bound(until)}
+    with transaction() as conn:
+        report_id = conn.execute(
+            "INSERT INTO reports (status, format, filters_json) VALUES (?, ?, ?)", (REPORT_IN_CODA, fmt, json.dumps(filters))
+        ).lastrowid
+    log_audit_event(
+        event_type="REPORT_RICHIESTO",
+        source_module="reports.py",
+        target_subject_name=subjects[0] if len(subjects) == 1 else None,
+        query_details={"report_id": report_id, "format": fmt, **filters},
+        result_summary=f"Report {report_id} registrato"
+    )
+    return report_id
+
+
+def get_report(report_id):
+    """Stato e avanzamento del report, oppure None se non esiste."""
+    row = get_connection().execute('''
+        SELECT id, status, format, filters_json, rows_total, rows_written, output_path, error, created_at, started_at, finished_at
+        FROM reports WHERE id = ?
+    ''', (report_id,)).fetchone()
+    if row is None:
+        return None
+    return {
+        "report_id": row[0],
+        "status": row[1],
+        "format": row[2],
+        "filters": json.loads(row[3]),
+        "rows_total": row[4],
+        "rows_written": row[5],
+        "progress": round(row[5] / row[4], 3) if row[4] else (1.0 if row[1] == REPORT_COMPLETATO else 0.0),
+        "output_path": row[6],
+        "error": row[7],
+        "created_at": row[8],
+        "started_at": row[9],
+        "finished_at": row[10]
+    }
+
+
+def _update_report(report_id, **fields):
+    columns = ", ".join(f"{name} = ?" for name in fields)
+    with transaction() as conn:
+        conn.execute(f"UPDATE reports SET {columns} WHERE id = ?", (*fields.values(), report_id))
+
+
+def recover_interrupted_reports():
+    """Segna come falliti i report lasciati a metà da uno spegnimento (da chiamare una volta all'avvio)."""
+    with transaction() as conn:
+        interrupted = conn.execute(
+            "UPDATE reports SET status = ?, error = ?, finished_at = ? WHERE status IN (?, ?)",
+            (REPORT_ERRORE, "Interrotto dal riavvio del server", _now(), REPORT_IN_CODA, REPORT_IN_ESECUZIONE)
+        ).rowcount
+    if interrupted:
+        logger.info("Segnati come interrotti %d report.", interrupted)
+    return interrupted
+
+
+def submit_report(report_id):
+    """Accoda la generazione del report al pool in background."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _stop_event.clear()
+            _executor = ThreadPoolExecutor(max_workers=REPORT_MAX_WORKERS, thread_name_prefix="osint-report")
+        future = _executor.submit(generate_report, report_id)
+        _queued[future] = report_id
+    future.add_done_callback(_forget_report)
+
+
+def _forget_report(future):
+    with _executor_lock:
+        _queued.pop(future, None)
+
+
+def stop_reports():
+    """
+    Interrompe i report in corso al prossimo blocco di righe (restano con stato errore) e ferma il pool:
+    quelli ancora in coda nel processo vengono annullati e segnati subito con stato errore (con più
+    worker gunicorn il riavvio di uno solo non passa da recover_interrupted_reports).
+    """
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+        queued = dict(_queued)
+    if executor is None:
+        return
+    _stop_event.set()
+    executor.shutdown(wait=True, cancel_futures=True)
+    cancelled = [report_id for future, report_id in queued.items() if future.cancelled()]
+    if cancelled:
+        with transaction() as conn:
+            conn.executemany(
+                "UPDATE reports SET status = ?, error = ?, finished_at = ? WHERE id = ? AND status = ?",
+                [(REPORT_ERRORE, "Annullato dallo spegnimento del server", _now(), report_id, REPORT_IN_CODA)
+                 for report_id in cancelled]
+            )
+        logger.info("Annullati %d report in coda.", len(cancelled))
+
+
+def generate_report(report_id, output_path=None):
+    """Collega i risultati al report e scrive il file. Restituisce lo stato finale del report."""
+    report = get_report(report_id)
+    fmt = report["format"]
+    filters = report["filters"]
+    output_path = output_path or os.path.join(REPORTS_DIR, f"report_{report_id}.{fmt}")
+    _update_report(report_id, status=REPORT_IN_ESECUZIONE, started_at=_now())
+    try:
+        with trace("report", report_id=report_id, format=fmt):
+            rows_total = link_results_to_report(
+                report_id, filters["subjects"], reliability_scores=filters["reliability"],
+                since=filters["since"], until=filters["until"]
+            )
+            _update_report(report_id, rows_total=rows_total)
+            report["rows_total"] = rows_total
+            _write_report(report, output_path)
+        status, error = REPORT_COMPLETATO, None
+        _update_report(report_id, status=status, output_path=output_path, finished_at=_now())
+    except Exception as e:
+        if not isinstance(e, ReportInterrotto):
+            logger.exception("Errore durante la generazione del report %s", report_id)
+        status, error = REPORT_ERRORE, str(e)
+        _update_report(report_id, status=status, error=error, finished_at=_now())
+    REPORTS_FINISHED.inc(format=fmt, status=status)
+    log_audit_event(
+        event_type="REPORT_COMPLETATO" if status == REPORT_COMPLETATO else "ERRORE_REPORT",
+        source_module="reports.py",
+        query_details={"report_id": report_id, "format": fmt},
+        result_summary=f"Report {report_id}: {report['rows_total']} righe" if error is None else f"Errore report {report_id}: {error}"
+    )
+    return status
+
+
+def _write_report(report, output_path):
+    """Scrive il file su un percorso temporaneo e lo rinomina a generazione completata."""
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    fmt = report["format"]
+    writer = {"json": _write_json, "csv": _write_csv, "html": _write_html, "pdf": _write_html}[fmt]
+    tmp_path = f"{output_path}.tmp"
+    html_path = f"{output_path}.html.tmp"
+    try:
+        with open(html_path if fmt == "pdf" else tmp_path, "w", encoding="utf-8", newline="") as out:
+            writer(out, report, _iter_with_progress(report))
+        if fmt == "pdf":
+            weasyprint.HTML(filename=html_path).write_pdf(tmp_path)
+        os.replace(tmp_path, output_path)
+    finally:
+        for path in (tmp_path, html_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def _iter_with_progress(report):
+    written = 0
+    for item in iter_report_results(report["report_id"]):
+        yield item
+        written += 1
+        if written % REPORT_PROGRESS_ROWS == 0:
+            if _stop_event.is_set():
+                raise ReportInterrotto("Interrotto dallo spegnimento del server")
+            _update_report(report["report_id"], rows_written=written)
+    _update_report(report["report_id"], rows_written=written)
+
+
+def _iter_by_subject(items):
+    """Coppie (soggetto, righe del soggetto) dalle righe ordinate per soggetto, senza accumularle."""
+    return itertools.groupby(items, key=lambda item: item["target_subject_name"])
+
+
+def _report_header(report):
+    return {key: report[key] for key in ("report_id", "format", "filters", "rows_total")} | {"generated_at": _now()}
+
+
+def _write_json(out, report, items):
+    out.write('{"report": ' + json.dumps(_report_header(report), ensure_ascii=False) + ', "subjects": [')
+    for index, (subject, rows) in enumerate(_iter_by_subject(items)):
+        out.write(("," if index else "") + '\n{"subject": ' + json.dumps(subject, ensure_ascii=False) + ', "results": [')
+        for count, item in enumerate(rows):
+            out.write(("," if count else "") + "\n" + json.dumps(item, ensure_ascii=False))
+        out.write("]}")
+    out.write("\n]}\n")
+
+
+def _write_csv(out, report, items):
+    writer = csv.writer(out)
+    writer.writerow(CSV_COLUMNS)
+    for item in items:
+        writer.writerow([json.dumps(item["content"], ensure_ascii=False) if column == "content" else item[column]
+                         for column in CSV_COLUMNS])
+
+
+def _write_html(out, report, items):
+    header = _report_header(report)
+    out.write('<!DOCTYPE html>\n<html lang="it"><head><meta charset="utf-8">'
+              f'<title>Report OSINT {header["report_id"]}</title>'
+              '<style>body{font-family:sans-serif;font-size:12px}table{border-collapse:collapse;width:100%}'
+              'td,th{border:1px solid #ccc;padding:4px;vertical-align:top;text-align:left}'
+              'pre{white-space:pre-wrap;word-break:break-all;margin:0}</style></head><body>\n')
+    out.write(f'<h1>Report OSINT {header["report_id"]}</h1>\n<p>Generato il {html.escape(header["generated_at"])} '
+              f'&middot; {header["rows_total"]} risultati</p>\n')
+    for subject, rows in _iter_by_subject(items):
+        out.write(f'<h2>{html.escape(subject)}</h2>\n<table><tr><th>Categoria</th><th>Fonte</th><th>Affidabilità</th>'
+                  '<th>Data</th><th>Contenuto</th></tr>\n')
+        for item in rows:
+            cells = (item["data_category"], item["source_api"], item["reliability_score"], item["retrieved_at"])
+            out.write("<tr>" + "".join(f"<td>{html.escape(str(cell or ''))}</td>" for cell in cells)
+                      + f'<td><pre>{html.escape(json.dumps(item["content"], ensure_ascii=False, indent=1))}</pre></td></tr>\n')
+        out.write("</table>\n")
+    out.write("</body></html>\n")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generazione di report OSINT dai risultati salvati")
+    parser.add_argument("subjects", nargs="+", help="Soggetti da includere (nome completo come salvato nei risultati)")
+    parser.add_argument("--format", choices=FORMATS, default="json")
+    parser.add_argument("--output", default=None, help=f"File di destinazione (default: {REPORTS_DIR}/report_<id>.<formato>)")
+    parser.add_argument("--reliability", default=None, help="Affidabilità da includere, es. A,B")
+    parser.add_argument("--since", default=None, help="Data minima di salvataggio (ISO 8601)")
+    parser.add_argument("--until", default=None, help="Data massima di salvataggio (ISO 8601)")
+    args = parser.parse_args()
+
+    from storage import init_db
+    from telemetry import setup_logging
+    setup_logging()
+    init_db()
+    reliability = [score.strip().upper() for score in (args.reliability or "").split(",") if score.strip()]
+    try:
+        report_id = create_report(args.subjects, args.format, reliability_scores=reliability or None,
+                                  since=args.since, until=args.until)
+    except ValueError as e:
+        sys.exit(str(e))
+    generate_report(report_id, output_path=args.output)
+    print(json.dumps(get_report(report_id), ensure_ascii=False, indent=2))
@@ -0,0 +1,75 @@
+import os
+import sys
+import signal
+from dotenv import load_dotenv
+
+# Avvio di produzione del receiver con gunicorn (più processi worker, ognuno con più thread).
+# Il file è anche la configurazione di gunicorn:
+#     python serve.py                              (equivale a)
+#     gunicorn -c serve.py receiver:app
+# Lo schema del database viene inizializzato una sola volta dal master prima di creare i worker; ogni worker
+# avvia il proprio pool dei job e lo scheduler della watchlist (la presa in carico di job e verifiche è
+# esclusiva tra processi). Allo spegnimento (SIGTERM) ogni worker risponde subito 503 su /ready e ai nuovi job,
+# termina le richieste in corso e poi attende i job in esecuzione per SHUTDOWN_TIMEOUT secondi.
+# Le metriche di /metrics sono per processo.
+
+# Caricato prima di storage e receiver, che leggono la configurazione all'import
+load_dotenv()
+
+bind = f"{os.getenv('SERVER_HOST', '0.0.0.0')}:{os.getenv('SERVER_PORT', '5000')}"
+workers = int(os.getenv('SERVER_WORKERS', str(min((os.cpu_count() or 1) * 2 + 1, 8))))
+# La pipeline è I/O-bound: più thread per worker servono più richieste in attesa dei provider
+worker_class = 'gthread'
+threads = int(os.getenv('SERVER_THREADS', '8'))
+# Le richieste sincrone attendono l'intera pipeline (ricerche Google comprese)
+timeout = int(os.getenv('SERVER_TIMEOUT', '300'))
+keepalive = 5
+# Il master concede ai worker il tempo di terminare le richieste sincrone in corso (fino a 'timeout') e poi
+# di attendere i job in esecuzione (SHUTDOWN_TIMEOUT, in worker_exit) prima di terminarli
+graceful_timeout = timeout + int(float(os.getenv('SHUTDOWN_TIMEOUT', '60'))) + 10
+# Ogni worker importa l'applicazione dopo il fork: connessioni SQLite e thread non sono condivisi tra processi
+preload_app = False
+accesslog = os.getenv('SERVER_ACCESS_LOG')  # Es. "-" per stdout; disattivato se non impostato
+wsgi_app = 'receiver:app'
+
+
+def on_starting(server):
+    """Nel master, una sola volta: schema del database e ripristino di job e report interrotti dal precedente spegnimento."""
+    from storage import init_db, close_connection
+    from job_queue import recover_interrupted_jobs
+    from reports import recover_interrupted_reports
+    init_db()
+    recover_interrupted_jobs()
+    recover_interrupted_reports()
+    close_connection()  # La connessione del master non deve essere ereditata dai worker
+
+
+def post_worker_init(worker):
+    import receiver
+    receiver.start_background_services()
+
+    # worker_exit arriva solo dopo che il worker ha smesso di servire: il drenaggio inizia alla ricezione di SIGTERM.
+    # Il gestore va registrato di nuovo: init_signals() ha già legato SIGTERM al metodo handle_exit originale
+    handle_exit = worker.handle_exit
+
+    def handle_exit_draining(sig, frame):
+        receiver.begin_draining()
+        handle_exit(sig, frame)
+
+    signal.signal(signal.SIGTERM, handle_exit_draining)
+    signal.siginterrupt(signal.SIGTERM, False)  # Come gunicorn: le chiamate di sistema in corso non vengono interrotte
+
+
+def worker_exit(server, worker):
+    receiver = sys.modules.get('receiver')
+    if receiver is not None:  # Il worker potrebbe essere uscito prima di caricare l'applicazione
+        receiver.shutdown()
+
+
+if __name__ == '__main__':
+    try:
+        from gunicorn.app.wsgiapp import run
+    except ImportError:
+        sys.exit("gunicorn non installato: pip install gunicorn (oppure python receiver.py per il server di sviluppo)")
+    sys.argv = [sys.argv[0], '-c', __file__, *sys.argv[1:]]
+    run()
@@ -0,0 +1,697 @@
+import os
+import json
+import time
+import zlib
+import datetime
+import queue
+import hashlib
+import atexit
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from telemetry import counter, gauge, span
+
+try:
+    import zstandard  # Opzionale: compressione migliore e più veloce di zlib
+except ImportError:
+    zstandard = None
+
+# Accesso al database dei risultati. Ogni thread riutilizza la propria connessione (in WAL),
+# e le scritture prodotte da una richiesta possono essere raccolte con write_batch() e salvate
+# in un'unica transazione. Gli eventi di audit possono essere scritti in differita da un thread
+# dedicato (AUDIT_WRITE_BEHIND=1), fuori dal percorso della richiesta.
+#
+# I contenuti dei risultati e le risposte grezze dei provider sono salvati una sola volta nella tabella
+# payloads, indirizzati per hash SHA-256 del JSON canonico e compressi (zstd se installato, altrimenti zlib):
+# le righe di results vi fanno riferimento tramite payload_hash.
+
+DATABASE_NAME = os.getenv('OSINT_DB_PATH', 'osint_agi.db')
+AUDIT_WRITE_BEHIND = os.getenv('AUDIT_WRITE_BEHIND', '0') in ('1', 'true')
+AUDIT_FLUSH_MAX = 500  # Eventi massimi per transazione del thread di scrittura differita
+PAYLOAD_CODEC = os.getenv('PAYLOAD_CODEC', 'zstd' if zstandard else 'zlib')
+PAYLOAD_MIN_COMPRESS = 256  # Sotto questa dimensione (byte) il payload è salvato non compresso
+
+_local = threading.local()
+_audit_queue = queue.Queue()
+_audit_writer = None
+_audit_writer_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+ROWS_WRITTEN = counter("osint_db_rows_written_total", "Righe scritte su SQLite per tabella", ("table",))
+DB_WRITE_ERRORS = counter("osint_db_write_errors_total", "Scritture su SQLite fallite per operazione", ("operation",))
+gauge("osint_audit_queue_depth", "Eventi di audit in attesa di scrittura differita", lambda: _audit_queue.qsize())
+
+AUDIT_INSERT_SQL = '''
+    INSERT INTO audit_log (event_type, source_module, target_subject_name, query_details, result_summary, notes)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+RESULT_INSERT_SQL = '''
+    INSERT INTO results (target_subject_name, data_category, source_api, reliability_score, payload_hash)
+    VALUES (?, ?, ?, ?, ?)
+'''
+PAYLOAD_INSERT_SQL = "INSERT OR IGNORE INTO payloads (hash, codec, size, data) VALUES (?, ?, ?, ?)"
+
+
+def get_connection():
+    """Connessione SQLite del thread corrente, aperta al primo utilizzo e poi riutilizzata."""
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "conn_path", None) != DATABASE_NAME:
+        if conn is not None:
+            conn.close()
+        conn = sqlite3.connect(DATABASE_NAME, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")  # Sicuro in WAL: nessun fsync a ogni commit
+        _local.conn = conn
+        _local.conn_path = DATABASE_NAME
+    return conn
+
+
+def close_connection():
+    """Chiude la connessione del thread corrente (es. nel master prima di creare i processi worker)."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+
+@contextmanager
+def transaction():
+    """Esegue il blocco in una transazione sulla connessione del thread (commit o rollback all'uscita)."""
+    conn = get_connection()
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def init_db():
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS audit_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            event_type TEXT NOT NULL,
+            source_module TEXT,
+            target_subject_name TEXT,
+            query_details TEXT,
+            result_summary TEXT,
+            notes TEXT
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            target_subject_name TEXT,
+            data_category TEXT,
+            source_api TEXT,
+            reliability_score TEXT,
+            retrieved_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            content_json TEXT,
+            report_id INTEGER NULL
+        )
+    ''')
+    # Coda persistente dei job asincroni: sopravvive ai riavvii del server
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            payload_json TEXT NOT NULL,
+            callback_url TEXT,
+            callback_status TEXT,
+            result_json TEXT,
+            error TEXT,
+            created_at DATETIME,
+            started_at DATETIME,
+            finished_at DATETIME
+        )
+    ''')
+    conn.commit()
+    _apply_migrations(conn)
+    logger.info("Database '%s' inizializzato.", DATABASE_NAME)
+
+
+# Migrazioni incrementali dello schema: (versione, istruzioni). La versione applicata è salvata in PRAGMA user_version.
+MIGRATIONS = [
+    (1, [
+        # Indici per le API di consultazione (filtri per soggetto/categoria, paginazione per id)
+        "CREATE INDEX IF NOT EXISTS idx_results_subject_id ON results (target_subject_name, id)",
+        "CREATE INDEX IF NOT EXISTS idx_results_subject_category_id ON results (target_subject_name, data_category, id)",
+        "CREATE INDEX IF NOT EXISTS idx_audit_subject_id ON audit_log (target_subject_name, id)",
+        "CREATE INDEX IF NOT EXISTS idx_audit_event_type_id ON audit_log (event_type, id)",
+        "CREATE INDEX IF NOT EXISTS idx_audit_timestamp ON audit_log (timestamp)",
+    ]),
+    (2, [
+        # Payload indirizzati per contenuto: i risultati vi fanno riferimento invece di ripetere il JSON.
+        # Le righe precedenti restano leggibili da content_json.
+        '''CREATE TABLE IF NOT EXISTS payloads (
+            hash TEXT PRIMARY KEY,
+            codec TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )''',
+        "ALTER TABLE results ADD COLUMN payload_hash TEXT",
+    ]),
+    (3, [
+        # Risposte già calcolate per Idempotency-Key: i webhook ritentati ricevono la stessa risposta
+        '''CREATE TABLE IF NOT EXISTS idempotency_keys (
+            idempotency_key TEXT PRIMARY KEY,
+            request_hash TEXT NOT NULL,
+            status_code INTEGER NOT NULL,
+            response_hash TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )''',
+        "CREATE INDEX IF NOT EXISTS idx_idempotency_created_at ON idempotency_keys (created_at)",
+    ]),
+    (4, [
+        # Watchlist: soggetti ri-verificati periodicamente (vedi watchlist.py)
+        '''CREATE TABLE IF NOT EXISTS watchlist (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nome TEXT NOT NULL,
+            cognome TEXT NOT NULL,
+            subject_key TEXT NOT NULL UNIQUE,
+            varianti_json TEXT,
+            interval_s INTEGER NOT NULL,
+            next_run_at REAL NOT NULL,
+            last_run_at REAL,
+            last_status TEXT,
+            active INTEGER NOT NULL DEFAULT 1,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )''',
+        "CREATE INDEX IF NOT EXISTS idx_watchlist_due ON watchlist (active, next_run_at)",
+        # Stato noto di ogni elemento (voce sanzioni, URL, ...) con l'hash del suo contenuto
+        '''CREATE TABLE IF NOT EXISTS watchlist_items (
+            watch_id INTEGER NOT NULL,
+            item_key TEXT NOT NULL,
+            data_category TEXT NOT NULL,
+            content_hash TEXT NOT NULL,
+            present INTEGER NOT NULL DEFAULT 1,
+            first_seen REAL NOT NULL,
+            last_seen REAL NOT NULL,
+            PRIMARY KEY (watch_id, item_key)
+        )''',
+        # Variazioni rilevate a ogni ri-verifica (il contenuto è nella tabella payloads)
+        '''CREATE TABLE IF NOT EXISTS watchlist_changes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            watch_id INTEGER NOT NULL,
+            detected_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            change_type TEXT NOT NULL,
+            data_category TEXT NOT NULL,
+            item_key TEXT NOT NULL,
+            payload_hash TEXT
+        )''',
+        "CREATE INDEX IF NOT EXISTS idx_watchlist_changes_watch_id ON watchlist_changes (watch_id, id)",
+    ]),
+    (5, [
+        # Report generati (vedi reports.py)
+        '''CREATE TABLE IF NOT EXISTS reports (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            status TEXT NOT NULL,
+            format TEXT NOT NULL,
+            filters_json TEXT NOT NULL,
+            rows_total INTEGER,
+            rows_written INTEGER NOT NULL DEFAULT 0,
+            output_path TEXT,
+            error TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            started_at DATETIME,
+            finished_at DATETIME
+        )''',
+        "CREATE INDEX IF NOT EXISTS idx_results_report_subject_id ON results (report_id, target_subject_name, id)",
+    ]),
+    (6, [
+        # Risultati inclusi in ogni report: una riga può far parte di più report senza essere modificata.
+        # results.report_id non è più aggiornato (resta per le righe collegate prima di questa versione).
+        '''CREATE TABLE IF NOT EXISTS report_results (
+            report_id INTEGER NOT NULL,
+            target_subject_name TEXT,
+            result_id INTEGER NOT NULL,
+            PRIMARY KEY (report_id, target_subject_name, result_id)
+        ) WITHOUT ROWID''',
+        "DROP INDEX IF EXISTS idx_results_report_subject_id",
+    ]),
+    (7, [
+        # Filtri per affidabilità e periodo di iter_results e dei report (vedi _report_filter)
+        "CREATE INDEX IF NOT EXISTS idx_results_subject_reliability_id ON results (target_subject_name, reliability_score, id)",
+        "CREATE INDEX IF NOT EXISTS idx_results_subject_retrieved_at ON results (target_subject_name, retrieved_at)",
+    ]),
+    (8, [
+        # Il corpo delle risposte per Idempotency-Key è salvato nella riga della chiave, non più in payloads:
+        # eliminata la chiave scaduta, la risposta sparisce con lei. Si spostano quelle delle chiavi ancora valide.
+        "ALTER TABLE idempotency_keys ADD COLUMN response_codec TEXT",
+        "ALTER TABLE idempotency_keys ADD COLUMN response_data BLOB",
+        '''UPDATE idempotency_keys SET
+            response_codec = (SELECT codec FROM payloads WHERE hash = response_hash),
+            response_data = (SELECT data FROM payloads WHERE hash = response_hash)''',
+        '''DELETE FROM payloads WHERE hash IN (SELECT response_hash FROM idempotency_keys)
+            AND hash NOT IN (SELECT payload_hash FROM results WHERE payload_hash IS NOT NULL)
+            AND hash NOT IN (SELECT payload_hash FROM watchlist_changes WHERE payload_hash IS NOT NULL)''',
+    ]),
+]
+
+
+def schema_is_current():
+    """True se il database è raggiungibile e tutte le migrazioni dello schema sono state applicate."""
+    return get_connection().execute("PRAGMA user_version").fetchone()[0] >= MIGRATIONS[-1][0]
+
+
+def _apply_migrations(conn):
+    """
+    Applica le migrazioni mancanti, ognuna in una transazione esplicita. Il modulo sqlite3 apre da sé una transazione
+    solo prima di INSERT/UPDATE/DELETE: senza BEGIN, CREATE e ALTER verrebbero confermati uno alla volta e un errore
+    a metà lascerebbe la migrazione applicata in parte, non più rieseguibile (ALTER TABLE ... ADD COLUMN fallisce).
+    """
+    for version, statements in MIGRATIONS:
+        if version <= conn.execute("PRAGMA user_version").fetchone()[0]:
+            continue
+        with transaction() as tx:
+            tx.execute("BEGIN IMMEDIATE")
+            # Riletta sotto lock: un altro processo potrebbe averla appena applicata
+            if tx.execute("PRAGMA user_version").fetchone()[0] >= version:
+                continue
+            for statement in statements:
+                tx.execute(statement)
+            tx.execute(f"PRAGMA user_version = {int(version)}")
+        logger.info("Applicata migrazione dello schema v%s.", version)
+
+
+@contextmanager
+def write_batch():
+    """
+    Raccoglie gli eventi di audit e i risultati salvati nel blocco e li scrive tutti con executemany
+    in un'unica transazione all'uscita. Se è già attivo un batch nel thread, si accoda a quello.
+    """
+    if getattr(_local, "batch", None) is not None:
+        yield
+        return
+    _local.batch = {"audit": [], "results": [], "payloads": {}}
+    try:
+        yield
+    finally:
+        batch = _local.batch
+        _local.batch = None
+        _flush_batch(batch)
+
+
+def _flush_batch(batch):
+    if not batch["audit"] and not batch["results"]:
+        return
+    try:
+        with span("db.write_batch", audit=len(batch["audit"]), results=len(batch["results"])), transaction() as conn:
+            if batch["payloads"]:
+                conn.executemany(PAYLOAD_INSERT_SQL, batch["payloads"].values())
+            if batch["audit"]:
+                conn.executemany(AUDIT_INSERT_SQL, batch["audit"])
+            if batch["results"]:
+                conn.executemany(RESULT_INSERT_SQL, batch["results"])
+        ROWS_WRITTEN.inc(len(batch["audit"]), table="audit_log")
+        ROWS_WRITTEN.inc(len(batch["results"]), table="results")
+        logger.debug("Salvati %d risultati e %d eventi di audit in una transazione.", len(batch["results"]), len(batch["audit"]))
+    except Exception as e:
+        DB_WRITE_ERRORS.inc(operation="write_batch")
+        logger.error("Errore durante il salvataggio del batch di scritture: %s", e)
+
+
+def _audit_row(event_type, source_module, target_subject_name, query_details, result_summary, notes):
+    return (event_type, source_module, target_subject_name, json.dumps(query_details) if query_details else None, result_summary, notes)
+
+
+def log_audit_event(event_type, source_module=None, target_subject_name=None, query_details=None, result_summary=None, notes=None):
+    row = _audit_row(event_type, source_module, target_subject_name, query_details, result_summary, notes)
+    if AUDIT_WRITE_BEHIND:
+        _ensure_audit_writer()
+        _audit_queue.put(row)
+        return
+    batch = getattr(_local, "batch", None)
+    if batch is not None:
+        batch["audit"].append(row)
+        return
+    try:
+        with span("db.audit_event"), transaction() as conn:
+            conn.execute(AUDIT_INSERT_SQL, row)
+        ROWS_WRITTEN.inc(table="audit_log")
+    except Exception as e:
+        DB_WRITE_ERRORS.inc(operation="audit_event")
+        logger.error("Errore durante il logging dell'audit event: %s", e)
+
+
+def _canonical_json(content):
+    return json.dumps(content, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def content_hash(content):
+    """Hash SHA-256 del JSON canonico di 'content' (lo stesso usato come chiave dei payload)."""
+    return hashlib.sha256(_canonical_json(content)).hexdigest()
+
+
+def encode_payload(content):
+    """
+    Serializza 'content' in JSON canonico e lo comprime. Restituisce la riga (hash, codec, size, data)
+    della tabella payloads: contenuti uguali producono lo stesso hash e sono salvati una volta sola.
+    """
+    raw = _canonical_json(content)
+    payload_hash = hashlib.sha256(raw).hexdigest()
+    if len(raw) < PAYLOAD_MIN_COMPRESS:
+        return payload_hash, "raw", len(raw), raw
+    if PAYLOAD_CODEC == "zstd" and zstandard is not None:
+        return payload_hash, "zstd", len(raw), zstandard.ZstdCompressor(level=3).compress(raw)
+    return payload_hash, "zlib", len(raw), zlib.compress(raw, 6)
+
+
+def decode_payload(codec, data):
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Payload compresso con zstd: installare il pacchetto 'zstandard' per leggerlo.")
+        data = zstandard.ZstdDecompressor().decompress(data)
+    elif codec == "zlib":
+        data = zlib.decompress(data)
+    return json.loads(data)
+
+
+def store_payload(content):
+    """Salva un payload (o lo accoda al batch di scrittura attivo). Restituisce il suo hash."""
+    payload = encode_payload(content)
+    batch = getattr(_local, "batch", None)
+    if batch is not None:
+        batch["payloads"].setdefault(payload[0], payload)
+        return payload[0]
+    with transaction() as conn:
+        conn.execute(PAYLOAD_INSERT_SQL, payload)
+    return payload[0]
+
+
+def load_payload(payload_hash):
+    """Contenuto del payload indicato, oppure None se non esiste."""
+    row = get_connection().execute("SELECT codec, data FROM payloads WHERE hash = ?", (payload_hash,)).fetchone()
+    return decode_payload(row[0], row[1]) if row else None
+
+
+def get_idempotent_response(idempotency_key, max_age):
+    """
+    Risposta salvata per la chiave, se più recente di 'max_age' secondi.
+    Restituisce (request_hash, status_code, response_data) oppure None.
+    """
+    row = get_connection().execute('''
+        SELECT request_hash, status_code, response_codec, response_data FROM idempotency_keys
+        WHERE idempotency_key = ? AND created_at >= ?
+    ''', (idempotency_key, time.time() - max_age)).fetchone()
+    if row is None or row[3] is None:
+        return None
+    return row[0], row[1], decode_payload(row[2], row[3])
+
+
+def save_idempotent_response(idempotency_key, request_hash, status_code, response_data, max_age):
+    """
+    Memorizza la risposta per la chiave ed elimina le chiavi scadute. Il corpo, compresso come un payload, resta
+    nella riga della chiave invece che nella tabella payloads: scade ed è eliminato insieme a lei.
+    """
+    response_hash, codec, _, data = encode_payload(response_data)
+    now = time.time()
+    with transaction() as conn:
+        conn.execute('''
+            INSERT OR REPLACE INTO idempotency_keys
+                (idempotency_key, request_hash, status_code, response_hash, response_codec, response_data, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (idempotency_key, request_hash, status_code, response_hash, codec, data, now))
+        conn.execute("DELETE FROM idempotency_keys WHERE created_at < ?", (now - max_age,))
+
+
+def save_result(target_subject_name, data_category, source_api, reliability_score, content_data):
+    """Salva un risultato strutturato nel database (o lo accoda al batch di scrittura attivo)."""
+    payload = encode_payload(content_data)
+    row = (target_subject_name, data_category, source_api, reliability_score, payload[0])
+    batch = getattr(_local, "batch", None)
+    if batch is not None:
+        batch["payloads"].setdefault(payload[0], payload)
+        batch["results"].append(row)
+        return
+    try:
+        with span("db.save_result"), transaction() as conn:
+            conn.execute(PAYLOAD_INSERT_SQL, payload)
+            conn.execute(RESULT_INSERT_SQL, row)
+        ROWS_WRITTEN.inc(table="results")
+        logger.debug("Salvato risultato da '%s' per '%s' categoria '%s'.", source_api, target_subject_name, data_category)
+    except Exception as e:
+        DB_WRITE_ERRORS.inc(operation="save_result")
+        logger.error("Errore durante il salvataggio del risultato: %s", e)
+
+
+def save_results_bulk(rows):
+    """
+    Salva più risultati in un'unica transazione.
+    'rows' è una lista di tuple (target_subject_name, data_category, source_api, reliability_score, content_data).
+    """
+    if not rows:
+        return 0
+    try:
+        payloads = {}
+        result_rows = []
+        for subject, category, source_api, score, content in rows:
+            payload = encode_payload(content)
+            payloads.setdefault(payload[0], payload)
+            result_rows.append((subject, category, source_api, score, payload[0]))
+        with span("db.save_results_bulk", results=len(rows)), transaction() as conn:
+            conn.executemany(PAYLOAD_INSERT_SQL, payloads.values())
+            conn.executemany(RESULT_INSERT_SQL, result_rows)
+        ROWS_WRITTEN.inc(len(rows), table="results")
+        logger.debug("Salvati %d risultati in blocco.", len(rows))
+        return len(rows)
+    except Exception as e:
+        DB_WRITE_ERRORS.inc(operation="save_results_bulk")
+        logger.error("Errore durante il salvataggio in blocco dei risultati: %s", e)
+        return 0
+
+
+def _ensure_audit_writer():
+    global _audit_writer
+    with _audit_writer_lock:
+        if _audit_writer is None:
+            _audit_writer = threading.Thread(target=_audit_writer_loop, name="audit-writer", daemon=True)
+            _audit_writer.start()
+            atexit.register(flush_audit_queue)
+
+
+def _audit_writer_loop():
+    while True:
+        rows = [_audit_queue.get()]
+        # Raccoglie quanto già in coda per scriverlo nella stessa transazione
+        while len(rows) < AUDIT_FLUSH_MAX:
+            try:
+                rows.append(_audit_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            with span("db.audit_write_behind"), transaction() as conn:
+                conn.executemany(AUDIT_INSERT_SQL, rows)
+            ROWS_WRITTEN.inc(len(rows), table="audit_log")
+        except Exception as e:
+            DB_WRITE_ERRORS.inc(operation="audit_write_behind")
+            logger.error("Errore durante la scrittura differita di %d eventi di audit: %s", len(rows), e)
+        finally:
+            for _ in rows:
+                _audit_queue.task_done()
+
+
+def flush_audit_queue():
+    """Attende che gli eventi di audit in coda siano stati scritti (es. allo spegnimento)."""
+    if _audit_writer is not None:
+        _audit_queue.join()
+
+
+def parse_time_bound(value):
+    """
+    Converte un limite temporale ISO 8601 (es. '2024-05-01', '2024-05-01T10:00:00+02:00', '2024-05-01T08:00:00Z')
+    nel formato dei timestamp salvati da SQLite: 'YYYY-MM-DD HH:MM:SS' in UTC. Gli orari senza fuso sono
+    considerati già in UTC. Solleva ValueError se il valore non è una data valida.
+    """
+    if not value:
+        return None
+    try:
+        moment = datetime.datetime.fromisoformat(str(value).strip())
+    except ValueError:
+        raise ValueError(f"Data non valida (atteso formato ISO 8601): {value}") from None
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return moment.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _iter_query(sql, params, fetch_size=200):
+    """Esegue una SELECT su un cursore dedicato e restituisce le righe a blocchi, senza caricarle tutte."""
+    cursor = get_connection().cursor()
+    try:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        cursor.close()
+
+
+RESULT_COLUMNS = "r.id, r.target_subject_name, r.data_category, r.source_api, r.reliability_score, r.retrieved_at, r.report_id, r.payload_hash"
+
+
+def iter_results(target_subject_name, data_category=None, reliability_scores=None, since=None, until=None,
+                 before_id=None, limit=100, with_content=True):
+    """
+    Risultati di un soggetto dal più recente, con paginazione per id (keyset): 'before_id' è il cursore
+    restituito dalla pagina precedente. Produce dizionari, uno per riga.
+    Con with_content=False il contenuto non viene letto né decompresso: resta solo il riferimento payload_hash.
+    """
+    clauses = ["r.target_subject_name = ?"]
+    params = [target_subject_name]
+    if data_category:
+        clauses.append("r.data_category = ?")
+        params.append(data_category)
+    if reliability_scores:
+        clauses.append(f"r.reliability_score IN ({','.join('?' * len(reliability_scores))})")
+        params.extend(reliability_scores)
+    if since:
+        clauses.append("r.retrieved_at >= ?")
+        params.append(parse_time_bound(since))
+    if until:
+        clauses.append("r.retrieved_at <= ?")
+        params.append(parse_time_bound(until))
+    if before_id is not None:
+        clauses.append("r.id < ?")
+        params.append(before_id)
+    params.append(limit)
+
+    content_columns = "r.content_json, p.codec, p.data" if with_content else "NULL, NULL, NULL"
+    sql = f'''
+        SELECT {RESULT_COLUMNS}, {content_columns}
+        FROM results r {"LEFT JOIN payloads p ON p.hash = r.payload_hash" if with_content else ""}
+        WHERE {" AND ".join(clauses)} ORDER BY r.id DESC LIMIT ?
+    '''
+    for row in _iter_query(sql, params):
+        yield _result_item(row, with_content)
+
+
+def _result_item(row, with_content):
+    """Dizionario di una riga di results letta con RESULT_COLUMNS seguite da content_json, codec e data del payload."""
+    item = {
+        "id": row[0],
+        "target_subject_name": row[1],
+        "data_category": row[2],
+        "source_api": row[3],
+        "reliability_score": row[4],
+        "retrieved_at": row[5],
+        "report_id": row[6],
+        "payload_hash": row[7]
+    }
+    if with_content:
+        if row[9] is not None:
+            item["content"] = decode_payload(row[9], row[10])
+        else:
+            item["content"] = json.loads(row[8]) if row[8] else None  # Righe precedenti ai payload
+    return item
+
+
+def _report_filter(subjects, reliability_scores=None, since=None, until=None):
+    clauses = [f"target_subject_name IN ({','.join('?' * len(subjects))})"]
+    params = list(subjects)
+    if reliability_scores:
+        clauses.append(f"reliability_score IN ({','.join('?' * len(reliability_scores))})")
+        params.extend(reliability_scores)
+    if since:
+        clauses.append("retrieved_at >= ?")
+        params.append(parse_time_bound(since))
+    if until:
+        clauses.append("retrieved_at <= ?")
+        params.append(parse_time_bound(until))
+    return " AND ".join(clauses), params
+
+
+def link_results_to_report(report_id, subjects, reliability_scores=None, since=None, until=None, chunk_size=5000):
+    """
+    Collega al report (tabella report_results) i risultati dei soggetti che rispettano i filtri, salvati fino a ora.
+    L'inserimento procede per blocchi di id in transazioni brevi, per non bloccare a lungo le altre scritture;
+    la tabella results non viene modificata. Restituisce il numero di righe collegate.
+    """
+    where, params = _report_filter(subjects, reliability_scores, since, until)
+    conn = get_connection()
+    max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM results").fetchone()[0]
+    linked = 0
+    last_id = 0
+    while True:
+        chunk_end = conn.execute(
+            f"SELECT MAX(id) FROM (SELECT id FROM results WHERE {where} AND id > ? AND id <= ? ORDER BY id LIMIT ?)",
+            (*params, last_id, max_id, chunk_size)
+        ).fetchone()[0]
+        if chunk_end is None:
+            return linked
+        with transaction() as tx:
+            linked += tx.execute(
+                "INSERT OR IGNORE INTO report_results (report_id, target_subject_name, result_id) "
+                f"SELECT ?, target_subject_name, id FROM results WHERE {where} AND id > ? AND id <= ?",
+                (report_id, *params, last_id, chunk_end)
+            ).rowcount
+        last_id = chunk_end
+
+
+def iter_report_results(report_id, with_content=True, page_size=500):
+    """
+    Risultati collegati al report, per soggetto e in ordine di salvataggio, letti a pagine.
+    Ogni pagina è letta per intero con una query keyset (soggetto, id): tra una pagina e l'altra non resta
+    aperto alcun cursore, quindi chi consuma le righe può scrivere sulla stessa connessione.
+    """
+    content_columns = "r.content_json, p.codec, p.data" if with_content else "NULL, NULL, NULL"
+    conn = get_connection()
+    last = None
+    while True:
+        after = "AND (rr.target_subject_name, rr.result_id) > (?, ?)" if last else ""
+        rows = conn.execute(f'''
+            SELECT {RESULT_COLUMNS}, {content_columns}
+            FROM report_results rr JOIN results r ON r.id = rr.result_id
+            {"LEFT JOIN payloads p ON p.hash = r.payload_hash" if with_content else ""}
+            WHERE rr.report_id = ? {after} ORDER BY rr.target_subject_name, rr.result_id LIMIT ?
+        ''', (report_id, *(last or ()), page_size)).fetchall()
+        for row in rows:
+            yield dict(_result_item(row, with_content), report_id=report_id)
+        if len(rows) < page_size:
+            return
+        last = (rows[-1][1], rows[-1][0])
+
+
+def iter_audit_events(target_subject_name=None, event_type=None, source_module=None, since=None, until=None,
+                      before_id=None, limit=100):
+    """Eventi di audit dal più recente, filtrabili e paginati per id come iter_results."""
+    clauses = []
+    params = []
+    for column, value in (("target_subject_name", target_subject_name), ("event_type", event_type), ("source_module", source_module)):
+        if value:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    if since:
+        clauses.append("timestamp >= ?")
+        params.append(parse_time_bound(since))
+    if until:
+        clauses.append("timestamp <= ?")
+        params.append(parse_time_bound(until))
+    if before_id is not None:
+        clauses.append("id < ?")
+        params.append(before_id)
+    params.append(limit)
+
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    sql = f'''
+        SELECT id, timestamp, event_type, source_module, target_subject_name, query_details, result_summary, notes
+        FROM audit_log {where} ORDER BY id DESC LIMIT ?
+    '''
+    for row in _iter_query(sql, params):
+        yield {
+            "id": row[0],
+            "timestamp": row[1],
+            "event_type": row[2],
+            "source_module": row[3],
+            "target_subject_name": row[4],
+            "query_details": json.loads(row[5]) if row[5] else None,
+            "result_summary": row[6],
+            "notes": row[7]
+        }
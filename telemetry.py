@@ -0,0 +1,242 @@
+import os
+import json
+import time
+import uuid
+import queue
+import atexit
+import logging
+import threading
+import contextvars
+import logging.handlers
+from contextlib import contextmanager
+
+# Osservabilità del receiver:
+#  - logging a livelli non bloccante: i record passano da una coda a un thread che scrive su stderr,
+#    così l'I/O su console non rallenta il percorso della richiesta (LOG_LEVEL, default INFO);
+#  - tracing per richiesta: uno span per modulo, chiamata esterna e scrittura su DB, con il trace
+#    completo registrato a fine richiesta sul logger "osint.trace" (TRACE_LOG=1);
+#  - metriche in formato Prometheus esposte da /metrics (contatori, istogrammi, gauge calcolati allo scrape).
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+TRACE_LOG = os.getenv("TRACE_LOG", "0") in ("1", "true")
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(threadName)s] %(name)s: %(message)s"
+
+# Bucket (secondi) degli istogrammi di latenza: dalle scritture su DB alle ricerche Google
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_logging_listener = None
+_logging_lock = threading.Lock()
+
+
+def setup_logging(level=LOG_LEVEL):
+    """Configura il logging non bloccante sul root logger (idempotente)."""
+    global _logging_listener
+    with _logging_lock:
+        if _logging_listener is not None:
+            return
+        log_queue = queue.SimpleQueue()
+        console = logging.StreamHandler()
+        console.setFormatter(logging.Formatter(LOG_FORMAT))
+        _logging_listener = logging.handlers.QueueListener(log_queue, console, respect_handler_level=True)
+        _logging_listener.start()
+        atexit.register(_logging_listener.stop)
+
+        root = logging.getLogger()
+        root.handlers = [logging.handlers.QueueHandler(log_queue)]
+        root.setLevel(level)
+
+
+# --- Metriche ---
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                     for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name, self.help, self.labels = name, help_text, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labels = name, help_text, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}  # chiave etichette -> [conteggi per bucket, somma, totale]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            entry = self._values.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total_sum, count) in sorted(self._values.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labels + ('le',), key + (bound,))} {bucket_count}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels + ('le',), key + ('+Inf',))} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total_sum}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class CallbackGauge:
+    """Gauge il cui valore è letto al momento dello scrape (es. profondità delle code)."""
+
+    def __init__(self, name, help_text, callback):
+        self.name, self.help, self.callback = name, help_text, callback
+
+    def collect(self):
+        try:
+            value = self.callback()
+        except Exception:
+            return []
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+
+_metrics = []
+_metrics_lock = threading.Lock()
+
+
+def _register(metric):
+    with _metrics_lock:
+        _metrics.append(metric)
+    return metric
+
+
+def counter(name, help_text, labels=()):
+    return _register(Counter(name, help_text, labels))
+
+
+def histogram(name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+    return _register(Histogram(name, help_text, labels, buckets))
+
+
+def gauge(name, help_text, callback):
+    return _register(CallbackGauge(name, help_text, callback))
+
+
+def render_metrics():
+    """Testo di esposizione Prometheus di tutte le metriche registrate."""
+    with _metrics_lock:
+        metrics = list(_metrics)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.collect())
+    return "\n".join(lines) + "\n"
+
+
+SPAN_DURATION = histogram("osint_span_duration_seconds", "Durata degli span per nome (moduli, chiamate esterne, scritture DB)", ("span",))
+SPAN_ERRORS = counter("osint_span_errors_total", "Span terminati con un'eccezione", ("span",))
+
+
+# --- Tracing ---
+
+_current_trace = contextvars.ContextVar("osint_trace", default=None)
+_current_span = contextvars.ContextVar("osint_span", default=None)
+
+
+class _Trace:
+    def __init__(self, name, attributes):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attributes = attributes
+        self.started = time.perf_counter()
+        self.spans = []
+        self.lock = threading.Lock()
+
+
+@contextmanager
+def trace(name, **attributes):
+    """Apre un trace per la richiesta corrente; gli span aperti al suo interno vi vengono raccolti."""
+    current = _current_trace.get()
+    if current is not None:
+        with span(name, **attributes):
+            yield current
+        return
+    new_trace = _Trace(name, attributes)
+    trace_token = _current_trace.set(new_trace)
+    span_token = _current_span.set(None)
+    try:
+        with span(name, **attributes):
+            yield new_trace
+    finally:
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+        if TRACE_LOG:
+            logging.getLogger("osint.trace").info(json.dumps({
+                "trace_id": new_trace.trace_id,
+                "name": name,
+                "attributes": attributes,
+                "duration_ms": round((time.perf_counter() - new_trace.started) * 1000, 2),
+                "spans": new_trace.spans,
+            }, default=str))
+
+
+@contextmanager
+def span(name, **attributes):
+    """Misura un'operazione: alimenta l'istogramma di latenza e, se c'è un trace attivo, vi aggiunge lo span."""
+    current_trace = _current_trace.get()
+    span_id = uuid.uuid4().hex[:8]
+    parent_id = _current_span.get()
+    token = _current_span.set(span_id)
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        _current_span.reset(token)
+        SPAN_DURATION.observe(elapsed, span=name)
+        if error is not None:
+            SPAN_ERRORS.inc(span=name)
+        if current_trace is not None:
+            record = {
+                "span_id": span_id,
+                "parent_id": parent_id,
+                "name": name,
+                "start_ms": round((start - current_trace.started) * 1000, 2),
+                "duration_ms": round(elapsed * 1000, 2),
+            }
+            if attributes:
+                record["attributes"] = attributes
+            if error is not None:
+                record["error"] = str(error)
+            with current_trace.lock:
+                current_trace.spans.append(record)
+
+
+def propagate(func):
+    """
+    Avvolge 'func' perché giri nel contesto (trace e span correnti) del chiamante:
+    da usare quando si sottomette lavoro a un ThreadPoolExecutor.
+    """
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(func, *args, **kwargs)
@@ -0,0 +1,19 @@
+import os
+import sys
+import tempfile
+import pytest
+
+# I moduli del progetto sono importati dalla radice del repository (es. "modules.http_client", "telemetry")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Letto da storage all'import: i test non devono mai toccare osint_agi.db
+os.environ.setdefault("OSINT_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="osint-test-"), "osint_agi.db"))
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Database vuoto e inizializzato per il test (ogni thread si riconnette quando cambia DATABASE_NAME)."""
+    import storage
+    monkeypatch.setattr(storage, "DATABASE_NAME", str(tmp_path / "osint_agi.db"))
+    storage.init_db()
+    yield storage.DATABASE_NAME
+    storage.close_connection()
@@ -0,0 +1,128 @@
+import io
+import json
+import threading
+import pytest
+import batch
+import receiver
+from storage import get_connection
+
+# Screening in blocco: lettura del flusso, deduplicazione, concorrenza limitata, scrittura a blocchi
+# e risposta NDJSON di /process_osint_batch.
+
+
+def _screen(nome, cognome):
+    subject = f"{nome} {cognome}"
+    if nome == "Errore":
+        raise RuntimeError("sorgente non disponibile")
+    return {"m1": {"status": "successo"}, "saved_rows": 1}, [(subject, "sanzioni", "test", "A", {"soggetto": subject})]
+
+
+async def _screen_async(nome, cognome):
+    return _screen(nome, cognome)
+
+
+@pytest.mark.parametrize("fmt, text, expected", [
+    ("jsonl", '{"nome": "Mario", "cognome": "Rossi"}\n\n  \n{"nome": "Anna", "cognome": "Bianchi", "eta": 40}\n',
+     [{"nome": "Mario", "cognome": "Rossi"}, {"nome": "Anna", "cognome": "Bianchi", "eta": 40}]),
+    ("jsonl", '{"nome": \n[1, 2]\n', ["_errore", "_errore"]),
+    ("csv", "Nome , COGNOME\n Mario ,Rossi\nAnna,\n", [{"nome": "Mario", "cognome": "Rossi"}, {"nome": "Anna", "cognome": ""}]),
+])
+def test_iter_subjects(fmt, text, expected):
+    subjects = list(batch.iter_subjects(io.StringIO(text), fmt))
+    if expected and expected[0] == "_errore":
+        assert all("_errore" in subject and "_riga" in subject for subject in subjects)
+        assert len(subjects) == len(expected)
+    else:
+        assert subjects == expected
+
+
+def test_run_batch_dedups_and_reports():
+    written = []
+    subjects = [
+        {"nome": "Mario", "cognome": "Rossi"},
+        {"nome": " MARIO ", "cognome": "rossi"},  # Stesso nome normalizzato
+        {"nome": "Anna"},
+        {"_errore": "Riga JSON non valida", "_riga": "{"},
+        {"nome": "Errore", "cognome": "Verdi"},
+        {"nome": "Anna", "cognome": "Bianchi"},
+    ]
+    records = list(batch.run_batch(subjects, _screen, lambda rows: written.extend(rows) or len(rows),
+                                   max_concurrency=2, flush_rows=1))
+
+    summary = records[-1]
+    assert summary == {"status": "riepilogo", "ricevuti": 6, "duplicati": 1, "non_validi": 2,
+                       "elaborati": 2, "errori": 1, "righe_salvate": 2}
+    by_subject = {(r.get("nome"), r.get("cognome")): r for r in records[:-1] if "nome" in r}
+    assert by_subject[("Mario", "Rossi")]["status"] == "successo"
+    assert by_subject[("Mario", "Rossi")]["subject_key"] == "mario rossi"
+    assert by_subject[("Errore", "Verdi")] == {"nome": "Errore", "cognome": "Verdi", "subject_key": "errore verdi",
+                                               "status": "errore", "message": "sorgente non disponibile"}
+    invalid = [r for r in records if "input" in r]
+    assert [r["message"] for r in invalid] == ["Nome e cognome sono richiesti", "Riga JSON non valida"]
+    assert sorted(row[0] for row in written) == ["Anna Bianchi", "Mario Rossi"]
+
+
+def test_run_batch_bounds_concurrency():
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def screen(nome, cognome):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        threading.Event().wait(0.02)
+        with lock:
+            active[0] -= 1
+        return {}, []
+
+    subjects = ({"nome": f"Nome{i}", "cognome": "Rossi"} for i in range(12))
+    records = list(batch.run_batch(subjects, screen, lambda rows: len(rows), max_concurrency=3))
+    assert records[-1]["elaborati"] == 12
+    assert peak[0] == 3
+
+
+def test_run_batch_async():
+    records = list(batch.run_batch([{"nome": "Mario", "cognome": "Rossi"}, {"nome": "Errore", "cognome": "Verdi"}],
+                                   None, lambda rows: len(rows), screen_subject_async=_screen_async))
+    assert records[-1]["elaborati"] == 1 and records[-1]["errori"] == 1 and records[-1]["righe_salvate"] == 1
+
+
+@pytest.fixture
+def client(db, monkeypatch):
+    monkeypatch.setattr(receiver, "screen_subject", _screen)
+    monkeypatch.setattr(receiver, "screen_subject_async", _screen_async)
+    return receiver.app.test_client()
+
+
+def _ndjson(response):
+    assert response.mimetype == "application/x-ndjson"
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+@pytest.mark.parametrize("mode", ["async", "thread"])
+def test_batch_endpoint_streams_ndjson(client, mode):
+    body = "\n".join(json.dumps(s) for s in [
+        {"nome": "Mario", "cognome": "Rossi"}, {"nome": "mario", "cognome": "ROSSI"}, {"nome": "Anna", "cognome": "Bianchi"},
+    ])
+    response = client.post(f"/process_osint_batch?mode={mode}&concurrency=2", data=body,
+                           content_type="application/x-ndjson")
+    assert response.status_code == 200
+    records = _ndjson(response)
+    assert sorted(r["subject_key"] for r in records[:-1]) == ["anna bianchi", "mario rossi"]
+    assert records[-1]["duplicati"] == 1 and records[-1]["righe_salvate"] == 2
+    assert get_connection().execute("SELECT COUNT(*) FROM results").fetchone()[0] == 2
+
+
+def test_batch_endpoint_reads_csv(client):
+    response = client.post("/process_osint_batch", data="nome,cognome\nMario,Rossi\n,Bianchi\n", content_type="text/csv")
+    records = _ndjson(response)
+    assert [r.get("subject_key") for r in records[:-1] if r["status"] == "successo"] == ["mario rossi"]
+    assert [r["input"] for r in records if "input" in r] == [{"nome": "", "cognome": "Bianchi"}]
+    assert records[-1]["elaborati"] == 1 and records[-1]["non_validi"] == 1
+
+
+@pytest.mark.parametrize("query", ["?mode=processi", "?concurrency=0", "?concurrency=-3", "?concurrency=molti"])
+def test_batch_endpoint_rejects_invalid_parameters(client, query):
+    response = client.post(f"/process_osint_batch{query}", data='{"nome": "Mario", "cognome": "Rossi"}\n')
+    assert response.status_code == 400
+    assert get_connection().execute("SELECT COUNT(*) FROM results").fetchone()[0] == 0
@@ -0,0 +1,61 @@
+import sqlite3
+import pytest
+from modules import cache
+
+# Cache delle sorgenti: memoria davanti a SQLite, sulla connessione del thread di storage.
+
+SOURCE = "sanctions_network"
+
+
+@pytest.fixture
+def clean_cache(db, monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_ENABLED", True)
+    cache._memory.clear()
+    yield
+    cache._memory.clear()
+
+
+def test_roundtrip_reuses_thread_connection(clean_cache, monkeypatch):
+    cache.cache_set(SOURCE, "mario rossi", {"results": [1]})
+    cache._memory.clear()
+
+    def no_connect(*args, **kwargs):
+        raise AssertionError("La cache non deve aprire nuove connessioni")
+
+    monkeypatch.setattr(sqlite3, "connect", no_connect)
+    value, age = cache.cache_get(SOURCE, "mario rossi")
+    assert value == {"results": [1]} and age >= 0
+    assert cache.cache_get(SOURCE, "mario rossi")[0] == {"results": [1]}  # Ora dalla memoria
+    cache.cache_set(SOURCE, "anna bianchi", {"results": []})
+    assert cache.invalidate_subject("anna bianchi") == 1
+
+
+def test_expired_entries_are_removed(clean_cache, monkeypatch):
+    cache.cache_set(SOURCE, "mario rossi", {"results": [1]})
+    cache._memory.clear()
+    monkeypatch.setitem(cache.CACHE_POLICIES, SOURCE, dict(cache.CACHE_POLICIES[SOURCE], ttl=-1))
+    assert cache.cache_get(SOURCE, "mario rossi") is None
+    monkeypatch.setitem(cache.CACHE_POLICIES, SOURCE, dict(cache.CACHE_POLICIES[SOURCE], ttl=3600))
+    assert cache.cache_get(SOURCE, "mario rossi") is None
+
+
+def test_invalidate_subject_includes_variants(clean_cache):
+    cache.cache_set(SOURCE, "mario rossi", {"n": 1})
+    cache.cache_set(SOURCE, "rossi mario", {"n": 2}, subject_key="mario rossi")
+    cache.cache_set("google_dorks_anagrafica", "mario rossi", {"n": 3})
+    assert cache.invalidate_subject("mario rossi", source=SOURCE) == 2
+    assert cache.cache_get(SOURCE, "rossi mario") is None
+    assert cache.cache_get("google_dorks_anagrafica", "mario rossi")[0] == {"n": 3}
+
+
+def test_bypass_skips_reads_but_refreshes(clean_cache):
+    cache.cache_set(SOURCE, "mario rossi", {"n": 1})
+    with cache.bypass_cache():
+        assert cache.cache_get(SOURCE, "mario rossi") is None
+        cache.cache_set(SOURCE, "mario rossi", {"n": 2})
+    assert cache.cache_get(SOURCE, "mario rossi")[0] == {"n": 2}
+
+
+def test_uncached_sources_are_ignored(clean_cache):
+    cache.cache_set("altra_fonte", "mario rossi", {"n": 1})
+    assert cache.cache_get("altra_fonte", "mario rossi") is None
@@ -0,0 +1,87 @@
+import threading
+import pytest
+from coalescing import SingleFlight
+
+# Accorpamento single-flight: una sola esecuzione per chiave tra chiamate concorrenti.
+
+
+def _run_concurrently(flight, key, func, n):
+    results = [None] * n
+    errors = [None] * n
+
+    def call(i):
+        try:
+            results[i] = flight.do(key, func)
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    return threads, results, errors
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight("test")
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {"valore": 42}
+
+    threads, results, errors = _run_concurrently(flight, "k", compute, 5)
+    assert started.wait(5)
+    threading.Event().wait(0.1)  # I chiamanti successivi arrivano mentre il calcolo è in corso
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert calls == [1]
+    assert errors == [None] * 5
+    assert all(result is results[0][0] for result, _ in results)
+    assert sorted(shared for _, shared in results) == [False, True, True, True, True]
+    assert flight.in_flight() == 0
+
+
+def test_error_is_raised_to_every_waiter():
+    flight = SingleFlight("test")
+    started, release = threading.Event(), threading.Event()
+
+    def fail():
+        started.set()
+        release.wait(5)
+        raise RuntimeError("provider non disponibile")
+
+    threads, results, errors = _run_concurrently(flight, "k", fail, 3)
+    assert started.wait(5)
+    threading.Event().wait(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert all(isinstance(error, RuntimeError) for error in errors)
+    assert flight.in_flight() == 0
+
+
+def test_key_is_released_after_completion():
+    flight = SingleFlight("test")
+    calls = []
+    assert flight.do("k", lambda: calls.append(1) or len(calls)) == (1, False)
+    assert flight.do("k", lambda: calls.append(1) or len(calls)) == (2, False)
+    with pytest.raises(ValueError):
+        flight.do("k", lambda: int("x"))
+    assert flight.do("k", lambda: "ok") == ("ok", False)
+
+
+def test_different_keys_do_not_wait_for_each_other():
+    flight = SingleFlight("test")
+    release = threading.Event()
+    threads, _, _ = _run_concurrently(flight, "lenta", lambda: release.wait(5), 1)
+    try:
+        assert flight.do("veloce", lambda: "ok") == ("ok", False)
+    finally:
+        release.set()
+        threads[0].join(5)
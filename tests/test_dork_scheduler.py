@@ -0,0 +1,105 @@
+import time
+import threading
+from concurrent.futures import wait
+import pytest
+from bench.stub_servers import StubConfig, start_stub_server
+from modules import dork_scheduler
+from modules.dork_scheduler import DorkScheduler
+
+# Scheduler dei dork contro il server di ricerca locale (bench/stub_servers.py), che risponde 429
+# con Retry-After: 1 a ogni richiesta fallita.
+
+
+@pytest.fixture
+def search_stub(monkeypatch):
+    config = StubConfig(latency_ms=100, jitter_ms=0)
+    server, url = start_stub_server("search", config)
+    monkeypatch.setattr(dork_scheduler, "DORK_SEARCH_URL", url)
+    monkeypatch.setattr(dork_scheduler, "DORK_BACKOFF_BASE", 0.1)
+    yield config
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def make_scheduler():
+    schedulers = []
+
+    def make(**kwargs):
+        scheduler = DorkScheduler(rate_per_minute=6000, burst=10, **kwargs)
+        schedulers.append(scheduler)
+        return scheduler
+
+    yield make
+    # I worker restano sul loop condiviso: vanno fermati prima che lo scheduler venga raccolto
+    for scheduler in schedulers:
+        for worker in scheduler._workers:
+            worker.cancel()
+        wait(scheduler._workers, timeout=5)
+
+
+def test_identical_dorks_run_once(search_stub, make_scheduler):
+    scheduler = make_scheduler(workers=2)
+    first = scheduler.submit('"Mario Rossi" site:example.org', owner="a")
+    second = scheduler.submit('"Mario Rossi" site:example.org', owner="b")
+    assert first is second
+    assert len(first.result(timeout=5)) == 3
+    assert search_stub.requests == 1
+
+
+def test_rate_limited_dork_is_retried(search_stub, make_scheduler):
+    search_stub.error_rate = 1.0
+    scheduler = make_scheduler(workers=1)
+    future = scheduler.submit('"Mario Rossi" fallimento', owner="a")
+    threading.Timer(0.3, setattr, (search_stub, "error_rate", 0.0)).start()
+    started = time.monotonic()
+    assert len(future.result(timeout=10)) == 3
+    # Il 429 sospende lo scheduler almeno per il Retry-After indicato dal server
+    assert time.monotonic() - started >= 1.0
+    assert search_stub.requests == 2
+
+
+def test_released_dork_is_not_searched(search_stub, make_scheduler):
+    scheduler = make_scheduler(workers=1)
+    futures = [scheduler.submit(f'"Mario Rossi" dork {i}', owner="a") for i in range(3)]
+    scheduler.release(futures[2])
+    assert futures[2].cancelled()
+    assert all(len(future.result(timeout=5)) == 3 for future in futures[:2])
+    assert search_stub.requests == 2
+    assert scheduler.pending == 0
+
+
+@pytest.mark.parametrize("active_owners, expected", [
+    (1, ["a1", "a2", "b1", "b2", "c1", "c2"]),
+    (2, ["a1", "b1", "a2", "b2", "c1", "c2"]),
+    (3, ["a1", "b1", "c1", "a2", "b2", "c2"]),
+])
+def test_owners_are_served_in_arrival_order(make_scheduler, active_owners, expected):
+    # Senza worker: l'ordine di servizio si legge direttamente da _pop_next
+    scheduler = make_scheduler(workers=0, active_owners=active_owners)
+    for owner in "abc":
+        for i in (1, 2):
+            scheduler.submit(f"{owner}{i}", owner=owner)
+    order = []
+    while (next_job := scheduler._pop_next()) is not None:
+        order.append(next_job[0].key[0])
+    assert order == expected
+
+
+def test_dork_source_returns_partial_results_on_timeout(search_stub, make_scheduler, monkeypatch):
+    from modules import m1_anagrafica
+    from modules.async_runtime import run_sync
+    # Budget di due ricerche, poi una ogni minuto: allo scadere restano quattro dork in coda
+    scheduler = make_scheduler(workers=1)
+    scheduler.bucket = dork_scheduler.TokenBucket(1 / 60.0, 2)
+    monkeypatch.setattr(m1_anagrafica, "get_scheduler", lambda: scheduler)
+    started = time.monotonic()
+    result = run_sync(m1_anagrafica.search_google_dorks_anagrafica_async("Mario", "Rossi", num_results=3, timeout=1))
+    assert time.monotonic() - started < 3
+    assert result["status"] == "successo"
+    urls = [item for item in result["results"] if "url_found" in item]
+    skipped = [item for item in result["results"] if "error" in item]
+    assert len(urls) == 6
+    assert len(skipped) == 4
+    assert all(item["error"].startswith("Timeout") for item in skipped)
+    assert scheduler.pending == 0
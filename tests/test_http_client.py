@@ -0,0 +1,146 @@
+import time
+import threading
+import pytest
+import requests
+from bench.stub_servers import StubConfig, start_stub_server
+from modules import http_client
+from modules.async_runtime import submit
+from modules.http_client import (
+    CircuitBreaker, CircuitOpenError, RequestCancelled, async_request_with_retry, request_with_retry
+)
+
+# Retry, deadline, annullamento e circuit breaker del client condiviso contro il server sanzioni locale
+# (bench/stub_servers.py), che risponde 503 con Retry-After: 1 a ogni richiesta fallita.
+
+
+@pytest.fixture
+def stub():
+    config = StubConfig(latency_ms=0, jitter_ms=0)
+    server, url = start_stub_server("sanctions", config)
+    yield config, url
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def breaker():
+    # Breaker dedicato al test, con soglia e reset brevi
+    name = f"test-{time.monotonic_ns()}"
+    http_client._breakers[name] = CircuitBreaker(name, failure_threshold=2, reset_timeout=0.3)
+    yield name
+    http_client._breakers.pop(name, None)
+
+
+def test_retries_until_success(stub):
+    config, url = stub
+    config.error_rate = 1.0
+    threading.Timer(0.2, setattr, (config, "error_rate", 0.0)).start()
+    response = request_with_retry("GET", url, params={"name": "Mario Rossi"}, max_retries=3, timeout=5)
+    assert response.status_code == 200
+    assert response.json()[0]["names"][0] == "Mario Rossi"
+    assert config.requests == 2
+
+
+def test_returns_last_response_after_max_retries(stub, monkeypatch):
+    config, url = stub
+    config.error_rate = 1.0
+    monkeypatch.setattr(http_client, "HTTP_RETRY_AFTER_MAX", 0.01)
+    response = request_with_retry("GET", url, max_retries=2, timeout=5)
+    assert response.status_code == 503
+    assert config.requests == 3
+
+
+def test_deadline_skips_retries_past_it(stub):
+    config, url = stub
+    config.error_rate = 1.0
+    started = time.monotonic()
+    response = request_with_retry("GET", url, max_retries=3, deadline=started + 0.5, timeout=5)
+    assert response.status_code == 503
+    assert config.requests == 1
+    assert time.monotonic() - started < 0.5
+
+
+def test_cancel_event_interrupts_wait(stub):
+    config, url = stub
+    config.error_rate = 1.0
+    cancel_event = threading.Event()
+    threading.Timer(0.1, cancel_event.set).start()
+    started = time.monotonic()
+    with pytest.raises(RequestCancelled):
+        request_with_retry("GET", url, max_retries=3, cancel_event=cancel_event, timeout=5)
+    assert time.monotonic() - started < 0.9
+    assert config.requests == 1
+
+
+def test_cancelled_async_request_stops_retrying(stub):
+    config, url = stub
+    config.error_rate = 1.0
+    future = submit(async_request_with_retry("GET", url, max_retries=3, timeout=5))
+    time.sleep(0.2)
+    future.cancel()
+    time.sleep(1.5)  # Oltre il Retry-After: un nuovo tentativo sarebbe già partito
+    assert config.requests == 1
+
+
+def test_breaker_opens_and_recovers(stub, breaker):
+    config, url = stub
+    config.error_rate = 1.0
+    for _ in range(2):
+        assert request_with_retry("GET", url, service=breaker, max_retries=0, timeout=5).status_code == 503
+    with pytest.raises(CircuitOpenError):
+        request_with_retry("GET", url, service=breaker, max_retries=0, timeout=5)
+    assert config.requests == 2
+    assert http_client.get_circuit_breaker(breaker).state == "open"
+
+    time.sleep(0.3)
+    config.error_rate = 0.0
+    assert request_with_retry("GET", url, service=breaker, max_retries=0, timeout=5).status_code == 200
+    assert http_client.get_circuit_breaker(breaker).state == "closed"
+
+
+def test_rate_limit_does_not_open_breaker(breaker):
+    config = StubConfig(latency_ms=0, jitter_ms=0, error_rate=1.0)
+    server, url = start_stub_server("search", config)
+    try:
+        for _ in range(3):
+            assert request_with_retry("GET", url, service=breaker, max_retries=0, timeout=5).status_code == 429
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert http_client.get_circuit_breaker(breaker).state == "closed"
+
+
+def _open_breaker(name, url):
+    for _ in range(2):
+        request_with_retry("GET", url, service=name, max_retries=0, timeout=5)
+    assert http_client.get_circuit_breaker(name).state == "open"
+    time.sleep(0.3)
+    assert http_client.get_circuit_breaker(name).state == "half_open"
+
+
+def test_cancelled_probe_releases_breaker(stub, breaker):
+    config, url = stub
+    config.error_rate = 1.0
+    _open_breaker(breaker, url)
+    config.error_rate = 0.0
+    config.latency_ms = 1000
+    probe = submit(async_request_with_retry("GET", url, service=breaker, max_retries=0, timeout=5))
+    time.sleep(0.2)
+    probe.cancel()
+    # Con httpx la prova annullata conta come fallimento e dopo reset_timeout il circuito torna half-open;
+    # senza httpx la richiesta nel thread termina comunque (latenza del server) e richiude il circuito
+    time.sleep(1.2)
+    config.latency_ms = 0
+    assert request_with_retry("GET", url, service=breaker, max_retries=0, timeout=5).status_code == 200
+    assert http_client.get_circuit_breaker(breaker).state == "closed"
+
+
+def test_unexpected_error_in_probe_releases_breaker(stub, breaker):
+    config, url = stub
+    config.error_rate = 1.0
+    _open_breaker(breaker, url)
+    with pytest.raises(requests.exceptions.InvalidURL):
+        request_with_retry("GET", "http://[invalid", service=breaker, max_retries=0, timeout=5)
+    time.sleep(0.3)
+    config.error_rate = 0.0
+    assert request_with_retry("GET", url, service=breaker, max_retries=0, timeout=5).status_code == 200
@@ -0,0 +1,95 @@
+import threading
+import pytest
+import receiver
+from storage import get_connection
+
+# Idempotency-Key su /process_osint_data e accorpamento delle pipeline concorrenti per lo stesso soggetto.
+
+
+@pytest.fixture
+def pipeline(db, monkeypatch):
+    """Pipeline sostituita: conta le esecuzioni e può essere trattenuta finché non si imposta 'release'."""
+    calls = []
+    release = threading.Event()
+    release.set()
+
+    def run(data, raw_mode):
+        calls.append(data["nome"])
+        release.wait(5)
+        return {"status": "successo", "soggetto": data["nome"], "esecuzione": len(calls)}, 200
+
+    run.calls = calls
+    run.release = release
+    monkeypatch.setattr(receiver, "_run_traced_pipeline", run)
+    return run
+
+
+@pytest.fixture
+def client(pipeline):
+    return receiver.app.test_client()
+
+
+def _post(client, body, key=None, query=""):
+    headers = {"Idempotency-Key": key} if key else {}
+    return client.post(f"/process_osint_data{query}", json=body, headers=headers)
+
+
+def test_matching_key_is_replayed(client, pipeline):
+    body = {"nome": "Mario", "cognome": "Rossi"}
+    first = _post(client, body, key="chiave-1")
+    second = _post(client, body, key="chiave-1")
+
+    assert first.status_code == second.status_code == 200
+    assert "Idempotent-Replayed" not in first.headers
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert second.get_json() == first.get_json()
+    assert pipeline.calls == ["Mario"]
+
+
+def test_same_key_with_different_request_is_rejected(client, pipeline):
+    _post(client, {"nome": "Mario", "cognome": "Rossi"}, key="chiave-1")
+    response = _post(client, {"nome": "Luigi", "cognome": "Rossi"}, key="chiave-1")
+    assert response.status_code == 422
+    assert "Idempotency-Key" in response.get_json()["message"]
+    # Anche i parametri della query fanno parte della richiesta
+    assert _post(client, {"nome": "Mario", "cognome": "Rossi"}, key="chiave-1", query="?raw=ref").status_code == 422
+    assert pipeline.calls == ["Mario"]
+
+
+def test_requests_without_key_are_not_replayed(client, pipeline):
+    body = {"nome": "Mario", "cognome": "Rossi"}
+    _post(client, body)
+    response = _post(client, body)
+    assert "Idempotent-Replayed" not in response.headers
+    assert pipeline.calls == ["Mario", "Mario"]
+
+
+def test_server_errors_are_not_stored(client, pipeline, monkeypatch):
+    monkeypatch.setattr(receiver, "_run_traced_pipeline", lambda data, raw_mode: ({"status": "errore"}, 503))
+    assert _post(client, {"nome": "Mario", "cognome": "Rossi"}, key="chiave-1").status_code == 503
+    assert get_connection().execute("SELECT COUNT(*) FROM idempotency_keys").fetchone()[0] == 0
+
+
+def test_concurrent_requests_share_one_pipeline(client, pipeline):
+    pipeline.release.clear()
+    # async e callback_url non fanno parte della chiave di accorpamento (qui con valori che non attivano i job)
+    bodies = [{"nome": "Mario", "cognome": "Rossi", "async": False, "callback_url": f"https://hook/{i}"} for i in range(4)]
+    responses = []
+
+    def post(body):
+        responses.append(receiver.app.test_client().post("/process_osint_data", json=body))
+
+    threads = [threading.Thread(target=post, args=(body,)) for body in bodies]
+    for thread in threads:
+        thread.start()
+    threading.Event().wait(0.3)  # Tutte le richieste arrivano mentre la prima è in corso
+    pipeline.release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert pipeline.calls == ["Mario"]
+    assert [response.status_code for response in responses] == [200] * 4
+    assert len({response.get_data() for response in responses}) == 1
+    shared = get_connection().execute(
+        "SELECT COUNT(*) FROM audit_log WHERE event_type = 'RICHIESTA_ACCORPATA'").fetchone()[0]
+    assert shared == 3
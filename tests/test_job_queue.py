@@ -0,0 +1,207 @@
+import datetime
+import threading
+import pytest
+import job_queue
+from storage import get_connection, transaction
+
+# Coda dei job su un database temporaneo: presa in carico, ripresa dei job abbandonati, notifica al callback_url
+# (protezione da SSRF) e ciclo di vita esposto da /jobs/<id>.
+
+
+@pytest.fixture
+def runner(db):
+    """Runner dei job che attende 'release' prima di terminare e conta le esecuzioni per soggetto."""
+    calls = []
+    release = threading.Event()
+
+    def run(payload):
+        calls.append(payload["nome"])
+        release.wait(5)
+        return {"status": "successo", "nome": payload["nome"]}, 200
+
+    run.calls = calls
+    run.release = release
+    job_queue.start_workers(run, max_workers=1)
+    yield run
+    release.set()
+    job_queue.stop_workers(timeout=5)
+
+
+def _age_job(job_id, column="created_at", hours=2):
+    old = (datetime.datetime.now() - datetime.timedelta(hours=hours)).isoformat()
+    with transaction() as conn:
+        conn.execute(f"UPDATE jobs SET {column} = ? WHERE id = ?", (old, job_id))
+
+
+def _wait_status(statuses, *job_ids):
+    for _ in range(100):
+        if all(job_queue.get_job(job_id)["status"] in statuses for job_id in job_ids):
+            return
+        threading.Event().wait(0.05)
+    raise AssertionError(f"Job non arrivati allo stato {statuses}")
+
+
+def _wait_finished(*job_ids):
+    _wait_status((job_queue.JOB_COMPLETATO, job_queue.JOB_ERRORE), *job_ids)
+
+
+def test_reaper_does_not_resubmit_queued_jobs(runner):
+    running = job_queue.submit_job({"nome": "Mario"})
+    _wait_status((job_queue.JOB_IN_ESECUZIONE,), running)
+    while job_queue._queue_depth[job_queue.JOB_IN_ESECUZIONE] == 0:  # Il contatore segue la presa in carico
+        threading.Event().wait(0.01)
+    queued = job_queue.submit_job({"nome": "Luigi"})
+    _age_job(queued)
+    for _ in range(3):
+        job_queue.recover_stale_jobs(max_age=3600)
+    assert job_queue._queue_depth[job_queue.JOB_IN_CODA] == 1
+    assert len(job_queue._in_flight) == 2
+
+    runner.release.set()
+    _wait_finished(running, queued)
+    assert sorted(runner.calls) == ["Luigi", "Mario"]
+
+
+def test_stale_running_job_is_requeued_once(runner):
+    runner.release.set()
+    job_id = job_queue.submit_job({"nome": "Mario"})
+    _wait_finished(job_id)
+    # Simula un job rimasto "in_esecuzione" dopo la morte del worker che lo eseguiva
+    with transaction() as conn:
+        conn.execute("UPDATE jobs SET status = ? WHERE id = ?", (job_queue.JOB_IN_ESECUZIONE, job_id))
+    _age_job(job_id, column="started_at")
+
+    assert job_queue.recover_stale_jobs(max_age=3600) == 1
+    assert job_queue.recover_stale_jobs(max_age=3600) == 0
+    _wait_finished(job_id)
+    assert runner.calls == ["Mario", "Mario"]
+
+
+def test_job_is_claimed_once(db):
+    job_id = "job-claim"
+    with transaction() as conn:
+        conn.execute("INSERT INTO jobs (id, status, payload_json, created_at) VALUES (?, ?, '{}', ?)",
+                     (job_id, job_queue.JOB_IN_CODA, job_queue._now()))
+    assert job_queue._claim_job(job_id) is True
+    assert job_queue._claim_job(job_id) is False
+    assert job_queue.get_job(job_id)["status"] == job_queue.JOB_IN_ESECUZIONE
+
+
+@pytest.mark.parametrize("url", [
+    "https://127.0.0.1/hook",
+    "https://localhost/hook",
+    "https://10.1.2.3/hook",
+    "https://192.168.0.10/hook",
+    "https://169.254.169.254/latest/meta-data",
+    "https://[::1]/hook",
+    "https://[fd00::1]/hook",
+    "http://93.184.216.34/hook",
+    "ftp://93.184.216.34/hook",
+    "https:///hook",
+    None,
+])
+def test_callback_url_rejected(url):
+    with pytest.raises(ValueError):
+        job_queue.validate_callback_url(url)
+
+
+def test_public_callback_url_accepted():
+    job_queue.validate_callback_url("https://93.184.216.34/hook")
+
+
+@pytest.mark.parametrize("url, allowed", [
+    ("https://hook.eu1.make.com/abc", True),
+    ("https://make.com/abc", True),
+    ("https://evilmake.com/abc", False),
+    ("https://example.org/abc", True),
+    ("https://www.example.org/abc", False),
+])
+def test_callback_allowlist(monkeypatch, url, allowed):
+    monkeypatch.setattr(job_queue, "CALLBACK_ALLOWED_HOSTS", [".make.com", "example.org"])
+    if allowed:
+        job_queue.validate_callback_url(url)
+    else:
+        with pytest.raises(ValueError):
+            job_queue.validate_callback_url(url)
+
+
+@pytest.fixture
+def callback_server():
+    """Webhook locale che risponde con un redirect verso /interno e registra i percorsi richiesti."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    paths = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            paths.append(self.path)
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            self.send_response(302)
+            self.send_header("Location", "/interno")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        do_GET = do_POST
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/hook", paths
+    server.shutdown()
+    server.server_close()
+
+
+def _insert_finished_job(job_id, callback_url):
+    with transaction() as conn:
+        conn.execute("INSERT INTO jobs (id, status, payload_json, callback_url, created_at) VALUES (?, ?, '{}', ?, ?)",
+                     (job_id, job_queue.JOB_COMPLETATO, callback_url, job_queue._now()))
+
+
+def test_callback_does_not_follow_redirects(db, callback_server, monkeypatch):
+    url, paths = callback_server
+    monkeypatch.setattr(job_queue, "CALLBACK_ALLOWED_SCHEMES", ["http"])
+    monkeypatch.setattr(job_queue, "CALLBACK_ALLOWED_HOSTS", ["127.0.0.1"])
+    _insert_finished_job("job-redirect", url)
+    job_queue._send_callback("job-redirect", url)
+    assert job_queue.get_job("job-redirect")["callback_status"] == "HTTP 302"
+    assert paths == ["/hook"]
+
+
+def test_callback_to_private_address_is_not_sent(db, callback_server):
+    url, paths = callback_server
+    _insert_finished_job("job-ssrf", url)  # Es. job registrato prima dell'introduzione del controllo
+    job_queue._send_callback("job-ssrf", url)
+    assert job_queue.get_job("job-ssrf")["callback_status"].startswith("rifiutato")
+    assert paths == []
+
+
+@pytest.fixture
+def client(db, monkeypatch):
+    import receiver
+    monkeypatch.setattr(receiver, "run_osint_pipeline",
+                        lambda data, raw_mode=None: ({"status": "successo", "soggetto": data["nome"]}, 200))
+    yield receiver.app.test_client()
+    job_queue.stop_workers(timeout=5)
+
+
+def test_job_lifecycle(client):
+    response = client.post("/process_osint_data?async=1", json={"nome": "Mario", "cognome": "Rossi"})
+    assert response.status_code == 202
+    job_id = response.get_json()["job_id"]
+    assert response.get_json()["status_url"].endswith(f"/jobs/{job_id}")
+
+    _wait_finished(job_id)
+    job = client.get(f"/jobs/{job_id}").get_json()
+    assert job["status"] == job_queue.JOB_COMPLETATO
+    assert job["result"] == {"status": "successo", "soggetto": "Mario"}
+    assert job["started_at"] and job["finished_at"]
+    assert client.get("/jobs/inesistente").status_code == 404
+
+
+def test_job_with_private_callback_is_rejected(client):
+    response = client.post("/process_osint_data?async=1",
+                           json={"nome": "Mario", "cognome": "Rossi", "callback_url": "https://169.254.169.254/"})
+    assert response.status_code == 400
+    assert "callback_url" in response.get_json()["message"]
+    assert get_connection().execute("SELECT COUNT(*) FROM jobs").fetchone()[0] == 0
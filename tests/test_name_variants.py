@@ -0,0 +1,103 @@
+import pytest
+from modules.name_variants import VARIANT_WEIGHTS, generate_variants, plan_queries
+
+# Varianti dei nomi: deduplicazione per chiave normalizzata, ordine per peso, varianti fornite non valide
+# e ripartizione del budget di interrogazioni tra le sorgenti.
+
+
+def _pairs(variants):
+    return [(v["nome"], v["cognome"], v["tipo"]) for v in variants]
+
+
+@pytest.mark.parametrize("nome, cognome, expected", [
+    ("Mario", "Rossi", [
+        ("Mario", "Rossi", "originale"),
+        ("Rossi", "Mario", "inversione"),
+        ("M.", "Rossi", "iniziale"),
+    ]),
+    # 'Simic' (diacritici) ha la stessa chiave dell'originale e non produce una seconda interrogazione
+    ("Ivan", "Šimić", [
+        ("Ivan", "Šimić", "originale"),
+        ("Ivan", "Shimich", "traslitterazione"),
+        ("Ivan", "Simich", "grafia"),
+        ("Ivan", "Simitch", "grafia"),
+        ("Šimić", "Ivan", "inversione"),
+        ("I.", "Simic", "iniziale"),
+    ]),
+    ("Иван", "Петров", [
+        ("Иван", "Петров", "originale"),
+        ("Ivan", "Petrov", "traslitterazione"),
+        ("Ivan", "Petroff", "grafia"),
+        ("Петров", "Иван", "inversione"),
+        ("I.", "Petrov", "iniziale"),
+    ]),
+    ("Luca", "De Luca", [
+        ("Luca", "De Luca", "originale"),
+        ("Luca", "Deluca", "grafia"),
+        ("De Luca", "Luca", "inversione"),
+        ("L.", "De Luca", "iniziale"),
+    ]),
+    ("Jürgen", "Müller", [
+        ("Jürgen", "Müller", "originale"),
+        ("Juergen", "Mueller", "traslitterazione"),
+        ("Müller", "Jürgen", "inversione"),
+        ("J.", "Muller", "iniziale"),
+    ]),
+])
+def test_generate_variants(nome, cognome, expected):
+    variants = generate_variants(nome, cognome)
+    assert _pairs(variants) == expected
+    keys = [v["chiave"] for v in variants]
+    assert len(keys) == len(set(keys))
+    weights = [v["peso"] for v in variants]
+    assert weights == sorted(weights, reverse=True)
+    assert all(v["peso"] == VARIANT_WEIGHTS[v["tipo"]] for v in variants)
+
+
+@pytest.mark.parametrize("varianti, expected", [
+    # Elementi null, numerici o con nome/cognome non stringa non diventano cognomi come "None" o "5"
+    ([None, 5, 3.5, True, []], []),
+    ([{"nome": 3, "cognome": "Bianchi"}], [("", "Bianchi")]),
+    ([{"nome": "Marco", "cognome": None}], []),
+    ([{"nome": "  Marco ", "cognome": " Bianchi "}], [("Marco", "Bianchi")]),
+    (["Gian Marco Bianchi", "Bianchi", "   "], [("Gian Marco", "Bianchi"), ("", "Bianchi")]),
+    # Stessa chiave normalizzata dell'originale o di un'altra variante fornita
+    (["mario  ROSSI", {"nome": "Màrio", "cognome": "Rossi"}, "Marco Rossi", "marco rossi"], [("Marco", "Rossi")]),
+])
+def test_supplied_variants(varianti, expected):
+    variants = generate_variants("Mario", "Rossi", varianti)
+    assert variants[0]["tipo"] == "originale"
+    assert [(v["nome"], v["cognome"]) for v in variants if v["tipo"] == "fornita"] == expected
+    # Le varianti fornite vengono subito dopo l'originale
+    assert [v["tipo"] for v in variants[1:len(expected) + 1]] == ["fornita"] * len(expected)
+
+
+@pytest.mark.parametrize("max_variants", [1, 2, 4])
+def test_max_variants_keeps_heaviest(max_variants):
+    full = generate_variants("Ivan", "Šimić", max_variants=100)
+    assert generate_variants("Ivan", "Šimić", max_variants=max_variants) == full[:max_variants]
+
+
+def test_empty_name_yields_no_variants():
+    assert generate_variants(None, None) == []
+
+
+VARIANTS = [{"chiave": key} for key in ("originale", "v1", "v2", "v3")]
+
+
+@pytest.mark.parametrize("source_costs, budget, expected", [
+    # L'originale è assegnato a tutte le sorgenti anche oltre il budget
+    ({"sanzioni": 1, "dork": 3}, 0, {"sanzioni": ["originale"], "dork": ["originale"]}),
+    ({"sanzioni": 1, "dork": 3}, 4, {"sanzioni": ["originale"], "dork": ["originale"]}),
+    ({"sanzioni": 1, "dork": 3}, 8, {"sanzioni": ["originale", "v1"], "dork": ["originale", "v1"]}),
+    # Le varianti successive riempiono il budget residuo sulle sorgenti più economiche
+    ({"sanzioni": 1, "dork": 3}, 10, {"sanzioni": ["originale", "v1", "v2", "v3"], "dork": ["originale", "v1"]}),
+    ({"sanzioni": 1, "dork": 3}, 100, {"sanzioni": ["originale", "v1", "v2", "v3"],
+                                       "dork": ["originale", "v1", "v2", "v3"]}),
+    ({}, 10, {}),
+])
+def test_plan_queries_budget(source_costs, budget, expected):
+    plan = plan_queries(VARIANTS, source_costs, budget)
+    assert {source: [v["chiave"] for v in variants] for source, variants in plan.items()} == expected
+    spent = sum(source_costs[source] * len(variants) for source, variants in plan.items())
+    assert spent <= max(budget, sum(source_costs.values()))
@@ -0,0 +1,179 @@
+import os
+import csv
+import json
+import threading
+import pytest
+import receiver
+import reports
+from storage import get_connection, save_results_bulk, link_results_to_report, iter_report_results
+
+# Report: collegamento dei risultati tramite report_results, lettura a pagine, file generati,
+# interruzione allo spegnimento ed endpoint /reports.
+
+
+@pytest.fixture
+def results(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(reports, "REPORTS_DIR", str(tmp_path / "reports"))
+    rows = [
+        ("Mario Rossi", "sanzioni", "sanctions_network", "A", {"id": "OFAC-1"}),
+        ("Anna Bianchi", "web", "google_dorks", "C", {"url_found": "https://a.it"}),
+        ("Mario Rossi", "web", "google_dorks", "B", {"url_found": "https://b.it"}),
+        ("Luigi Verdi", "web", "google_dorks", "A", {"url_found": "https://c.it"}),
+        ("Mario Rossi", "web", "google_dorks", "C", {"url_found": "https://d.it"}),
+    ]
+    save_results_bulk(rows)
+    return rows
+
+
+def _subjects_and_ids(items):
+    return [(item["target_subject_name"], item["id"]) for item in items]
+
+
+def test_link_results_to_report(results):
+    assert link_results_to_report(1, ["Mario Rossi", "Anna Bianchi"], chunk_size=2) == 4
+    assert link_results_to_report(2, ["Mario Rossi"], reliability_scores=["A", "B"]) == 2
+    assert link_results_to_report(3, ["Nessuno"]) == 0
+    # Ricollegare non duplica le righe
+    assert link_results_to_report(1, ["Mario Rossi"]) == 0
+
+    # Per soggetto, poi in ordine di salvataggio; ogni report vede solo le proprie righe
+    assert _subjects_and_ids(iter_report_results(1, page_size=1)) == [
+        ("Anna Bianchi", 2), ("Mario Rossi", 1), ("Mario Rossi", 3), ("Mario Rossi", 5)]
+    assert [item["content"] for item in iter_report_results(2)] == [{"id": "OFAC-1"}, {"url_found": "https://b.it"}]
+    assert all("content" not in item and item["payload_hash"] for item in iter_report_results(1, with_content=False))
+    # La tabella results non viene modificata
+    assert get_connection().execute("SELECT COUNT(*) FROM results WHERE report_id IS NOT NULL").fetchone()[0] == 0
+
+
+def test_results_saved_after_start_are_not_linked(results):
+    report_id = reports.create_report(["Mario Rossi"])
+    assert reports.generate_report(report_id) == reports.REPORT_COMPLETATO
+    save_results_bulk([("Mario Rossi", "web", "google_dorks", "A", {"url_found": "https://e.it"})])
+    assert len(list(iter_report_results(report_id))) == 3
+
+
+def test_generate_json_report(results):
+    report_id = reports.create_report(["Mario Rossi", "Anna Bianchi"], "json", reliability_scores=["A", "C"])
+    assert reports.generate_report(report_id) == reports.REPORT_COMPLETATO
+    report = reports.get_report(report_id)
+    assert (report["rows_total"], report["rows_written"], report["progress"]) == (3, 3, 1.0)
+    with open(report["output_path"], encoding="utf-8") as f:
+        document = json.load(f)
+    assert document["report"]["report_id"] == report_id
+    assert [(s["subject"], [r["id"] for r in s["results"]]) for s in document["subjects"]] == [
+        ("Anna Bianchi", [2]), ("Mario Rossi", [1, 5])]
+
+
+def test_generate_csv_and_html_reports(results):
+    csv_id = reports.create_report(["Mario Rossi"], "csv")
+    html_id = reports.create_report(["Mario Rossi", "Luigi Verdi"], "html")
+    reports.generate_report(csv_id)
+    reports.generate_report(html_id)
+
+    with open(reports.get_report(csv_id)["output_path"], encoding="utf-8", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [row["id"] for row in rows] == ["1", "3", "5"]
+    assert json.loads(rows[0]["content"]) == {"id": "OFAC-1"}
+    with open(reports.get_report(html_id)["output_path"], encoding="utf-8") as f:
+        page = f.read()
+    assert page.index("<h2>Luigi Verdi</h2>") < page.index("<h2>Mario Rossi</h2>")
+    assert page.count("<tr><td>") == 4
+
+
+@pytest.mark.parametrize("subjects, fmt, extra", [
+    ([], "json", {}),
+    (["  "], "json", {}),
+    (["Mario Rossi"], "xml", {}),
+    (["Mario Rossi"], "json", {"since": "ieri"}),
+])
+def test_create_report_rejects_invalid_parameters(db, subjects, fmt, extra):
+    with pytest.raises(ValueError):
+        reports.create_report(subjects, fmt, **extra)
+
+
+def test_pdf_requires_weasyprint(db, monkeypatch):
+    monkeypatch.setattr(reports, "weasyprint", None)
+    with pytest.raises(ValueError, match="weasyprint"):
+        reports.create_report(["Mario Rossi"], "pdf")
+
+
+def test_stop_reports_fails_running_and_queued_reports(results, monkeypatch):
+    monkeypatch.setattr(reports, "REPORT_MAX_WORKERS", 1)
+    monkeypatch.setattr(reports, "REPORT_PROGRESS_ROWS", 1)
+    started, release = threading.Event(), threading.Event()
+    original = reports._write_json
+
+    def slow_write(out, report, items):
+        started.set()
+        release.wait(5)
+        original(out, report, items)
+
+    monkeypatch.setattr(reports, "_write_json", slow_write)
+    running = reports.create_report(["Mario Rossi"])
+    queued = reports.create_report(["Anna Bianchi"])
+    reports.submit_report(running)
+    reports.submit_report(queued)
+    assert started.wait(5)
+    threading.Timer(0.2, release.set).start()
+    reports.stop_reports()
+
+    assert reports.get_report(running)["status"] == reports.REPORT_ERRORE
+    assert "spegnimento" in reports.get_report(running)["error"]
+    assert reports.get_report(queued)["status"] == reports.REPORT_ERRORE
+    assert reports.get_report(queued)["error"] == "Annullato dallo spegnimento del server"
+    leftovers = os.listdir(reports.REPORTS_DIR) if os.path.isdir(reports.REPORTS_DIR) else []
+    assert not any(name.endswith(".tmp") for name in leftovers)
+
+
+def test_recover_interrupted_reports(results):
+    queued = reports.create_report(["Mario Rossi"])
+    done = reports.create_report(["Mario Rossi"])
+    reports.generate_report(done)
+    assert reports.recover_interrupted_reports() == 1
+    assert reports.get_report(queued)["status"] == reports.REPORT_ERRORE
+    assert reports.get_report(done)["status"] == reports.REPORT_COMPLETATO
+
+
+@pytest.fixture
+def client(results):
+    yield receiver.app.test_client()
+    reports.stop_reports()
+
+
+def _wait_report(client, report_id):
+    for _ in range(100):
+        report = client.get(f"/reports/{report_id}").get_json()
+        if report["status"] in (reports.REPORT_COMPLETATO, reports.REPORT_ERRORE):
+            return report
+        threading.Event().wait(0.05)
+    raise AssertionError(f"Report {report_id} non terminato")
+
+
+def test_report_endpoints(client):
+    response = client.post("/reports", json={"subjects": ["Mario Rossi"], "format": "csv", "reliability": ["a", "b"]})
+    assert response.status_code == 202
+    report_id = response.get_json()["report_id"]
+    assert response.get_json()["status_url"].endswith(f"/reports/{report_id}")
+
+    report = _wait_report(client, report_id)
+    assert report["status"] == reports.REPORT_COMPLETATO and report["rows_total"] == 2
+    assert report["download_url"].endswith(f"/reports/{report_id}/download")
+    download = client.get(f"/reports/{report_id}/download")
+    assert download.status_code == 200 and download.mimetype == "text/csv"
+    assert download.get_data(as_text=True).count("\n") == 3
+
+    assert client.get("/reports/999").status_code == 404
+    assert client.get("/reports/999/download").status_code == 404
+
+
+def test_report_download_before_completion(client):
+    report_id = reports.create_report(["Mario Rossi"])
+    response = client.get(f"/reports/{report_id}/download")
+    assert response.status_code == 409
+    assert reports.REPORT_IN_CODA in response.get_json()["message"]
+
+
+@pytest.mark.parametrize("body", [{"subjects": "Mario Rossi"}, {"subjects": []}, {"subjects": ["Mario Rossi"], "format": "xml"}])
+def test_report_endpoint_rejects_invalid_body(client, body):
+    assert client.post("/reports", json=body).status_code == 400
+    assert get_connection().execute("SELECT COUNT(*) FROM reports").fetchone()[0] == 0
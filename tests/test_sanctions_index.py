@@ -0,0 +1,112 @@
+import csv
+import json
+import sqlite3
+import pytest
+from modules import sanctions_index
+from modules.sanctions_index import blocking_keys, ingest, index_available, match_name, normalize_record, similarity
+
+# Indice locale delle sanzioni: similarità, chiavi di blocking, conversione dei record, import e ricerca.
+
+
+@pytest.mark.parametrize("query, candidate, low, high", [
+    ("mario rossi", "mario rossi", 1.0, 1.0),
+    ("mario rossi", "rossi mario", 1.0, 1.0),  # Ordine dei token indifferente
+    ("mario rossi", "mario rosi", 0.85, 0.95),
+    ("ivan petrov", "ivan petroff", 0.75, 0.95),
+    ("mario rossi", "anna bianchi", 0.0, 0.3),
+    ("", "mario rossi", 0.0, 0.0),
+    ("mario rossi", "   ", 0.0, 0.0),
+])
+def test_similarity(query, candidate, low, high):
+    assert low <= similarity(query, candidate) <= high
+    assert similarity(query, candidate) == similarity(candidate, query)
+
+
+@pytest.mark.parametrize("name_norm, expected", [
+    ("mario de-rossi", {"t:mario", "p:mari", "s:ario", "t:de", "t:rossi", "p:ross", "s:ossi"}),
+    ("li wu", {"t:li", "t:wu"}),
+    ("anna", {"t:anna"}),  # Token di BLOCK_AFFIX_LEN caratteri: nessun prefisso o suffisso
+    ("", set()),
+])
+def test_blocking_keys(name_norm, expected):
+    assert blocking_keys(name_norm) == expected
+
+
+@pytest.mark.parametrize("raw, expected", [
+    # CSV di OpenSanctions: caption, schema, campi multi-valore separati da ';'
+    ({"id": "os-1", "caption": "Ivan Petrov", "aliases": "Ivan Petroff; I. Petrov", "schema": "Person",
+      "datasets": "eu_fsf;us_ofac", "birth_date": "1970-01-01;1971", "countries": "ru", "sanctions": "EU"},
+     {"id": "os-1", "names": ["Ivan Petrov"], "aliases": ["Ivan Petroff", "I. Petrov"], "type": "individual",
+      "source": "eu_fsf", "birth_date": "1970-01-01", "nationality": "ru", "summary": "EU", "position": None}),
+    # JSON di Sanctions.network: liste e id numerico
+    ({"id": 5, "names": ["Acme Ltd", ""], "type": "Entity", "source": ["ofac"]},
+     {"id": "5", "names": ["Acme Ltd"], "aliases": [], "type": "entity", "source": "ofac", "birth_date": None,
+      "nationality": None, "summary": None, "position": None}),
+])
+def test_normalize_record(raw, expected):
+    assert normalize_record(raw) == expected
+
+
+@pytest.mark.parametrize("raw", [{"names": ["Mario Rossi"]}, {"id": "1", "names": []}, {"id": "1", "name": " ; "}, {"id": ""}])
+def test_normalize_record_without_id_or_names(raw):
+    assert normalize_record(raw) is None
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    """Indice costruito da un export CSV e uno JSONL, con un id ripetuto nello stesso file e tra i file."""
+    monkeypatch.setattr(sanctions_index, "SANCTIONS_INDEX_PATH", str(tmp_path / "sanctions_index.db"))
+    csv_path = tmp_path / "export.csv"
+    with open(csv_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["id", "caption", "aliases", "schema", "datasets"])
+        writer.writeheader()
+        writer.writerow({"id": "os-1", "caption": "Ivan Petrov", "aliases": "Ivan Petroff", "schema": "Person", "datasets": "eu"})
+        writer.writerow({"id": "os-2", "caption": "Mario Rossi", "aliases": "", "schema": "Person", "datasets": "un"})
+        writer.writerow({"id": "os-2", "caption": "Mario Rossini", "aliases": "", "schema": "Person", "datasets": "un"})
+        writer.writerow({"id": "", "caption": "Senza Id", "aliases": "", "schema": "Person", "datasets": "un"})
+    jsonl_path = tmp_path / "export.jsonl"
+    jsonl_path.write_text("\n".join(json.dumps(r) for r in [
+        {"id": "os-1", "names": ["Ivan Petrov"], "aliases": ["Иван Петров"], "type": "individual", "source": "ofac"},
+        {"id": "sn-9", "names": ["Acme Trading Ltd"], "type": "entity"},
+    ]) + "\n", encoding="utf-8")
+    yield [str(csv_path), str(jsonl_path)]
+    sanctions_index.close_readers()
+
+
+def test_ingest_counts_each_record_once(index):
+    assert ingest(index) == (3, 4, 1)
+    # Il record ripetuto vale nella sua ultima versione
+    assert [record["names"] for record, _, _ in match_name("Mario Rossini")] == [["Mario Rossini"]]
+    assert match_name("Ivan Petrov")[0][0]["source"] == "ofac"
+
+
+def test_ingest_counts_across_chunks(index, monkeypatch):
+    monkeypatch.setattr(sanctions_index, "INGEST_CHUNK_SIZE", 1)
+    assert ingest(index, reset=True)[0] == 3
+
+
+def test_match_name(index):
+    ingest(index)
+    matches = match_name("Petrov Ivan")
+    assert [(record["id"], score, name) for record, score, name in matches][:1] == [("os-1", 1.0, "Ivan Petrov")]
+    assert len({record["id"] for record, _, _ in matches}) == len(matches)  # Una riga per entità
+    assert match_name("Иван Петров")[0][2] == "Иван Петров"  # Trovata tramite alias
+    assert match_name("Zzyzx Qwerty") == []
+    assert match_name("") == []
+
+
+def test_lookups_reuse_a_read_only_connection(index):
+    ingest(index)
+    assert index_available()
+    conn = sanctions_index._reader()
+    match_name("Mario Rossini")
+    assert sanctions_index._reader() is conn
+    with pytest.raises(sqlite3.OperationalError, match="readonly"):
+        conn.execute("DELETE FROM entities")
+    # Un nuovo import è visibile alla connessione già aperta
+    ingest(index, reset=True)
+    assert match_name("Mario Rossini")[0][0]["id"] == "os-2"
+
+
+def test_index_not_available(tmp_path):
+    assert index_available(str(tmp_path / "assente.db")) is False
@@ -0,0 +1,114 @@
+import pytest
+from modules import scoring
+from modules.scoring import DEFAULT_RULES, canonicalize_url, domain_reliability, match_reliability, process_rows
+
+# Post-elaborazione delle righe dei moduli: forma canonica degli URL, unione dei duplicati e affidabilità.
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("HTTPS://www.Example.com:443/a/?utm_source=x&b=2&a=1#top", "https://example.com/a?a=1&b=2"),
+    ("http://example.com:80/", "http://example.com"),
+    ("http://example.com:8080/a", "http://example.com:8080/a"),
+    ("https://example.com./a?gclid=1&fbclid=2&utm_medium=3", "https://example.com/a"),
+    ("https://example.com/a?q=&x=1", "https://example.com/a?q=&x=1"),
+    ("  https://example.com:notaport/a  ", "https://example.com:notaport/a"),
+])
+def test_canonicalize_url(url, expected):
+    assert canonicalize_url(url, DEFAULT_RULES) == expected
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("https://www.gazzettaufficiale.it/atto", "A"),
+    ("https://home.treasury.gov/ofac", "A"),
+    ("https://it.wikipedia.org/wiki/Mario", "B"),
+    ("https://notwikipedia.org/x", "C"),
+    ("https://blog.example.com/x", "C"),
+])
+def test_domain_reliability(url, expected):
+    assert domain_reliability(url, DEFAULT_RULES) == expected
+
+
+@pytest.mark.parametrize("item, expected", [
+    ({"match": True, "score": 0.95}, "A"),
+    ({"match": True, "score": 0.8}, "B"),  # Le soglie sono esclusive
+    ({"match": True, "score": 0.6}, "B"),
+    ({"match": True, "score": 0.5}, "C"),
+    ({"match": True}, "C"),
+    ({"match": False, "score": 0.99}, "C"),
+])
+def test_match_reliability(item, expected):
+    assert match_reliability(item, DEFAULT_RULES) == expected
+
+
+def _url_row(url, dork, variante=None, source="google_dorks"):
+    content = {"url_found": url, "dork_query": dork}
+    if variante:
+        content["variante"] = variante
+    return "web", source, None, content
+
+
+def test_same_canonical_url_is_merged():
+    rows = [
+        _url_row("https://www.example.com/a?utm_source=x", "dork 1"),
+        _url_row("http://example.com/a/", "dork 2", source="altra_fonte"),
+        _url_row("https://example.com/a", "dork 1"),
+        _url_row("https://example.com/b", "dork 1"),
+    ]
+    processed = process_rows(rows, DEFAULT_RULES)
+    assert len(processed) == 2
+    category, source_api, reliability, content = processed[0]
+    assert (category, source_api, reliability) == ("web", "google_dorks", "C")
+    assert content["url_canonical"] == "https://example.com/a"
+    assert content["url_found"] == "https://www.example.com/a?utm_source=x"  # Resta il primo URL trovato
+    assert content["dork_queries"] == ["dork 1", "dork 2"]
+    assert content["fonti"] == ["google_dorks", "altra_fonte"]
+    assert processed[1][3]["url_canonical"] == "https://example.com/b"
+    # Le righe in ingresso non vengono modificate
+    assert "fonti" not in rows[0][3]
+
+
+def _match_row(entry_id, score, variante):
+    return "sanzioni", "sanctions_network", "C", {"id": entry_id, "match": True, "score": score, "variante": variante}
+
+
+def test_duplicate_ids_keep_highest_score_and_its_variant():
+    processed = process_rows([
+        _match_row("OFAC-1", 0.6, "Mario Rossi"),
+        _match_row("OFAC-1", 0.9, "Rossi Mario"),
+        _match_row("OFAC-1", 0.7, "M. Rossi"),
+        _match_row("OFAC-2", 0.4, "Mario Rossi"),
+    ], DEFAULT_RULES)
+
+    assert [row[2] for row in processed] == ["A", "C"]
+    merged = processed[0][3]
+    assert merged["score"] == 0.9
+    assert merged["variante"] == "Rossi Mario"
+    assert merged["varianti_corrispondenti"] == ["Mario Rossi", "M. Rossi"]
+    assert merged["fonti"] == ["sanctions_network"]
+    assert "dork_queries" not in merged
+    # Stesso id in categorie diverse: righe distinte
+    assert len(process_rows([_match_row("X", 0.9, "a"), ("altro", "fonte", "B", {"id": "X"})], DEFAULT_RULES)) == 2
+
+
+def test_rows_without_url_or_id_merge_by_content():
+    processed = process_rows([
+        ("note", "m1", "B", {"testo": "uguale"}),
+        ("note", "m2", "B", {"testo": "uguale"}),
+        ("note", "m1", None, "testo semplice"),
+        ("note", "m1", None, "testo semplice"),
+    ], DEFAULT_RULES)
+    assert [(row[1], row[2], row[3]) for row in processed] == [
+        ("m1", "B", {"testo": "uguale", "fonti": ["m1", "m2"]}),
+        ("m1", "C", "testo semplice"),
+    ]
+
+
+def test_rules_file_overrides_defaults(tmp_path, monkeypatch):
+    path = tmp_path / "regole.json"
+    path.write_text('{"url_default": "B", "domain_reputation": {"example.com": "A"}}', encoding="utf-8")
+    monkeypatch.setattr(scoring, "SCORING_RULES_PATH", str(path))
+    monkeypatch.setattr(scoring, "_rules", None)
+    rules = scoring.get_rules()
+    assert rules["match_thresholds"] == DEFAULT_RULES["match_thresholds"]
+    assert [row[2] for row in process_rows([_url_row("https://example.com/", "d"), _url_row("https://altro.org/", "d")])] == ["A", "B"]
+    monkeypatch.setattr(scoring, "_rules", None)
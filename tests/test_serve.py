@@ -0,0 +1,49 @@
+import os
+import signal
+import pytest
+import receiver
+import serve
+
+# Gestione di SIGTERM nei worker gunicorn (serve.py): il drenaggio deve iniziare alla ricezione del segnale.
+
+
+class _Worker:
+    """Sostituto del worker gunicorn: registra le chiamate a handle_exit."""
+
+    def __init__(self):
+        self.exits = []
+
+    def handle_exit(self, sig, frame):
+        self.exits.append(sig)
+
+
+@pytest.fixture
+def worker(monkeypatch):
+    previous = signal.getsignal(signal.SIGTERM)
+    monkeypatch.setattr(receiver, "start_background_services", lambda: None)
+    worker = _Worker()
+    # Come Worker.init_signals(), eseguito da gunicorn prima di post_worker_init
+    signal.signal(signal.SIGTERM, worker.handle_exit)
+    yield worker
+    signal.signal(signal.SIGTERM, previous)
+    receiver._draining.clear()
+
+
+def test_sigterm_starts_draining(worker):
+    serve.post_worker_init(worker)
+    assert signal.getsignal(signal.SIGTERM) != worker.handle_exit
+
+    os.kill(os.getpid(), signal.SIGTERM)
+    assert receiver._draining.is_set()
+    assert worker.exits == [signal.SIGTERM]
+
+
+def test_ready_reports_draining(worker, db, monkeypatch):
+    monkeypatch.setattr(receiver, "workers_running", lambda: True)
+    client = receiver.app.test_client()
+    assert client.get("/ready").status_code == 200
+    serve.post_worker_init(worker)
+    os.kill(os.getpid(), signal.SIGTERM)
+    response = client.get("/ready")
+    assert response.status_code == 503
+    assert response.get_json()["draining"] is True
@@ -0,0 +1,80 @@
+import os
+import time
+import shutil
+import sqlite3
+import pytest
+import storage
+
+# Persistenza su un database temporaneo: risposte per Idempotency-Key e migrazioni dello schema.
+
+
+def _count(table):
+    return storage.get_connection().execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def test_idempotent_response_is_not_stored_in_payloads(db):
+    body = {"status": "successo", "aggregated_results": {"m1": {"raw_response": "x" * 2000}}}
+    storage.save_idempotent_response("chiave-1", "hash-1", 200, body, max_age=60)
+    assert _count("payloads") == 0
+    assert storage.get_idempotent_response("chiave-1", 60) == ("hash-1", 200, body)
+
+
+def test_expired_idempotency_keys_take_their_response_with_them(db):
+    storage.save_idempotent_response("vecchia", "hash-1", 200, {"n": 1}, max_age=60)
+    with storage.transaction() as conn:
+        conn.execute("UPDATE idempotency_keys SET created_at = ?", (time.time() - 120,))
+    assert storage.get_idempotent_response("vecchia", 60) is None
+
+    storage.save_idempotent_response("nuova", "hash-2", 200, {"n": 2}, max_age=60)
+    keys = [row[0] for row in storage.get_connection().execute("SELECT idempotency_key FROM idempotency_keys")]
+    assert keys == ["nuova"]
+    assert _count("payloads") == 0
+
+
+# Migrazioni dello schema: aggiornamento del database di partenza del repository e atomicità di ogni versione.
+
+BASELINE_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "osint_agi.db")
+
+
+def _user_version():
+    return storage.get_connection().execute("PRAGMA user_version").fetchone()[0]
+
+
+def _columns(table):
+    return {row[1] for row in storage.get_connection().execute(f"PRAGMA table_info({table})")}
+
+
+def test_baseline_database_is_upgraded(tmp_path, monkeypatch):
+    path = tmp_path / "osint_agi.db"
+    shutil.copyfile(BASELINE_DB, path)
+    monkeypatch.setattr(storage, "DATABASE_NAME", str(path))
+    try:
+        storage.init_db()
+        assert _user_version() == storage.MIGRATIONS[-1][0]
+        assert storage.schema_is_current()
+        assert {"payload_hash", "content_json"} <= _columns("results")
+        assert {"response_codec", "response_data"} <= _columns("idempotency_keys")
+        # Le righe precedenti ai payload restano leggibili da content_json
+        subject = storage.get_connection().execute("SELECT target_subject_name FROM results LIMIT 1").fetchone()[0]
+        rows = list(storage.iter_results(subject))
+        assert rows and all(row["content"] is not None for row in rows)
+        storage.init_db()  # Rieseguire l'inizializzazione non cambia nulla
+        assert _user_version() == storage.MIGRATIONS[-1][0]
+    finally:
+        storage.close_connection()
+
+
+def test_failed_migration_is_rolled_back(db, monkeypatch):
+    version = storage.MIGRATIONS[-1][0]
+    broken = (version + 1, ["ALTER TABLE results ADD COLUMN extra TEXT", "SELECT * FROM tabella_inesistente"])
+    monkeypatch.setattr(storage, "MIGRATIONS", storage.MIGRATIONS + [broken])
+    with pytest.raises(sqlite3.OperationalError):
+        storage.init_db()
+    assert _user_version() == version
+    assert "extra" not in _columns("results")
+
+    fixed = (version + 1, ["ALTER TABLE results ADD COLUMN extra TEXT"])
+    monkeypatch.setattr(storage, "MIGRATIONS", storage.MIGRATIONS[:-1] + [fixed])
+    storage.init_db()
+    assert _user_version() == version + 1
+    assert "extra" in _columns("results")
@@ -0,0 +1,224 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import receiver
+import watchlist
+from modules import cache, http_client
+from modules.async_runtime import run_sync
+from storage import get_connection, transaction
+
+# Watchlist: rilevamento delle variazioni tra due verifiche, scheduler, endpoint e richieste condizionali
+# (ETag / Last-Modified) usate dalle ri-verifiche.
+
+
+class _Screen:
+    """screen_subject sostituito: restituisce le righe impostate nel test e registra se la cache era ignorata."""
+
+    def __init__(self):
+        self.items = []
+        self.summary = {"m1": {"status": "successo"}}
+        self.bypassed = []
+
+    def __call__(self, nome, cognome, varianti=None):
+        self.bypassed.append(cache._bypass.get())
+        subject = f"{nome} {cognome}"
+        return self.summary, [(subject, category, "test", "B", content) for category, content in self.items]
+
+
+@pytest.fixture
+def screen(db):
+    return _Screen()
+
+
+def _changes(watch_id):
+    return sorted((c["change_type"], c["item_key"]) for c in watchlist.iter_changes(watch_id))
+
+
+def _url(url, dork="dork 1", **extra):
+    return "web", {"url_found": url, "url_canonical": url.replace("www.", ""), "dork_query": dork, **extra}
+
+
+def test_rescreen_detects_changes(screen):
+    entry = watchlist.register("Mario", "Rossi")
+    screen.items = [("sanzioni", {"id": "OFAC-1", "programma": "SDN"}), _url("https://www.example.com/a")]
+    outcome = watchlist.rescreen(entry, screen)
+    assert outcome["baseline"] is True and outcome["elementi"] == 2
+    assert _changes(entry["id"]) == []  # La baseline non registra variazioni
+    assert screen.bypassed == [True]
+
+    # Stessi elementi trovati da un altro dork, con un'altra variante e un altro URL grezzo: nessuna variazione
+    entry = watchlist.get_entry(entry["id"])
+    screen.items = [("sanzioni", {"id": "OFAC-1", "programma": "SDN", "variante": "Rossi Mario"}),
+                    _url("https://example.com/a", dork="dork 2", fonti=["altra"])]
+    outcome = watchlist.rescreen(entry, screen)
+    assert (outcome["baseline"], outcome["nuovo"], outcome["modificato"], outcome["rimosso"]) == (False, 0, 0, 0)
+
+    screen.items = [("sanzioni", {"id": "OFAC-1", "programma": "EU"}), ("sanzioni", {"id": "OFAC-2"})]
+    outcome = watchlist.rescreen(entry, screen)
+    assert (outcome["nuovo"], outcome["modificato"], outcome["rimosso"]) == (1, 1, 1)
+    assert _changes(entry["id"]) == [
+        ("modificato", "sanzioni:id:OFAC-1"),
+        ("nuovo", "sanzioni:id:OFAC-2"),
+        ("rimosso", "web:url:https://example.com/a"),
+    ]
+    changes = {c["item_key"]: c for c in watchlist.iter_changes(entry["id"])}
+    assert changes["sanzioni:id:OFAC-1"]["content"]["programma"] == "EU"
+    assert changes["web:url:https://example.com/a"]["content"] is None
+
+    # Un elemento rimosso che ricompare è di nuovo "nuovo"
+    screen.items.append(_url("https://example.com/a"))
+    assert watchlist.rescreen(entry, screen)["nuovo"] == 1
+    # Nei risultati finiscono la baseline e i soli elementi nuovi o modificati
+    assert get_connection().execute("SELECT COUNT(*) FROM results").fetchone()[0] == 5
+
+
+def test_no_removals_when_a_source_failed(screen):
+    entry = watchlist.register("Mario", "Rossi")
+    screen.items = [("sanzioni", {"id": "OFAC-1"}), _url("https://example.com/a")]
+    watchlist.rescreen(entry, screen)
+
+    entry = watchlist.get_entry(entry["id"])
+    screen.items = [("sanzioni", {"id": "OFAC-1"})]
+    screen.summary = {"m1": {"status": "successo", "google_dorks": {"status": "errore", "count": 0}}}
+    outcome = watchlist.rescreen(entry, screen)
+    assert outcome["status"] == "errore" and outcome["rimosso"] == 0
+    assert watchlist.get_entry(entry["id"])["last_status"] == "errore"
+
+
+@pytest.mark.parametrize("data_category, content, expected", [
+    ("sanzioni", {"id": "X-1", "url_found": "https://a"}, "sanzioni:id:X-1"),
+    ("web", {"url_found": "https://www.a.it/x", "url_canonical": "https://a.it/x"}, "web:url:https://a.it/x"),
+    ("web", {"url_found": "https://a.it/x"}, "web:url:https://a.it/x"),
+])
+def test_item_key(data_category, content, expected):
+    assert watchlist.item_key(data_category, content) == expected
+
+
+def test_item_key_falls_back_to_content_hash():
+    assert watchlist.item_key("note", {"b": 1, "a": 2}) == watchlist.item_key("note", {"a": 2, "b": 1})
+    assert watchlist.item_key("note", {"a": 1}) != watchlist.item_key("note", {"a": 2})
+
+
+def test_register_is_idempotent_and_reactivates(screen):
+    first = watchlist.register("Mario", "Rossi", interval_s=3600)
+    assert watchlist.deactivate(first["id"])
+    again = watchlist.register("mario", "ROSSI")
+    assert again["id"] == first["id"] and again["active"] and again["interval_s"] == 3600
+    assert watchlist.deactivate(999) is False
+
+
+def test_run_due_claims_each_entry_once(screen):
+    entry = watchlist.register("Mario", "Rossi", interval_s=3600)
+    assert watchlist.run_due(screen) == []
+    with transaction() as conn:
+        conn.execute("UPDATE watchlist SET next_run_at = ? WHERE id = ?", (time.time() - 1, entry["id"]))
+    outcomes = watchlist.run_due(screen)
+    assert [o["watch_id"] for o in outcomes] == [entry["id"]]
+    assert watchlist.run_due(screen) == []
+    next_run = watchlist.get_entry(entry["id"])["next_run_at"] - time.time()
+    assert 3600 * (1 - watchlist.WATCHLIST_JITTER) - 5 <= next_run <= 3600 * (1 + watchlist.WATCHLIST_JITTER)
+
+
+@pytest.fixture
+def client(screen, monkeypatch):
+    monkeypatch.setattr(receiver, "start_background_services", lambda: None)
+    return receiver.app.test_client()
+
+
+def test_watchlist_endpoints(client, screen):
+    response = client.post("/watchlist", json={"nome": "Mario", "cognome": "Rossi", "interval_hours": 2,
+                                               "varianti": ["Mario Rossini"]})
+    assert response.status_code == 201
+    entry = response.get_json()["entry"]
+    assert entry["interval_s"] == 7200 and entry["varianti"] == ["Mario Rossini"]
+    client.post("/watchlist", json={"nome": "Anna", "cognome": "Bianchi"})
+
+    page = client.get("/watchlist?limit=1").get_json()
+    assert [e["nome"] for e in page["items"]] == ["Mario"]
+    assert [e["nome"] for e in client.get(f"/watchlist?cursor={page['next_cursor']}").get_json()["items"]] == ["Anna"]
+
+    watchlist.rescreen(watchlist.get_entry(entry["id"]), screen)
+    screen.items = [("sanzioni", {"id": "OFAC-1"})]
+    watchlist.rescreen(watchlist.get_entry(entry["id"]), screen)
+    changes = client.get(f"/watchlist/{entry['id']}/changes?content=ref").get_json()["items"]
+    assert [(c["change_type"], c["item_key"]) for c in changes] == [("nuovo", "sanzioni:id:OFAC-1")]
+    assert "content" not in changes[0] and changes[0]["payload_hash"]
+
+    assert client.delete(f"/watchlist/{entry['id']}").status_code == 200
+    assert [e["nome"] for e in client.get("/watchlist").get_json()["items"]] == ["Anna"]
+    assert len(client.get("/watchlist?all=1").get_json()["items"]) == 2
+    assert client.delete("/watchlist/999").status_code == 404
+    assert client.get("/watchlist/999/changes").status_code == 404
+
+
+@pytest.mark.parametrize("body", [
+    {"nome": "Mario"},
+    {"nome": "Mario", "cognome": "Rossi", "varianti": "Mario Rossini"},
+    {"nome": "Mario", "cognome": "Rossi", "interval_hours": "spesso"},
+])
+def test_watchlist_rejects_invalid_body(client, body):
+    assert client.post("/watchlist", json=body).status_code == 400
+
+
+@pytest.fixture
+def conditional_server():
+    """Sorgente con ETag: risponde 304 se If-None-Match corrisponde alla versione corrente."""
+    state = {"version": "v1", "requests": []}
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            state["requests"].append(self.headers.get("If-None-Match"))
+            etag = f'"{state["version"]}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            body = json.dumps({"versione": state["version"]}).encode()
+            self.send_response(200)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/elenco", state
+    server.shutdown()
+    server.server_close()
+    with http_client._validators_lock:
+        http_client._validators.clear()
+
+
+def _sync_get(url, **kwargs):
+    return http_client.request_with_retry("GET", url, timeout=5, **kwargs)
+
+
+def _async_get(url, **kwargs):
+    return run_sync(http_client.async_request_with_retry("GET", url, timeout=5, **kwargs))
+
+
+@pytest.mark.parametrize("get", [_sync_get, _async_get], ids=["sync", "async"])
+def test_conditional_requests_reuse_validators(conditional_server, get):
+    url, state = conditional_server
+    first = get(url, conditional=True, params={"q": "rossi"})
+    assert first.json() == {"versione": "v1"} and first.not_modified is False
+
+    second = get(url, conditional=True, params={"q": "rossi"})
+    assert second.status_code == 200 and second.not_modified is True
+    assert second.json() == {"versione": "v1"}
+
+    state["version"] = "v2"
+    third = get(url, conditional=True, params={"q": "rossi"})
+    assert third.json() == {"versione": "v2"} and third.not_modified is False
+
+    # Parametri diversi e richieste non condizionali non inviano validatori
+    get(url, conditional=True, params={"q": "bianchi"})
+    get(url, params={"q": "rossi"})
+    assert state["requests"] == [None, '"v1"', '"v1"', None, None]
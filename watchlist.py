@@ -0,0 +1,377 @@
+import os
+import json
+import time
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from modules.normalization import normalize_name
+from modules.cache import bypass_cache
+from storage import (get_connection, transaction, log_audit_event, content_hash, encode_payload, decode_payload,
+                     PAYLOAD_INSERT_SQL, RESULT_INSERT_SQL)
+from telemetry import counter, gauge, trace
+
+# Watchlist: soggetti registrati vengono ri-verificati periodicamente da uno scheduler in background.
+# A ogni verifica i risultati sono confrontati, per hash del contenuto, con lo stato noto del soggetto
+# (watchlist_items): vengono salvati solo gli elementi nuovi o modificati e le variazioni
+# (nuovo, modificato, rimosso) sono registrate in watchlist_changes, nell'audit e, se configurato,
+# notificate a WATCHLIST_WEBHOOK_URL. Il carico è distribuito nel tempo: la prima verifica è sparsa su
+# WATCHLIST_INITIAL_SPREAD secondi, le successive hanno un jitter sull'intervallo e ogni ciclo dello
+# scheduler elabora al massimo WATCHLIST_MAX_PER_TICK soggetti.
+
+WATCHLIST_INTERVAL = int(float(os.getenv("WATCHLIST_INTERVAL_HOURS", "24")) * 3600)  # Intervallo predefinito tra due verifiche
+WATCHLIST_INITIAL_SPREAD = int(os.getenv("WATCHLIST_INITIAL_SPREAD", "3600"))
+WATCHLIST_JITTER = 0.1  # Variazione casuale (±10%) dell'intervallo, per non riallineare le verifiche
+WATCHLIST_TICK = float(os.getenv("WATCHLIST_TICK", "30"))  # Secondi tra due cicli dello scheduler
+WATCHLIST_MAX_PER_TICK = int(os.getenv("WATCHLIST_MAX_PER_TICK", "10"))
+WATCHLIST_CONCURRENCY = int(os.getenv("WATCHLIST_CONCURRENCY", "2"))
+WATCHLIST_WEBHOOK_URL = os.getenv("WATCHLIST_WEBHOOK_URL")
+WEBHOOK_TIMEOUT = 10
+
+# Campi che cambiano senza che cambi l'elemento (variante del nome, dork o sorgenti che l'hanno trovato): esclusi dall'hash
+VOLATILE_FIELDS = ("variante", "variante_tipo", "varianti_corrispondenti", "dork_query", "dork_queries", "fonti", "url_canonical")
+
+# Tipi di variazione
+CHANGE_NEW = "nuovo"
+CHANGE_MODIFIED = "modificato"
+CHANGE_REMOVED = "rimosso"
+
+logger = logging.getLogger(__name__)
+
+WATCHLIST_RUNS = counter("osint_watchlist_runs_total", "Verifiche della watchlist per esito", ("status",))
+WATCHLIST_CHANGES = counter("osint_watchlist_changes_total", "Variazioni rilevate dalla watchlist per tipo", ("change_type",))
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+_stop_event = threading.Event()
+
+
+def _next_run(now, interval):
+    return now + interval * random.uniform(1 - WATCHLIST_JITTER, 1 + WATCHLIST_JITTER)
+
+
+def _row_to_entry(row):
+    return {
+        "id": row[0],
+        "nome": row[1],
+        "cognome": row[2],
+        "subject_key": row[3],
+        "varianti": json.loads(row[4]) if row[4] else None,
+        "interval_s": row[5],
+        "next_run_at": row[6],
+        "last_run_at": row[7],
+        "last_status": row[8],
+        "active": bool(row[9]),
+    }
+
+
+ENTRY_COLUMNS = "id, nome, cognome, subject_key, varianti_json, interval_s, next_run_at, last_run_at, last_status, active"
+
+
+def register(nome, cognome, varianti=None, interval_s=None):
+    """
+    Aggiunge un soggetto alla watchlist (o riattiva quello con lo stesso nome normalizzato).
+    Restituisce la voce della watchlist.
+    """
+    interval_given = interval_s is not None
+    interval_s = int(interval_s or WATCHLIST_INTERVAL)
+    subject_key = normalize_name(nome, cognome)
+    now = time.time()
+    first_run = now + random.uniform(0, min(interval_s, WATCHLIST_INITIAL_SPREAD))
+    with transaction() as conn:
+        conn.execute('''
+            INSERT INTO watchlist (nome, cognome, subject_key, varianti_json, interval_s, next_run_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(subject_key) DO UPDATE SET
+                varianti_json = excluded.varianti_json, active = 1,
+                interval_s = CASE WHEN ? THEN excluded.interval_s ELSE watchlist.interval_s END,
+                next_run_at = CASE WHEN watchlist.active THEN watchlist.next_run_at ELSE excluded.next_run_at END
+        ''', (nome, cognome, subject_key, json.dumps(varianti) if varianti else None, interval_s, first_run, interval_given))
+    entry = get_entry_by_key(subject_key)
+    log_audit_event(
+        event_type="WATCHLIST_REGISTRATO",
+        source_module="watchlist.py",
+        target_subject_name=f"{nome} {cognome}".strip(),
+        query_details={"watch_id": entry["id"], "interval_s": entry["interval_s"], "varianti": varianti},
+        result_summary="Soggetto aggiunto alla watchlist"
+    )
+    return entry
+
+
+def get_entry(watch_id):
+    row = get_connection().execute(f"SELECT {ENTRY_COLUMNS} FROM watchlist WHERE id = ?", (watch_id,)).fetchone()
+    return _row_to_entry(row) if row else None
+
+
+def get_entry_by_key(subject_key):
+    row = get_connection().execute(f"SELECT {ENTRY_COLUMNS} FROM watchlist WHERE subject_key = ?", (subject_key,)).fetchone()
+    return _row_to_entry(row) if row else None
+
+
+def iter_entries(include_inactive=False, after_id=None, limit=100):
+    """Voci della watchlist in ordine di id, paginate con 'after_id'."""
+    clauses = [] if include_inactive else ["active = 1"]
+    params = []
+    if after_id is not None:
+        clauses.append("id > ?")
+        params.append(after_id)
+    params.append(limit)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    cursor = get_connection().execute(f"SELECT {ENTRY_COLUMNS} FROM watchlist {where} ORDER BY id LIMIT ?", params)
+    for row in cursor:
+        yield _row_to_entry(row)
+
+
+def deactivate(watch_id):
+    """Sospende le verifiche di un soggetto (lo storico delle variazioni resta). Restituisce False se non esiste."""
+    with transaction() as conn:
+        updated = conn.execute("UPDATE watchlist SET active = 0 WHERE id = ?", (watch_id,)).rowcount
+    return updated > 0
+
+
+def iter_changes(watch_id, before_id=None, limit=100, with_content=True):
+    """Variazioni di un soggetto dalla più recente, paginate per id come storage.iter_results."""
+    params = [watch_id]
+    extra = ""
+    if before_id is not None:
+        extra = "AND c.id < ?"
+        params.append(before_id)
+    params.append(limit)
+    cursor = get_connection().execute(f'''
+        SELECT c.id, c.detected_at, c.change_type, c.data_category, c.item_key, c.payload_hash, p.codec, p.data
+        FROM watchlist_changes c LEFT JOIN payloads p ON p.hash = c.payload_hash
+        WHERE c.watch_id = ? {extra} ORDER BY c.id DESC LIMIT ?
+    ''', params)
+    for row in cursor:
+        change = {
+            "id": row[0],
+            "detected_at": row[1],
+            "change_type": row[2],
+            "data_category": row[3],
+            "item_key": row[4],
+            "payload_hash": row[5],
+        }
+        if with_content:
+            change["content"] = decode_payload(row[6], row[7]) if row[6] is not None else None
+        yield change
+
+
+def item_key(data_category, content):
+    """
+    Identità stabile di un elemento tra due verifiche: id della voce sanzioni, URL (nella forma canonica
+    usata dalla deduplicazione di modules/scoring.py) o hash del contenuto.
+    """
+    if isinstance(content, dict):
+        if content.get("id"):
+            return f"{data_category}:id:{content['id']}"
+        if content.get("url_found"):
+            return f"{data_category}:url:{content.get('url_canonical') or content['url_found']}"
+    return f"{data_category}:hash:{content_hash(content)}"
+
+
+def _stable_hash(content):
+    if isinstance(content, dict):
+        # Con la forma canonica, l'URL grezzo dipende da quale duplicato è arrivato per primo
+        volatile = VOLATILE_FIELDS + (("url_found",) if content.get("url_canonical") else ())
+        content = {key: value for key, value in content.items() if key not in volatile}
+    return content_hash(content)
+
+
+def _had_errors(summary):
+    """True se un modulo o una sorgente della verifica è fallito: in tal caso non si deducono rimozioni."""
+    for module_summary in summary.values():
+        if not isinstance(module_summary, dict):
+            continue
+        if module_summary.get("status") == "errore":
+            return True
+        if any(isinstance(value, dict) and value.get("status") == "errore" for value in module_summary.values()):
+            return True
+    return False
+
+
+def rescreen(entry, screen_subject):
+    """
+    Verifica un soggetto della watchlist e salva le sole variazioni rispetto allo stato noto.
+    'screen_subject(nome, cognome, varianti=...)' restituisce (riepilogo, righe) come receiver.screen_subject.
+    La prima verifica (baseline) salva tutti i risultati senza registrare variazioni.
+    La cache delle sorgenti non viene letta: con intervalli più brevi del suo TTL si confronterebbero
+    risposte memorizzate invece di dati aggiornati.
+    """
+    subject = f"{entry['nome']} {entry['cognome']}".strip()
+    with trace("watchlist_rescreen", subject=subject), bypass_cache():
+        summary, rows = screen_subject(entry["nome"], entry["cognome"], varianti=entry["varianti"])
+
+    # Elementi correnti: per chiavi ripetute (es. stesso URL da più dork) si tiene quello con l'hash minore
+    current = {}
+    for row in rows:
+        _, data_category, _, _, content = row
+        key = item_key(data_category, content)
+        digest = _stable_hash(content)
+        if key not in current or digest < current[key][1]:
+            current[key] = (row, digest)
+
+    known = {
+        key: (digest, present) for key, digest, present in get_connection().execute(
+            "SELECT item_key, content_hash, present FROM watchlist_items WHERE watch_id = ?", (entry["id"],)
+        )
+    }
+    baseline = entry["last_run_at"] is None
+    changes = []
+    for key, (row, digest) in current.items():
+        if key not in known or not known[key][1]:
+            changes.append((CHANGE_NEW, key, row, digest))
+        elif known[key][0] != digest:
+            changes.append((CHANGE_MODIFIED, key, row, digest))
+    removals_allowed = not _had_errors(summary)
+    if removals_allowed:
+        for key, (digest, present) in known.items():
+            if present and key not in current:
+                changes.append((CHANGE_REMOVED, key, None, digest))
+
+    now = time.time()
+    status = "errore" if not removals_allowed else "successo"
+    with transaction() as conn:
+        for change_type, key, row, digest in changes:
+            payload_hash = None
+            if row is not None:
+                payload = encode_payload(row[4])
+                payload_hash = payload[0]
+                conn.execute(PAYLOAD_INSERT_SQL, payload)
+                # Nei risultati finiscono solo gli elementi nuovi o modificati, non l'intera verifica
+                conn.execute(RESULT_INSERT_SQL, (*row[:4], payload_hash))
+            if not baseline:
+                data_category = row[1] if row is not None else key.split(":", 1)[0]
+                conn.execute('''
+                    INSERT INTO watchlist_changes (watch_id, change_type, data_category, item_key, payload_hash)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (entry["id"], change_type, data_category, key, payload_hash))
+            if change_type == CHANGE_REMOVED:
+                conn.execute("UPDATE watchlist_items SET present = 0 WHERE watch_id = ? AND item_key = ?", (entry["id"], key))
+        conn.executemany('''
+            INSERT INTO watchlist_items (watch_id, item_key, data_category, content_hash, present, first_seen, last_seen)
+            VALUES (?, ?, ?, ?, 1, ?, ?)
+            ON CONFLICT(watch_id, item_key) DO UPDATE SET
+                content_hash = excluded.content_hash, present = 1, last_seen = excluded.last_seen
+        ''', [(entry["id"], key, row[1], digest, now, now) for key, (row, digest) in current.items()])
+        conn.execute("UPDATE watchlist SET last_run_at = ?, last_status = ? WHERE id = ?", (now, status, entry["id"]))
+
+    counts = {change_type: sum(1 for change in changes if change[0] == change_type)
+              for change_type in (CHANGE_NEW, CHANGE_MODIFIED, CHANGE_REMOVED)}
+    WATCHLIST_RUNS.inc(status="baseline" if baseline else status)
+    outcome = {"watch_id": entry["id"], "baseline": baseline, "status": status, "elementi": len(current), **counts}
+    if baseline:
+        log_audit_event(
+            event_type="WATCHLIST_BASELINE",
+            source_module="watchlist.py",
+            target_subject_name=subject,
+            result_summary=f"Prima verifica: {len(current)} elementi registrati"
+        )
+    elif changes:
+        for change_type, count in counts.items():
+            if count:
+                WATCHLIST_CHANGES.inc(count, change_type=change_type)
+        log_audit_event(
+            event_type="WATCHLIST_VARIAZIONI",
+            source_module="watchlist.py",
+            target_subject_name=subject,
+            query_details={"watch_id": entry["id"]},
+            result_summary=f"Nuovi: {counts[CHANGE_NEW]} | Modificati: {counts[CHANGE_MODIFIED]} | Rimossi: {counts[CHANGE_REMOVED]}"
+        )
+        _notify(entry, changes)
+    return outcome
+
+
+def _notify(entry, changes):
+    """Invia le variazioni a WATCHLIST_WEBHOOK_URL (es. uno scenario Make.com), se configurato."""
+    if not WATCHLIST_WEBHOOK_URL:
+        return
+    body = {
+        "watch_id": entry["id"],
+        "nome": entry["nome"],
+        "cognome": entry["cognome"],
+        "changes": [
+            {"change_type": change_type, "item_key": key, "data_category": row[1] if row else key.split(":", 1)[0],
+             "content": row[4] if row else None}
+            for change_type, key, row, _ in changes
+        ],
+    }
+    try:
+        requests.post(WATCHLIST_WEBHOOK_URL, json=body, timeout=WEBHOOK_TIMEOUT)
+    except requests.exceptions.RequestException as e:
+        logger.warning("Errore durante la notifica delle variazioni del soggetto %s: %s", entry["id"], e)
+
+
+def _claim_due(limit):
+    """
+    Seleziona le voci scadute e ne sposta subito la prossima verifica, così nessun altro ciclo le riprende.
+    La presa in carico è condizionata al next_run_at letto: con più processi ogni voce va a uno solo.
+    """
+    now = time.time()
+    rows = get_connection().execute(
+        f"SELECT {ENTRY_COLUMNS} FROM watchlist WHERE active = 1 AND next_run_at <= ? ORDER BY next_run_at LIMIT ?",
+        (now, limit)
+    ).fetchall()
+    claimed = []
+    with transaction() as conn:
+        for row in rows:
+            if conn.execute("UPDATE watchlist SET next_run_at = ? WHERE id = ? AND next_run_at = ?",
+                            (_next_run(now, row[5]), row[0], row[6])).rowcount:
+                claimed.append(_row_to_entry(row))
+    return claimed
+
+
+def run_due(screen_subject, limit=WATCHLIST_MAX_PER_TICK, executor=None):
+    """Esegue le verifiche scadute (al più 'limit'). Restituisce gli esiti."""
+    entries = _claim_due(limit)
+    if not entries:
+        return []
+
+    def run(entry):
+        try:
+            return rescreen(entry, screen_subject)
+        except Exception as e:
+            logger.exception("Errore durante la verifica del soggetto %s della watchlist", entry["id"])
+            WATCHLIST_RUNS.inc(status="errore")
+            return {"watch_id": entry["id"], "status": "errore", "message": str(e)}
+
+    if executor is None:
+        return [run(entry) for entry in entries]
+    return list(executor.map(run, entries))
+
+
+def _scheduler_loop(screen_subject):
+    with ThreadPoolExecutor(max_workers=WATCHLIST_CONCURRENCY, thread_name_prefix="watchlist") as executor:
+        while not _stop_event.is_set():
+            try:
+                outcomes = run_due(screen_subject, executor=executor)
+                if outcomes:
+                    logger.info("Watchlist: verificati %d soggetti", len(outcomes))
+            except Exception:
+                logger.exception("Errore nel ciclo dello scheduler della watchlist")
+            _stop_event.wait(WATCHLIST_TICK)
+
+
+def start_scheduler(screen_subject):
+    """Avvia lo scheduler della watchlist in un thread in background (idempotente)."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is not None:
+            return
+        _stop_event.clear()
+        _scheduler = threading.Thread(target=_scheduler_loop, args=(screen_subject,), name="watchlist-scheduler", daemon=True)
+        _scheduler.start()
+
+
+def stop_scheduler(timeout=None):
+    """Ferma lo scheduler al termine delle verifiche in corso."""
+    global _scheduler
+    with _scheduler_lock:
+        thread, _scheduler = _scheduler, None
+    if thread is not None:
+        _stop_event.set()
+        thread.join(timeout)
+
+
+gauge("osint_watchlist_due", "Soggetti della watchlist con verifica scaduta",
+      lambda: get_connection().execute("SELECT COUNT(*) FROM watchlist WHERE active = 1 AND next_run_at <= ?", (time.time(),)).fetchone()[0])